@@ -0,0 +1,371 @@
+import compiler
+import json
+import logging
+import messages
+import os
+import ot
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import util
+import yao
+import zmq
+
+SEED = 2024  # seed of synthetic circuits, inputs and choice bits
+MIN_TIME = 0.2  # seconds a measure repeats its function for, at least
+CIRCUITS = ("add", "cmp", "eq_32")  # circuit files of the suite
+SCHEMES = {  # garbling schemes of the suite
+    "classic": {"free_xor": False, "half_gates": False},
+    "free-xor": {"free_xor": True, "half_gates": False},
+    "half-gates": {"free_xor": True, "half_gates": True},
+}
+SYNTHETIC_SIZES = (10**3, 10**4, 10**5, 10**6)  # gates of synthetic circuits
+GATE_TYPE_SIZE = 10**4  # gates of the synthetic circuit of each gate type
+SYNTHETIC_INPUTS = 64  # input wires of synthetic circuits, half Alice's
+# OT configurations: (name, options of ObliviousTransfer, number of OTs)
+OT_CONFIGS = (
+    ("per-wire-x25519", {"group": "x25519"}, 64),
+    ("batched-x25519", {"group": "x25519", "batched": True}, 1024),
+    ("batched-modp", {"group": "modp", "batched": True}, 256),
+    ("extension", {"extension": True, "batched": True}, 16384),
+)
+OT_BATCHES = 5  # batches of each OT configuration, the first one sets up
+REGRESSION = 0.1  # relative loss of a rate reported as a regression
+# Fields identifying the results of each suite, to compare them
+RESULT_KEYS = {"garbling": ("circuit", "scheme"), "ot": ("config",),
+               "psi": ("mode", "size")}
+
+
+def synthetic_circuit(num_gates, gate_types=compiler.GATE_TYPES, seed=SEED):
+    """Return a random circuit spec.
+
+    Gates read two random wires among the last ones, hence the depth of the
+    circuit grows with its size, like arithmetic circuits.
+
+    Args:
+        num_gates: The number of gates.
+        gate_types: Optional; the names of the types of gates to draw from.
+        seed: Optional; the seed of the circuit.
+    """
+    rng = random.Random(seed)
+    window = 4 * SYNTHETIC_INPUTS  # gates read the last 'window' wires
+    inputs = list(range(1, SYNTHETIC_INPUTS + 1))
+    gates = []
+    for wire in range(SYNTHETIC_INPUTS + 1, SYNTHETIC_INPUTS + num_gates + 1):
+        low = max(1, wire - window)
+        gate_type = rng.choice(gate_types)
+        ins = [rng.randrange(low, wire)]
+        if gate_type != "NOT":
+            ins.append(rng.randrange(low, wire))
+        gates.append({"id": wire, "type": gate_type, "in": ins})
+    last = SYNTHETIC_INPUTS + num_gates
+    types = ("mixed" if tuple(gate_types) == compiler.GATE_TYPES
+             else "-".join(gate_types))
+    return {
+        "id": f"synthetic-{types}-{num_gates}",
+        "alice": inputs[:SYNTHETIC_INPUTS // 2],
+        "bob": inputs[SYNTHETIC_INPUTS // 2:],
+        "out": list(range(max(last - 31, SYNTHETIC_INPUTS + 1), last + 1)),
+        "gates": gates,
+    }
+
+
+def measure(function, min_time=MIN_TIME):
+    """Run a function until 'min_time' elapsed, at least once.
+
+    Returns:
+        A pair (seconds, value): the best time of a run and the value the
+        last run returned.
+    """
+    best = None
+    elapsed = 0
+    while elapsed < min_time:
+        start = time.perf_counter()
+        value = function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+        elapsed += seconds
+    return best, value
+
+
+def bench_circuit(spec, scheme, seed=SEED):
+    """Measure garbling and evaluation of a circuit.
+
+    Returns:
+        A dict of results, rates being in gates per second.
+    """
+    circuit = compiler.compile_circuit(spec)
+    num_gates = circuit.num_gates
+    garble_time, garbled = measure(
+        lambda: yao.GarbledCircuit(circuit, **SCHEMES[scheme]))
+
+    rng = random.Random(seed)
+    keys, pbits = garbled.get_keys(), garbled.get_pbits()
+    inputs = {}  # map from input wires to (key, encr_bit)
+    for w in circuit.original(circuit.alice) + circuit.original(circuit.bob):
+        bit = rng.getrandbits(1)
+        inputs[w] = (keys[w][bit], pbits[w] ^ bit)
+    outputs = circuit.original(circuit.out)
+    pbits_out = {w: pbits[w] for w in outputs}
+    evaluate_time, _ = measure(
+        lambda: yao.evaluate(circuit, garbled.get_garbled_tables(), pbits_out,
+                             inputs, {}, **garbled.get_scheme()))
+
+    return {
+        "circuit": circuit.id,
+        "scheme": scheme,
+        "gates": num_gates,
+        "table_bytes": len(garbled.get_garbled_tables()),
+        "garble_seconds": garble_time,
+        "garble_gates_per_second": num_gates / garble_time,
+        "evaluate_seconds": evaluate_time,
+        "evaluate_gates_per_second": num_gates / evaluate_time,
+    }
+
+
+def bench_garbling(max_gates=max(SYNTHETIC_SIZES), seed=SEED):
+    """Measure garbling and evaluation of the circuits of the suite.
+
+    Returns:
+        A list of results of bench_circuit.
+    """
+    specs = []
+    for name in CIRCUITS:
+        spec = util.parse_json(os.path.join("circuits", f"{name}.json"))
+        specs.extend((circuit, tuple(SCHEMES)) for circuit in spec["circuits"])
+    for gate_type in compiler.GATE_TYPES:
+        specs.append((synthetic_circuit(GATE_TYPE_SIZE, [gate_type], seed),
+                      tuple(SCHEMES)))
+    for size in SYNTHETIC_SIZES:
+        if size <= max_gates:
+            specs.append((synthetic_circuit(size, seed=seed), ("half-gates",)))
+
+    results = []
+    for spec, schemes in specs:
+        for scheme in schemes:
+            logging.info(f"Garbling {spec['id']} ({scheme})")
+            results.append(bench_circuit(spec, scheme, seed))
+    return results
+
+
+class _CountingSocket:
+    """Count the bytes a socket sends."""
+    bytes_sent = 0
+
+    def _send_parts(self, parts):
+        self.bytes_sent += sum(memoryview(part).nbytes for part in parts)
+        super()._send_parts(parts)
+
+
+class _CountingGarblerSocket(_CountingSocket, util.GarblerSocket):
+    pass
+
+
+class _CountingEvaluatorSocket(_CountingSocket, util.EvaluatorSocket):
+    pass
+
+
+def bench_ot(name, options, num_ots, batches=OT_BATCHES, seed=SEED):
+    """Measure OTs of labels between Alice and a Bob thread.
+
+    Each batch transfers one label of 'num_ots' pairs, with one protocol
+    run per OT, or all at once if batched (see ObliviousTransfer).
+
+    Returns:
+        A dict of results, of the first batch (setting up, e.g. the base OTs
+        of OT extension) and of the best following one.
+    """
+    bob_socket = _CountingEvaluatorSocket("tcp://127.0.0.1:*")
+    endpoint = bob_socket.socket.getsockopt_string(zmq.LAST_ENDPOINT)
+    alice_socket = _CountingGarblerSocket(endpoint)
+    alice = ot.ObliviousTransfer(alice_socket, **options)
+    bob = ot.ObliviousTransfer(bob_socket, **options)
+
+    rng = random.Random(seed)
+    pairs = {}  # map from IDs of OTs to pairs of (label, encr_bit)
+    for i in range(num_ots):
+        pbit = rng.getrandbits(1)
+        pairs[i] = ((os.urandom(yao.LABEL_SIZE), pbit),
+                    (os.urandom(yao.LABEL_SIZE), pbit ^ 1))
+    choices = {i: rng.getrandbits(1) for i in range(num_ots)}
+    wrong = []  # batches of Bob with wrong labels
+
+    def receive():
+        for _ in range(batches):
+            if bob.batched:
+                labels = bob.receive_inputs(bob_socket.receive(), choices)
+                bob_socket.send(True)
+            else:
+                labels = {}
+                for i, bit in choices.items():
+                    labels[i] = yao.unpack_input(
+                        messages.run(bob.ot_evaluator(bit), bob_socket))
+                    bob_socket.send(True)
+            wrong.append(any(labels[i] != pairs[i][b]
+                             for i, b in choices.items()))
+
+    thread = threading.Thread(target=receive, daemon=True)
+    thread.start()
+    timings = []  # (seconds, bytes) of each batch
+    for _ in range(batches):
+        sent = alice_socket.bytes_sent + bob_socket.bytes_sent
+        start = time.perf_counter()
+        if alice.batched:
+            alice.get_result({}, pairs, {})
+        else:
+            for i in range(num_ots):
+                pair = (yao.pack_input(*pairs[i][0]),
+                        yao.pack_input(*pairs[i][1]))
+                messages.run(alice.ot_garbler(pair), alice_socket)
+                alice_socket.receive()
+        timings.append((time.perf_counter() - start,
+                        alice_socket.bytes_sent + bob_socket.bytes_sent
+                        - sent))
+    thread.join()
+    alice_socket.socket.close()
+    bob_socket.socket.close()
+    if any(wrong):
+        raise ValueError(f"OT {name} transferred wrong labels")
+
+    def summary(batch_timings):  # the best time of the batches, see measure
+        seconds = min(t for t, _ in batch_timings)
+        size = sum(b for _, b in batch_timings) / len(batch_timings)
+        return {
+            "seconds": seconds,
+            "ots_per_second": num_ots / seconds,
+            "bytes_per_ot": size / num_ots,
+        }
+
+    first_seconds, first_bytes = timings[0]
+    return {
+        "config": name,
+        "options": options,
+        "ots": num_ots,
+        "batches": batches,
+        "first": {"seconds": first_seconds,
+                  "bytes_per_ot": first_bytes / num_ots},
+        "steady": summary(timings[1:]) if batches > 1 else None,
+    }
+
+
+def bench_ots(scale=1, seed=SEED):
+    """Measure the OT configurations of the suite.
+
+    Args:
+        scale: Optional; the factor of the number of OTs of each batch.
+    """
+    results = []
+    for name, options, num_ots in OT_CONFIGS:
+        logging.info(f"OT {name}")
+        results.append(bench_ot(name, options, max(1, int(num_ots * scale)),
+                                seed=seed))
+    return results
+
+
+def metadata(seed=SEED):
+    """Return the context of results, to compare commits."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"],
+                                capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": seed,
+    }
+
+
+def _rates(result, prefix=""):
+    """Yield the (name, value) of the rates of a result, nested or not."""
+    for name, value in result.items():
+        if isinstance(value, dict):
+            yield from _rates(value, f"{prefix}{name}.")
+        elif name.endswith("_per_second"):
+            yield prefix + name, value
+
+
+def compare(old, new, threshold=REGRESSION):
+    """Compare the rates of two results of the suites.
+
+    Args:
+        old: The results of the reference, e.g. the last release.
+        new: The results to check.
+        threshold: Optional; the relative loss of a rate reported as a
+            regression.
+
+    Returns:
+        A pair (lines, regressions): the lines of a report of all rates
+        in both results and the number of regressions.
+    """
+    lines = [f"{old['meta']['commit']} -> {new['meta']['commit']}"]
+    regressions = 0
+    for suite, keys in RESULT_KEYS.items():
+        reference = {tuple(r[k] for k in keys): r
+                     for r in old.get(suite, [])}
+        for result in new.get(suite, []):
+            key = tuple(result[k] for k in keys)
+            if key not in reference:
+                continue
+            old_rates = dict(_rates(reference[key]))
+            for name, value in _rates(result):
+                if not old_rates.get(name):
+                    continue
+                ratio = value / old_rates[name]
+                regression = ratio < 1 - threshold
+                regressions += regression
+                lines.append(f"{'REGRESSION ' if regression else ''}{suite} "
+                             f"{' '.join(map(str, key))} {name}: "
+                             f"{old_rates[name]:.1f} -> {value:.1f} "
+                             f"({ratio - 1:+.1%})")
+    return lines, regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark garbling, evaluation and OTs.")
+    parser.add_argument("-o", "--output", metavar="results.json",
+                        help="write the JSON results to this file instead of "
+                             "the standard output")
+    parser.add_argument("--quick", action="store_true",
+                        help="synthetic circuits of at most 10^4 gates and "
+                             "10 times less OTs")
+    parser.add_argument("--suite", choices=["all", "garbling", "ot"],
+                        default="all", help="the benchmarks to run")
+    parser.add_argument("--seed", type=int, default=SEED,
+                        help=f"the seed of circuits and inputs ({SEED})")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two JSON results instead, failing on "
+                             f"rates {REGRESSION:.0%}% lower in NEW")
+    args = parser.parse_args()
+    logging.basicConfig(format="[%(levelname)s] %(message)s",
+                        level=logging.INFO)
+
+    if args.compare:
+        old, new = (util.parse_json(path) for path in args.compare)
+        lines, regressions = compare(old, new)
+        print("\n".join(lines))
+        sys.exit(1 if regressions else 0)
+
+    results = {"meta": metadata(args.seed)}
+    if args.suite in ("all", "garbling"):
+        results["garbling"] = bench_garbling(
+            10**4 if args.quick else max(SYNTHETIC_SIZES), args.seed)
+    if args.suite in ("all", "ot"):
+        results["ot"] = bench_ots(0.1 if args.quick else 1, args.seed)
+
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
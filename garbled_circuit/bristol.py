@@ -0,0 +1,90 @@
+import os
+
+# Gates of Bristol Fashion netlists and their gate type
+GATE_TYPES = {"XOR": "XOR", "AND": "AND", "INV": "NOT", "MAND": "AND"}
+
+
+def parse_bristol(path):
+    """Parse a Bristol Fashion netlist into a circuit file dict.
+
+    The first input value of the netlist is Alice's and the other ones are
+    Bob's; the outputs are the last wires, in order. Wires keep their
+    numbers, EQW gates are resolved into the wire they copy and EQ gates
+    (constants) are XOR or XNOR gates of the first input with itself.
+
+    Args:
+        path: The path of the netlist, e.g. a published AES or SHA-256
+            circuit.
+
+    Returns:
+        A dict with the 'name' of the file and one circuit in 'circuits', as
+        returned by util.parse_json for a JSON circuit file.
+    """
+    with open(path) as netlist_file:
+        lines = netlist_file.read().splitlines()
+
+    num_gates, num_wires = map(int, lines[0].split())
+    input_sizes = [int(n) for n in lines[1].split()[1:]]
+    output_sizes = [int(n) for n in lines[2].split()[1:]]
+    num_inputs = sum(input_sizes)
+    if not num_inputs:
+        raise ValueError(f"Netlist '{path}' has no input")
+
+    gates = []
+    copies = {}  # map from the output of EQW gates to the wire they copy
+    count = 0  # number of gates of the netlist
+    for line in lines[3:]:
+        tokens = line.split()
+        if not tokens:
+            continue
+        count += 1
+        num_in, num_out = int(tokens[0]), int(tokens[1])
+        ins = tokens[2:2 + num_in]
+        outs = [int(w) for w in tokens[2 + num_in:2 + num_in + num_out]]
+        gate_type = tokens[-1]
+
+        if gate_type == "EQW":
+            copies[outs[0]] = copies.get(int(ins[0]), int(ins[0]))
+        elif gate_type == "EQ":
+            gate_type = "XNOR" if int(ins[0]) else "XOR"
+            gates.append({"id": outs[0], "type": gate_type, "in": [0, 0]})
+        elif gate_type in GATE_TYPES:
+            ins = [copies.get(int(w), int(w)) for w in ins]
+            # MAND gates are several AND gates, inputs a then b
+            for k, out in enumerate(outs):
+                gates.append({"id": out, "type": GATE_TYPES[gate_type],
+                              "in": ins[k::num_out]})
+        else:
+            raise ValueError(f"Unknown gate '{gate_type}' in '{path}'")
+
+    if count != num_gates:
+        raise ValueError(f"Netlist '{path}' declares {num_gates} gates, "
+                         f"found {count}")
+
+    outputs = range(num_wires - sum(output_sizes), num_wires)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return {
+        "name": name,
+        "circuits": [{
+            "id": name,
+            "alice": list(range(input_sizes[0])),
+            "bob": list(range(input_sizes[0], num_inputs)),
+            "out": [copies.get(w, w) for w in outputs],
+            "gates": gates,
+        }],
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        description="Convert a Bristol Fashion netlist to a JSON circuit.")
+    parser.add_argument("netlist", help="the Bristol Fashion netlist")
+    parser.add_argument("output", metavar="circuit.json",
+                        help="the JSON circuit file to write")
+    args = parser.parse_args()
+
+    with open(args.output, "w") as json_file:
+        json.dump(parse_bristol(args.netlist), json_file, indent=2)
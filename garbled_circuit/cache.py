@@ -0,0 +1,78 @@
+import bristol
+import compiler
+import hashlib
+import logging
+import mmap
+import optimizer
+import os
+import util
+
+CACHE_DIR = "cache"  # default directory of compiled circuits
+SUFFIX = ".gcc"  # suffix of packed circuit files
+
+
+def parse_circuits(path):
+    """Parse a circuit file, JSON or Bristol Fashion (any other suffix).
+
+    Returns:
+        A dict with the 'name' of the file and its 'circuits' specs.
+    """
+    if path.endswith(".json"):
+        return util.parse_json(path)
+    return bristol.parse_bristol(path)
+
+
+def load_circuits(path, directory=CACHE_DIR, optimize=False):
+    """Load the compiled circuits of a file, through a cache.
+
+    Circuits are compiled once and packed in a file of the cache directory
+    named after the SHA-256 digest of the circuit file, which later loads
+    memory-map instead of parsing the circuit file again. Packed files are
+    published atomically, hence the cache may be shared by processes.
+
+    Args:
+        path: The circuit file, JSON or Bristol Fashion.
+        directory: Optional; the cache directory (CACHE_DIR by default), or
+            None to always parse the circuit file.
+        optimize: Optional; optimize circuits before compiling them, see
+            optimizer.optimize (False by default). The statistics of the
+            optimization are printed when circuits are not in the cache.
+
+    Returns:
+        A pair (name, circuits), 'circuits' being a list of CompiledCircuit.
+    """
+    cache_path = None
+    if directory is not None:
+        with open(path, "rb") as circuit_file:
+            digest = hashlib.sha256(circuit_file.read()).hexdigest()
+        variant = "-optimized" if optimize else ""
+        cache_path = os.path.join(directory, digest + variant + SUFFIX)
+        try:
+            with open(cache_path, "rb") as packed_file:
+                buffer = mmap.mmap(packed_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            with buffer:
+                name, circuits = compiler.unpack_circuits(buffer)
+            logging.info(f"Loaded {path} from {cache_path}")
+            return name, circuits
+        except FileNotFoundError:
+            pass
+
+    spec = parse_circuits(path)
+    circuits = []
+    for circuit in spec["circuits"]:
+        if optimize:
+            optimized = optimizer.optimize(circuit)
+            print(optimizer.format_stats(circuit["id"],
+                                         optimizer.gate_stats(circuit),
+                                         optimizer.gate_stats(optimized)))
+            circuit = optimized
+        circuits.append(compiler.compile_circuit(circuit))
+
+    if cache_path is not None:
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as packed_file:
+            packed_file.write(compiler.pack_circuits(spec["name"], circuits))
+        os.replace(temp_path, cache_path)  # publish the packed circuits
+    return spec["name"], circuits
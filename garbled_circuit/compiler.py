@@ -0,0 +1,224 @@
+import heapq
+import struct
+from array import array
+from typing import NamedTuple
+
+# Gate types, linear gates (free with Free-XOR) first
+GATE_TYPES = ("NOT", "XOR", "XNOR", "AND", "OR", "NAND", "NOR")
+NOT, XOR, XNOR, AND, OR, NAND, NOR = range(len(GATE_TYPES))
+GATE_CODES = {name: code for code, name in enumerate(GATE_TYPES)}
+
+# Packed circuits: a header, the name, then each circuit (see pack_circuits)
+PACK_MAGIC = b"GCC1"
+PACK_HEADER = struct.Struct("<4sII")  # magic, name length, number of circuits
+CIRCUIT_HEADER = struct.Struct("<6I")  # ID length, num_inputs, array lengths
+PACKED_ARRAYS = ("alice", "bob", "out", "gate_types", "gate_in_a",
+                 "gate_in_b", "gate_ids", "wire_ids")
+
+
+class CompiledCircuit(NamedTuple):
+    """An immutable representation of a circuit.
+
+    Wires are numbered densely: Alice's inputs first, then Bob's inputs and
+    any other input wire, then one wire per gate output. Gates are sorted in
+    topological order and gate k writes wire 'num_inputs + k'.
+
+    Attributes:
+        id: The circuit ID.
+        num_inputs: The number of input wires.
+        alice: Alice's input wires.
+        bob: Bob's input wires.
+        out: The output wires.
+        gate_types: The type of each gate (see GATE_TYPES).
+        gate_in_a: The first input wire of each gate.
+        gate_in_b: The second input wire of each gate, -1 for NOT gates.
+        gate_ids: The original ID of each gate.
+        wire_ids: The original ID of each wire.
+    """
+    id: str
+    num_inputs: int
+    alice: array
+    bob: array
+    out: array
+    gate_types: array
+    gate_in_a: array
+    gate_in_b: array
+    gate_ids: array
+    wire_ids: array
+
+    @property
+    def num_gates(self):
+        return len(self.gate_types)
+
+    @property
+    def num_wires(self):
+        return self.num_inputs + len(self.gate_types)
+
+    def original(self, wires):
+        """Return the original IDs of a list of wires."""
+        return [self.wire_ids[w] for w in wires]
+
+
+def topological_order(gates):
+    """Sort gates in topological order.
+
+    Among the gates ready to be evaluated, the one with the smallest ID comes
+    first, hence gates already sorted by ID keep their order.
+
+    Args:
+        gates: A list of dicts containing gate spec.
+
+    Returns:
+        The list of gates in topological order.
+    """
+    producers = {gate["id"]: gate for gate in gates}
+    consumers = {}  # map from wire ID to the gates it feeds
+    missing = {}  # map from gate ID to its number of inputs not yet computed
+    ready = []  # heap of gate IDs whose inputs are all computed
+
+    for gate in gates:
+        pending = {w for w in gate["in"] if w in producers}
+        missing[gate["id"]] = len(pending)
+        for w in pending:
+            consumers.setdefault(w, []).append(gate)
+        if not pending:
+            heapq.heappush(ready, gate["id"])
+
+    order = []
+    while ready:
+        gate = producers[heapq.heappop(ready)]
+        order.append(gate)
+        for consumer in consumers.get(gate["id"], []):
+            missing[consumer["id"]] -= 1
+            if missing[consumer["id"]] == 0:
+                heapq.heappush(ready, consumer["id"])
+
+    if len(order) != len(gates):
+        raise ValueError("The circuit has a cycle")
+    return order
+
+
+def last_uses(circuit):
+    """Return the position of the last gate reading each wire.
+
+    Output wires are read after all gates, at position 'num_gates', and
+    wires no gate reads get -1.
+
+    Args:
+        circuit: A CompiledCircuit.
+
+    Returns:
+        An array mapping each (dense) wire to a gate position.
+    """
+    last_use = array("i", [-1]) * circuit.num_wires
+    for k, (in_a, in_b) in enumerate(zip(circuit.gate_in_a,
+                                         circuit.gate_in_b)):
+        last_use[in_a] = k
+        if in_b >= 0:
+            last_use[in_b] = k
+    for w in circuit.out:
+        last_use[w] = circuit.num_gates
+    return last_use
+
+
+def compile_circuit(circuit):
+    """Compile a circuit spec into a CompiledCircuit.
+
+    Args:
+        circuit: A dict containing circuit spec.
+
+    Returns:
+        The compiled circuit.
+    """
+    gates = circuit["gates"]
+    a_wires = circuit.get("alice", [])
+    b_wires = circuit.get("bob", [])
+    outputs = {gate["id"] for gate in gates}
+    if len(outputs) != len(gates):
+        raise ValueError(f"Circuit '{circuit['id']}' has duplicate gate IDs")
+
+    # Input wires: Alice's, Bob's then any other wire no gate computes
+    wire_ids = list(a_wires) + list(b_wires)
+    declared = set(wire_ids)
+    for w in sorted({w for gate in gates for w in gate["in"]}):
+        if w not in outputs and w not in declared:
+            wire_ids.append(w)
+    num_inputs = len(wire_ids)
+
+    order = topological_order(gates)
+    wire_ids.extend(gate["id"] for gate in order)
+    index = {w: i for i, w in enumerate(wire_ids)}
+
+    return CompiledCircuit(
+        id=circuit["id"],
+        num_inputs=num_inputs,
+        alice=array("i", range(len(a_wires))),
+        bob=array("i", range(len(a_wires), len(a_wires) + len(b_wires))),
+        out=array("i", (index[w] for w in circuit["out"])),
+        gate_types=array("B", (GATE_CODES[gate["type"]] for gate in order)),
+        gate_in_a=array("i", (index[gate["in"][0]] for gate in order)),
+        gate_in_b=array("i", (index[gate["in"][1]] if len(gate["in"]) > 1
+                              else -1 for gate in order)),
+        gate_ids=array("q", (gate["id"] for gate in order)),
+        wire_ids=array("q", wire_ids),
+    )
+
+
+def pack_circuits(name, circuits):
+    """Pack compiled circuits into bytes, see unpack_circuits.
+
+    Arrays are written in native byte order, packed circuits being a local
+    cache rather than an exchange format.
+
+    Args:
+        name: The name of the circuit file.
+        circuits: A list of CompiledCircuit.
+    """
+    name = name.encode()
+    parts = [PACK_HEADER.pack(PACK_MAGIC, len(name), len(circuits)), name]
+    for circuit in circuits:
+        circuit_id = circuit.id.encode()
+        parts.append(CIRCUIT_HEADER.pack(
+            len(circuit_id), circuit.num_inputs, len(circuit.alice),
+            len(circuit.bob), len(circuit.out), circuit.num_gates))
+        parts.append(circuit_id)
+        parts += [getattr(circuit, field).tobytes() for field in PACKED_ARRAYS]
+    return b"".join(parts)
+
+
+def unpack_circuits(buffer):
+    """Unpack circuits packed by pack_circuits.
+
+    Args:
+        buffer: A bytes-like object, e.g. a memory-mapped file.
+
+    Returns:
+        A pair (name, circuits), 'circuits' being a list of CompiledCircuit.
+    """
+    view = memoryview(buffer)
+    magic, name_length, num_circuits = PACK_HEADER.unpack_from(view)
+    if magic != PACK_MAGIC:
+        raise ValueError("Not a packed circuit file")
+    offset = PACK_HEADER.size
+    name = bytes(view[offset:offset + name_length]).decode()
+    offset += name_length
+
+    circuits = []
+    for _ in range(num_circuits):
+        (id_length, num_inputs, num_alice, num_bob, num_out,
+         num_gates) = CIRCUIT_HEADER.unpack_from(view, offset)
+        offset += CIRCUIT_HEADER.size
+        circuit_id = bytes(view[offset:offset + id_length]).decode()
+        offset += id_length
+
+        arrays = []
+        lengths = (num_alice, num_bob, num_out, num_gates, num_gates,
+                   num_gates, num_gates, num_inputs + num_gates)
+        for typecode, length in zip("iiiBiiqq", lengths):
+            values = array(typecode)
+            end = offset + length * values.itemsize
+            values.frombytes(view[offset:end])
+            arrays.append(values)
+            offset = end
+        circuits.append(CompiledCircuit(circuit_id, num_inputs, *arrays))
+    return name, circuits
@@ -1,30 +1,95 @@
 #!/usr/bin/env python3
+import asyncio
+import atexit
+import cache
+import functools
 import logging
+import messages
+import numpy as np
+import os
 import ot
+import parallel
+import pool
+import server
+import simulator
+import stats
+import stream
 import util
 import yao
 from abc import ABC, abstractmethod
 import sys
+import threading
+
+VERIFY_SAMPLES = 64  # assignments garbled and evaluated by verify mode
+VERIFY_BATCH = 64  # assignments of half-gates circuits evaluated at once
+MAX_MISMATCHES = 10  # mismatches printed by verify mode
+
 
 class YaoGarbler(ABC):
-    """An abstract class for Yao garblers (e.g. Alice)."""
+    """An abstract class for Yao garblers (e.g. Alice).
 
-    def __init__(self, circuits):
-        circuits = util.parse_json(circuits)
-        self.name = circuits["name"]
+    Circuits are loaded through the cache of compiled circuits (see
+    cache.load_circuits) and optimized first if 'optimize', then taken from
+    the pool of pre-garbled instances if any, and garbled otherwise, on
+    'workers' processes if more than one (see parallel.ParallelGarbler).
+    Streamed circuits are only garbled when sent. Seeded circuits keep a
+    secret seed instead of their keys (see yao.GarbledCircuit).
+    """
+
+    def __init__(self, circuits, free_xor=False, half_gates=False,
+                 backend="aes", pool=None, streaming=False, optimize=False,
+                 cache_dir=cache.CACHE_DIR, workers=1, seeded=False):
+        self.name, compiled_circuits = cache.load_circuits(
+            circuits, directory=cache_dir, optimize=optimize)
         self.circuits = []
 
-        for circuit in circuits["circuits"]:
-            garbled_circuit = yao.GarbledCircuit(circuit)
-            pbits = garbled_circuit.get_pbits()
-            entry = {
-                "circuit": circuit,
-                "garbled_circuit": garbled_circuit,
-                "garbled_tables": garbled_circuit.get_garbled_tables(),
-                "keys": garbled_circuit.get_keys(),
-                "pbits": pbits,
-                "pbits_out": {w: pbits[w] for w in circuit["out"]},
+        instances = [pool.take(index) if pool else None
+                     for index in range(len(compiled_circuits))]
+        garbled = {}  # map from index to circuits garbled in parallel
+        missing = [i for i, instance in enumerate(instances)
+                   if instance is None]
+        if workers != 1 and missing and not streaming:
+            with parallel.ParallelGarbler(workers or None) as garbler:
+                garbled = dict(zip(missing, garbler.garble(
+                    [compiled_circuits[i] for i in missing],
+                    free_xor=free_xor, half_gates=half_gates)))
+
+        for index, compiled in enumerate(compiled_circuits):
+            instance = instances[index]
+            if instance is not None:
+                entry = dict(instance, garbled_circuit=None,
+                             compiled=pool.circuits[index],
+                             scheme=pool.get_scheme())
+            else:
+                garbled_circuit = garbled.get(index) or yao.GarbledCircuit(
+                    compiled, free_xor=free_xor, half_gates=half_gates,
+                    backend=backend, stream=streaming,
+                    seed=os.urandom(yao.SEED_SIZE) if seeded else None)
+                entry = {
+                    "compiled": compiled,
+                    "garbled_circuit": garbled_circuit,
+                    "garbled_tables": garbled_circuit.get_garbled_tables(),
+                    "keys": garbled_circuit.get_keys(),
+                    "pbits": garbled_circuit.get_pbits(),
+                    "scheme": garbled_circuit.get_scheme(),
+                    "streaming": streaming,
+                }
+                if streaming:  # only input wires have keys yet
+                    inputs = compiled.wire_ids[:compiled.num_inputs]
+                    if not seeded:
+                        entry["keys"] = dict(zip(inputs, garbled_circuit.keys))
+                    entry["pbits"] = dict(zip(inputs, garbled_circuit.pbits))
+            pbits = entry["pbits"]
+            circuit = {  # original wire IDs, as in the circuit spec
+                "id": compiled.id,
+                "alice": compiled.original(compiled.alice),
+                "bob": compiled.original(compiled.bob),
+                "out": compiled.original(compiled.out),
             }
+            entry["circuit"] = circuit
+            # P-bits of streamed outputs are only known at the end of streams
+            entry["pbits_out"] = (None if entry.get("streaming") else
+                                  {w: pbits[w] for w in circuit["out"]})
             self.circuits.append(entry)
 
     @abstractmethod
@@ -47,41 +112,135 @@ class Alice(YaoGarbler):
         circuits: the JSON file containing circuits
         oblivious_transfer: Optional; enable the Oblivious Transfer protocol
             (True by default).
+        ot_extension: Optional; derive Bob's OTs from a few base OTs per
+            session with OT extension (False by default).
+        batched_ot: Optional; run all OTs of a circuit at once, along with
+            the circuit upload (False by default).
+        ot_group: Optional; the group of public-key OTs, 'x25519' (the
+            default), 'modp' or 'prime' (see ot.OT_GROUPS).
+        pool: Optional; a pool.GarblingPool of pre-garbled circuits.
+        free_xor: Optional; garble circuits with Free-XOR (False by default).
+        half_gates: Optional; garble non-linear gates with half-gates
+            (False by default).
+        backend: Optional; the garbling backend, 'aes' (the default) or
+            'fernet'.
+        streaming: Optional; garble circuits while streaming their garbled
+            tables to Bob in chunks, instead of sending them at once (False
+            by default, AES only).
+        chunk_size: Optional; the size in bytes of streamed chunks.
+        optimize: Optional; optimize circuits before garbling them, see
+            optimizer.optimize (False by default).
+        cache_dir: Optional; the cache of compiled circuits (cache.CACHE_DIR
+            by default), None to disable it.
+        workers: Optional; the number of processes garbling circuits, 0
+            for one per core (1 by default, AES only).
+        seeded: Optional; derive the keys of input wires from a secret seed
+            per circuit, dropping all keys once garbled (False by default,
+            AES only).
+        socket: Optional; the socket to Bob, a util.GarblerSocket by
+            default (a util.AsyncGarblerSocket for start_async).
     """
 
-    def __init__(self, circuits, oblivious_transfer=True, input=[True, True]):
-        super().__init__(circuits)
-        self.socket = util.GarblerSocket()
-        self.ot = ot.ObliviousTransfer(self.socket, enabled=oblivious_transfer)
+    def __init__(self, circuits, oblivious_transfer=True, input=[True, True],
+                 free_xor=False, half_gates=False, backend="aes",
+                 ot_extension=False, batched_ot=False, ot_group="x25519",
+                 pool=None, streaming=False, chunk_size=yao.CHUNK_SIZE,
+                 optimize=False, cache_dir=cache.CACHE_DIR, workers=1,
+                 seeded=False, socket=None):
+        super().__init__(circuits, free_xor=free_xor, half_gates=half_gates,
+                         backend=backend, pool=pool, streaming=streaming,
+                         optimize=optimize, cache_dir=cache_dir,
+                         workers=workers, seeded=seeded)
+        self.stream = (stream.StreamWriter(chunk_size=chunk_size)
+                       if streaming else None)
+        self.socket = socket or util.GarblerSocket()
+        self.ot = ot.ObliviousTransfer(self.socket, enabled=oblivious_transfer,
+                                       extension=ot_extension,
+                                       batched=batched_ot, group=ot_group)
         self.input = input
 
     def start(self):
         """Start Yao protocol."""
+        if self.stream:
+            self.stream.open(self.socket.send_wait({"open_stream": True}))
         for circuit in self.circuits:
-            to_send = {
-                "circuit": circuit["circuit"],
-                "garbled_tables": circuit["garbled_tables"],
-                "pbits_out": circuit["pbits_out"],
-            }
-            logging.debug(f"Sending {circuit['circuit']['id']}")
-            self.socket.send_wait(to_send)
-            self.print(circuit)
+            self.print(circuit, *self._upload(circuit))
+        if self.stream:
+            self.stream.join()
+        self.socket.send_wait({"end_session": True})
+
+    async def start_async(self):
+        """Start Yao protocol with asyncio, on a util.AsyncGarblerSocket.
 
-    def print(self, entry):
+        Circuits are pipelined: the upload of a circuit is sent while Bob
+        still evaluates the previous one. Streamed circuits are sent one at a
+        time, as their streams share a socket.
+        """
+        if self.stream:
+            self.stream.open(
+                await self.socket.send_wait({"open_stream": True}))
+            for circuit in self.circuits:
+                await self.print_async(circuit, *self._upload(circuit))
+            await asyncio.to_thread(self.stream.join)
+        else:
+            await asyncio.gather(*(
+                self.print_async(circuit, *self._upload(circuit))
+                for circuit in self.circuits
+            ))
+        await self.socket.send_wait({"end_session": True})
+
+    def _upload(self, circuit):
+        """Return the message uploading a circuit and its keys to send as
+        frames, starting the stream of its garbled tables if streamed."""
+        to_send = {
+            "circuit": circuit["compiled"],
+            "garbled_tables": circuit["garbled_tables"],
+            "pbits_out": circuit["pbits_out"],
+            "scheme": circuit["scheme"],
+        }
+        # Packed garbled tables are sent as a zero-copy frame
+        frames = []
+        if circuit.get("streaming"):
+            to_send["stream"] = self.stream.start(circuit["garbled_circuit"])
+        elif circuit["scheme"]["backend"] == "aes":
+            frames.append("garbled_tables")
+        logging.debug(f"Sending {circuit['circuit']['id']}")
+        return to_send, frames
+
+    def print(self, entry, upload=None, frames=()):
         """Print circuit evaluation for all Bob and Alice inputs.
 
         Args:
             entry: A dict representing the circuit to evaluate.
+            upload: Optional; the message uploading the circuit to Bob.
+            frames: Optional; keys of 'upload' to send as separate frames.
         """
-        circuit, pbits, keys = entry["circuit"], entry["pbits"], entry["keys"]
-        outputs = circuit["out"]
-        a_wires = circuit.get("alice", [])  # Alice's wires
+        a_inputs, b_keys = self._inputs(entry)
+
+        # Send Alice's encrypted inputs and keys to Bob
+        result = self.ot.get_result(a_inputs, b_keys, upload, frames)
+        self._print_result(entry, result)
+
+    async def print_async(self, entry, upload=None, frames=()):
+        """Asyncio version of print, see start_async."""
+        a_inputs, b_keys = self._inputs(entry)
+        result = await self.ot.get_result_async(a_inputs, b_keys, upload,
+                                                frames)
+        self._print_result(entry, result)
+
+    def _inputs(self, entry):
+        """Return Alice's inputs and the pairs of keys of Bob's wires.
+
+        Returns:
+            A pair of dicts, mapping Alice's wires to (key, encr_bit) inputs
+            and Bob's wires to pairs (key, encr_bit).
+        """
+        pbits, keys = entry["pbits"], entry["keys"]
+        a_wires = entry["circuit"].get("alice", [])  # Alice's wires
         a_inputs = {}  # map from Alice's wires to (key, encr_bit) inputs
-        b_wires = circuit.get("bob", [])  # Bob's wires
+        b_wires = entry["circuit"].get("bob", [])  # Bob's wires
         b_keys = {  # map from Bob's wires to a pair (key, encr_bit)
-            w: self._get_encr_bits(pbits[w], key0, key1)
-            for w, (key0, key1) in keys.items()
-            if w in b_wires
+            w: self._get_encr_bits(pbits[w], *keys[w]) for w in b_wires
         }
         bits_a = [int(b) for b in self.input]
 
@@ -91,12 +250,16 @@ class Alice(YaoGarbler):
                 keys[a_wires[i]][bits_a[i]],
                 pbits[a_wires[i]] ^ bits_a[i],
             )
+        return a_inputs, b_keys
 
-        # Send Alice's encrypted inputs and keys to Bob
-        result = self.ot.get_result(a_inputs, b_keys)
+    def _print_result(self, entry, result):
+        """Print Alice's inputs and the outputs of a circuit."""
+        circuit = entry["circuit"]
+        outputs = circuit["out"]
+        a_wires = circuit.get("alice", [])
 
         # Format output
-        str_bits_a = " ".join(str(b) for b in bits_a)
+        str_bits_a = " ".join(str(int(b)) for b in self.input)
         str_result = " ".join([str(result[w]) for w in outputs])
 
         sys.stdout.write(
@@ -117,11 +280,29 @@ class Bob:
     Args:
         oblivious_transfer: Optional; enable the Oblivious Transfer protocol
             (True by default).
+        ot_extension: Optional; derive Bob's OTs from a few base OTs per
+            session with OT extension (False by default).
+        batched_ot: Optional; run all OTs of a circuit at once, along with
+            the circuit upload (False by default).
+        ot_group: Optional; the group of the base OTs of OT extension (see
+            ot.OT_GROUPS), other OTs use Alice's group.
+        socket: Optional; the socket to Alice, a util.EvaluatorSocket by
+            default (see server.EvaluatorServer for sessions of a server),
+            or a util.AsyncSocket for listen_async and handle_async.
     """
 
-    def __init__(self, oblivious_transfer=True, input=[True, True]):
-        self.socket = util.EvaluatorSocket()
-        self.ot = ot.ObliviousTransfer(self.socket, enabled=oblivious_transfer)
+    def __init__(self, oblivious_transfer=True, input=[True, True],
+                 ot_extension=False, batched_ot=False, ot_group="x25519",
+                 socket=None):
+        self.socket = socket or util.EvaluatorSocket()
+        self.stream_socket = None  # bound when Alice opens a stream
+        self.ot_options = {
+            "enabled": oblivious_transfer,
+            "extension": ot_extension,
+            "batched": batched_ot,
+            "group": ot_group,
+        }
+        self.ot = ot.ObliviousTransfer(self.socket, **self.ot_options)
         self.input = input
 
     def listen(self):
@@ -129,11 +310,59 @@ class Bob:
         logging.info("Start listening")
         try:
             for entry in self.socket.poll_socket():
-                self.socket.send(True)
-                self.send_evaluation(entry)
+                self.handle(entry)
         except KeyboardInterrupt:
             logging.info("Stop listening")
 
+    async def listen_async(self):
+        """Listen for Alice messages with asyncio, on a
+        util.AsyncEvaluatorSocket."""
+        logging.info("Start listening")
+        while True:
+            await self.handle_async(await self.socket.receive())
+
+    def close(self):
+        """Close the stream socket of the session, if any."""
+        if self.stream_socket is not None:
+            self.stream_socket.close()
+            self.stream_socket = None
+
+    def handle(self, entry):
+        """Handle a message of Alice.
+
+        Args:
+            entry: A dict representing the circuit to evaluate, opening the
+                stream of garbled tables of the session (Bob replies with
+                the port of its stream socket), or ending Alice's session.
+
+        Returns:
+            False at the end of Alice's session, True otherwise.
+        """
+        return messages.run(self._handle_steps(entry), self.socket)
+
+    async def handle_async(self, entry):
+        """Asyncio version of handle, on a util.AsyncSocket."""
+        return await messages.run_async(self._handle_steps(entry),
+                                        self.socket)
+
+    def _handle_steps(self, entry):
+        """Protocol of handle, see messages.run."""
+        if entry.get("end_session"):
+            # The state of OTs (e.g. base OTs) belongs to the session
+            self.ot = ot.ObliviousTransfer(self.socket, **self.ot_options)
+            self.close()
+            yield from messages.send(True)
+            return False
+        if entry.get("open_stream"):
+            if self.stream_socket is None:
+                self.stream_socket = util.StreamReceiverSocket()
+            yield from messages.send(self.stream_socket.port)
+            return True
+        if not self.ot.batched:  # batched OT replies to the upload
+            yield from messages.send(True)
+        yield from self._evaluation_steps(entry)
+        return True
+
     def send_evaluation(self, entry):
         """Evaluate yao circuit for all Bob and Alice's inputs and
         send back the results.
@@ -141,10 +370,20 @@ class Bob:
         Args:
             entry: A dict representing the circuit to evaluate.
         """
+        messages.run(self._evaluation_steps(entry), self.socket)
+
+    def _evaluation_steps(self, entry):
+        """Protocol of send_evaluation, see messages.run."""
         circuit, pbits_out = entry["circuit"], entry["pbits_out"]
         garbled_tables = entry["garbled_tables"]
-        outputs = circuit["out"]
-        b_wires = circuit.get("bob", [])  # list of Bob's wires
+        if entry.get("stream"):  # evaluate chunks as they arrive
+            if self.stream_socket is None:
+                raise ValueError("Streamed circuit before opening the stream")
+            garbled_tables = stream.StreamReader(self.stream_socket,
+                                                 entry["stream"])
+            pbits_out = garbled_tables.pbits_out
+        outputs = circuit.original(circuit.out)
+        b_wires = circuit.original(circuit.bob)  # list of Bob's wires
 
         bits_b = [int(b) for b in self.input]  # Bob's inputs
 
@@ -152,7 +391,9 @@ class Bob:
         b_inputs_clear = {b_wires[i]: bits_b[i] for i in range(len(b_wires))}
 
         # Evaluate and send result to Alice
-        result = self.ot.send_result(circuit, garbled_tables, pbits_out, b_inputs_clear)
+        result = yield from self.ot.send_result_steps(
+            circuit, garbled_tables, pbits_out, b_inputs_clear, upload=entry,
+            **entry.get("scheme", {}))
 
         # Format output
         str_input_b = " ".join(str(b) for b in bits_b)
@@ -167,23 +408,62 @@ class Bob:
 class LocalTest(YaoGarbler):
     """A class for local tests.
 
-    Print a circuit evaluation or garbled tables.
+    Print a circuit evaluation or garbled tables, or check circuits against
+    the plaintext simulator (see simulator.simulate).
 
     Args:
         circuits: the JSON file containing circuits
-        print_mode: Print a clear version of the garbled tables or
-            the circuit evaluation (the default).
+        print_mode: Print a clear version of the garbled tables ('table'),
+            the circuit evaluation (the default, 'circuit'), the same truth
+            table computed by the simulator ('simulate'), or check garbled
+            evaluations against the simulator ('verify', see _verify).
+        free_xor: Optional; garble circuits with Free-XOR (False by default).
+        half_gates: Optional; garble non-linear gates with half-gates
+            (False by default).
+        backend: Optional; the garbling backend, 'aes' (the default) or
+            'fernet'.
+        optimize: Optional; optimize circuits before garbling them, see
+            optimizer.optimize (False by default).
+        cache_dir: Optional; the cache of compiled circuits (cache.CACHE_DIR
+            by default), None to disable it.
+        workers: Optional; the number of processes garbling circuits, 0
+            for one per core (1 by default, AES only).
+        seeded: Optional; derive the keys of input wires from a secret seed
+            per circuit (False by default, AES only).
+        samples: Optional; the number of random assignments of inputs
+            verify mode garbles and evaluates (VERIFY_SAMPLES by default).
+        seed: Optional; the seed of random assignments, random by default.
+
+    Attributes:
+        mismatches: The number of circuits verify mode found wrong.
     """
 
-    def __init__(self, circuits, print_mode="circuit"):
-        super().__init__(circuits)
+    def __init__(self, circuits, print_mode="circuit", free_xor=False,
+                 half_gates=False, backend="aes", optimize=False,
+                 cache_dir=cache.CACHE_DIR, workers=1, seeded=False,
+                 samples=VERIFY_SAMPLES, seed=None):
+        super().__init__(circuits, free_xor=free_xor, half_gates=half_gates,
+                         backend=backend, optimize=optimize,
+                         cache_dir=cache_dir, workers=workers, seeded=seeded)
         self._print_mode = print_mode
         self.modes = {
             "circuit": self._print_evaluation,
             "table": self._print_tables,
+            "simulate": self._print_simulation,
+            "verify": self._verify,
         }
+        self.samples = samples
+        self.rng = np.random.default_rng(seed)
+        self.mismatches = 0
         logging.info(f"Print mode: {print_mode}")
 
+        # Optimized circuits are verified against their source circuits
+        sources = [entry["compiled"] for entry in self.circuits]
+        if optimize and print_mode == "verify":
+            _, sources = cache.load_circuits(circuits, directory=cache_dir)
+        for entry, source in zip(self.circuits, sources):
+            entry["source"] = source
+
     def start(self):
         """Start local Yao protocol."""
         for circuit in self.circuits:
@@ -195,54 +475,189 @@ class LocalTest(YaoGarbler):
 
     def _print_evaluation(self, entry):
         """Print circuit evaluation."""
-        circuit, pbits, keys = entry["circuit"], entry["pbits"], entry["keys"]
-        garbled_tables = entry["garbled_tables"]
+        circuit = entry["circuit"]
         outputs = circuit["out"]
-        a_wires = circuit.get("alice", [])  # Alice's wires
-        a_inputs = {}  # map from Alice's wires to (key, encr_bit) inputs
-        b_wires = circuit.get("bob", [])  # Bob's wires
-        b_inputs = {}  # map from Bob's wires to (key, encr_bit) inputs
-        pbits_out = {w: pbits[w] for w in outputs}  # p-bits of outputs
-        N = len(a_wires) + len(b_wires)
+        wires = circuit["alice"] + circuit["bob"]  # Alice's then Bob's wires
+        N = len(wires)
 
         print(f"======== {circuit['id']} ========")
 
         # Generate all possible inputs for both Alice and Bob
         for bits in [format(n, "b").zfill(N) for n in range(2**N)]:
-            bits_a = [int(b) for b in bits[: len(a_wires)]]  # Alice's inputs
-            bits_b = [int(b) for b in bits[N - len(b_wires) :]]  # Bob's inputs
-
-            # Map Alice's wires to (key, encr_bit)
-            for i in range(len(a_wires)):
-                a_inputs[a_wires[i]] = (
-                    keys[a_wires[i]][bits_a[i]],
-                    pbits[a_wires[i]] ^ bits_a[i],
-                )
-
-            # Map Bob's wires to (key, encr_bit)
-            for i in range(len(b_wires)):
-                b_inputs[b_wires[i]] = (
-                    keys[b_wires[i]][bits_b[i]],
-                    pbits[b_wires[i]] ^ bits_b[i],
-                )
-
-            result = yao.evaluate(
-                circuit, garbled_tables, pbits_out, a_inputs, b_inputs
-            )
+            result = self._evaluate(
+                entry, {w: int(b) for w, b in zip(wires, bits)})
+            print(self._format_assignment(circuit, bits,
+                                          [result[w] for w in outputs]))
 
-            # Format output
-            str_bits_a = " ".join(bits[: len(a_wires)])
-            str_bits_b = " ".join(bits[len(a_wires) :])
-            str_result = " ".join([str(result[w]) for w in outputs])
+        print()
 
-            print(
-                f"  Alice{a_wires} = {str_bits_a} "
-                f"Bob{b_wires} = {str_bits_b}  "
-                f"Outputs{outputs} = {str_result}"
-            )
+    def _print_simulation(self, entry):
+        """Print the truth table of the circuit evaluation, simulated."""
+        circuit, compiled = entry["circuit"], entry["compiled"]
+        N = compiled.num_inputs
+        total = 2**N
+
+        print(f"======== {circuit['id']} ========")
+
+        for start, outputs in simulator.truth_table(compiled):
+            count = min(outputs.shape[1] * simulator.WORD_BITS, total - start)
+            results = simulator.unpack_bits(outputs, count).tolist()
+            for n, result in enumerate(results, start):
+                bits = format(n, "b").zfill(N)
+                print(self._format_assignment(circuit, bits, result))
 
         print()
 
+    def _verify(self, entry):
+        """Check the garbled evaluation of a circuit against the simulator.
+
+        The garbled circuit is evaluated on all the assignments of inputs if
+        there are at most 'samples', on 'samples' random ones otherwise (see
+        _evaluate_all), and compared to the simulation of the source
+        circuit. An optimized circuit is also simulated against its source
+        circuit, on many more assignments (see simulator.compare).
+        """
+        circuit, source = entry["circuit"], entry["source"]
+        wires = source.original(range(source.num_inputs))
+        N = len(wires)
+
+        print(f"======== {circuit['id']} ========")
+
+        if 2**N <= self.samples:
+            count = 2**N
+            words = -(-count // simulator.WORD_BITS)
+            inputs = simulator.exhaustive_inputs(N, 0, words)
+            assignments = f"all {count} assignments"
+        else:
+            count = self.samples
+            words = -(-count // simulator.WORD_BITS)
+            inputs = simulator.random_inputs(N, words, self.rng)
+            assignments = f"{count} random assignments of 2^{N}"
+        expected = simulator.unpack_bits(simulator.simulate(source, inputs),
+                                         count).tolist()
+
+        bits = simulator.unpack_bits(inputs, count)
+        garbled = self._evaluate_all(entry, wires, bits)
+        mismatches = 0
+        for row, result, simulated in zip(bits.tolist(), garbled, expected):
+            if result != simulated:
+                mismatches += 1
+                if mismatches <= MAX_MISMATCHES:
+                    line = self._format_assignment(
+                        circuit, "".join(map(str, row)), result)
+                    print(f"{line}, simulated {simulated}")
+        print(f"  Garbled circuit on {assignments}: "
+              f"{mismatches or 'no'} mismatches")
+        failed = mismatches > 0
+
+        if entry["compiled"] is not source:
+            count, bits = simulator.compare(source, entry["compiled"],
+                                            rng=self.rng)
+            if bits is None:
+                print(f"  Optimized circuit on {count} assignments: "
+                      f"no mismatches")
+            else:
+                bits = "".join(map(str, bits.tolist()))
+                print(f"  Optimized circuit on {count} assignments: "
+                      f"mismatch for {bits}")
+                failed = True
+
+        if failed:
+            logging.error(f"Circuit '{circuit['id']}' failed verification")
+            self.mismatches += 1
+        print()
+
+    def _evaluate_all(self, entry, wires, bits):
+        """Evaluate the garbled circuit of an entry on assignments of inputs.
+
+        Circuits garbled with half-gates are evaluated VERIFY_BATCH
+        assignments at a time by yao.evaluate_batch, on copies of the same
+        garbled tables, other circuits one assignment at a time.
+
+        Args:
+            entry: A circuit of self.circuits.
+            wires: The input wires.
+            bits: An (assignments, len(wires)) array of input bits.
+
+        Returns:
+            The list of the result bits of outputs of each assignment.
+        """
+        outputs = entry["circuit"]["out"]
+        if not entry["scheme"]["half_gates"]:
+            results = []
+            for row in bits.tolist():
+                result = self._evaluate(entry, dict(zip(wires, row)))
+                results.append([result[w] for w in outputs])
+            return results
+
+        compiled, keys = entry["compiled"], entry["keys"]
+        # Pairs of labels of the inputs, in dense order of the circuit
+        dense = compiled.original(range(compiled.num_inputs))
+        column = {w: i for i, w in enumerate(wires)}
+        bits = bits[:, [column[w] for w in dense]]
+        pairs = np.frombuffer(b"".join(keys[w][0] + keys[w][1]
+                                       for w in dense), dtype=np.uint8)
+        pairs = pairs.reshape(len(dense), 2, yao.LABEL_SIZE)
+        tables = np.frombuffer(entry["garbled_tables"], dtype=np.uint8)
+        tables = tables.reshape(1, -1, yao.LABEL_SIZE)
+        pbits_out = np.array([[entry["pbits_out"][w] for w in outputs]],
+                             dtype=np.uint8)
+
+        results = []
+        for start in range(0, len(bits), VERIFY_BATCH):
+            batch = bits[start:start + VERIFY_BATCH]
+            count = len(batch)
+            inputs = pairs[np.arange(len(dense)), batch]
+            results += yao.evaluate_batch(
+                compiled, np.broadcast_to(tables, (count,) + tables.shape[1:]),
+                np.broadcast_to(pbits_out, (count, len(outputs))),
+                inputs).tolist()
+        return results
+
+    def _evaluate(self, entry, bits):
+        """Evaluate the garbled circuit of an entry on given input bits.
+
+        Args:
+            entry: A circuit of self.circuits.
+            bits: A dict mapping input wires to their bit.
+
+        Returns:
+            A dict mapping output wires with their result bit.
+        """
+        pbits, keys = entry["pbits"], entry["keys"]
+        a_wires = set(entry["circuit"]["alice"])  # Alice's wires
+        a_inputs = {}  # map from Alice's wires to (key, encr_bit) inputs
+        b_inputs = {}  # map from other input wires to (key, encr_bit) inputs
+        for w, bit in bits.items():
+            inputs = a_inputs if w in a_wires else b_inputs
+            inputs[w] = (keys[w][bit], pbits[w] ^ bit)
+
+        return yao.evaluate(
+            entry["compiled"], entry["garbled_tables"], entry["pbits_out"],
+            a_inputs, b_inputs,
+            **entry["scheme"]
+        )
+
+    @staticmethod
+    def _format_assignment(circuit, bits, results):
+        """Format a line of truth table.
+
+        Args:
+            circuit: The circuit of an entry, with original wire IDs.
+            bits: The string of input bits, Alice's first.
+            results: The list of result bits of outputs.
+        """
+        a_wires, b_wires = circuit["alice"], circuit["bob"]
+        str_bits_a = " ".join(bits[: len(a_wires)])
+        str_bits_b = " ".join(bits[len(a_wires) :])
+        str_result = " ".join([str(r) for r in results])
+
+        return (
+            f"  Alice{a_wires} = {str_bits_a} "
+            f"Bob{b_wires} = {str_bits_b}  "
+            f"Outputs{circuit['out']} = {str_result}"
+        )
+
     @property
     def print_mode(self):
         return self._print_mode
@@ -265,21 +680,123 @@ def main(
     print_mode="circuit",
     loglevel=logging.WARNING,
     input=[True, True],
+    free_xor=False,
+    half_gates=False,
+    backend="aes",
+    ot_extension=False,
+    batched_ot=False,
+    ot_group="x25519",
+    pool_dir=None,
+    pool_size=pool.POOL_SIZE,
+    low_water=pool.LOW_WATER,
+    streaming=False,
+    chunk_size=yao.CHUNK_SIZE,
+    optimize=False,
+    cache_dir=cache.CACHE_DIR,
+    workers=1,
+    seeded=False,
+    serve=False,
+    max_sessions=None,
+    use_asyncio=False,
+    stats_path=None,
+    profile_dir=None,
+    trace_memory=False,
+    samples=VERIFY_SAMPLES,
+    seed=None,
 ):
     
     log_path = f"./../set_intersection/logs/{party}.log"
     logging.basicConfig(filename=log_path, format="[%(levelname)s] %(message)s")
     logging.getLogger().setLevel(loglevel)
 
+    if stats_path is not None:
+        stats.enable(profile_dir=profile_dir, trace_memory=trace_memory)
+        # Parties such as bob run until interrupted
+        atexit.register(stats.dump, stats_path)
+
+    if streaming and backend != "aes":
+        logging.error("Streaming garbled tables requires AES")
+        return
+    if workers != 1 and backend != "aes":
+        logging.error("Garbling on several processes requires AES")
+        return
+    if seeded and (backend != "aes" or workers != 1 or pool_dir is not None):
+        logging.error("Seeded circuits require AES, one worker and no pool")
+        return
+
+    garbling_pool = None
+    if pool_dir is not None and party in ("alice", "pool"):
+        if backend != "aes":
+            logging.error("Pools of pre-garbled circuits require AES")
+            return
+        garbling_pool = pool.GarblingPool(circuit_path, pool_dir,
+                                          size=pool_size, low_water=low_water,
+                                          free_xor=free_xor,
+                                          half_gates=half_gates,
+                                          optimize=optimize,
+                                          cache_dir=cache_dir)
+
     if party == "alice":
-        alice = Alice(circuit_path, oblivious_transfer=oblivious_transfer, input=input)
-        alice.start()
+        alice = Alice(circuit_path, oblivious_transfer=oblivious_transfer,
+                      input=input, free_xor=free_xor, half_gates=half_gates,
+                      backend=backend, ot_extension=ot_extension,
+                      batched_ot=batched_ot, ot_group=ot_group,
+                      pool=garbling_pool, streaming=streaming,
+                      chunk_size=chunk_size, optimize=optimize,
+                      cache_dir=cache_dir, workers=workers, seeded=seeded,
+                      socket=util.AsyncGarblerSocket() if use_asyncio
+                      else None)
+        if use_asyncio:
+            asyncio.run(alice.start_async())
+        else:
+            alice.start()
+    elif party == "pool":
+        if garbling_pool is None:
+            logging.error("The pool party requires a pool directory")
+            return
+        logging.info("Start filling the pool")
+        garbling_pool.start()
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            garbling_pool.stop()
+            logging.info("Stop filling the pool")
+    elif party == "bob" and serve:
+        evaluator = functools.partial(
+            Bob, oblivious_transfer=oblivious_transfer, input=input,
+            ot_extension=ot_extension, batched_ot=batched_ot,
+            ot_group=ot_group)
+        if not use_asyncio:
+            server.EvaluatorServer(evaluator, workers=workers or None,
+                                   max_sessions=max_sessions).serve()
+            return
+        try:
+            asyncio.run(server.AsyncEvaluatorServer(
+                evaluator, max_sessions=max_sessions).serve())
+        except KeyboardInterrupt:
+            logging.info("Stop serving")
+    elif party == "bob" and use_asyncio:
+        bob = Bob(oblivious_transfer=oblivious_transfer, input=input,
+                  ot_extension=ot_extension, batched_ot=batched_ot,
+                  ot_group=ot_group, socket=util.AsyncEvaluatorSocket())
+        try:
+            asyncio.run(bob.listen_async())
+        except KeyboardInterrupt:
+            logging.info("Stop listening")
     elif party == "bob":
-        bob = Bob(oblivious_transfer=oblivious_transfer, input=input)
+        bob = Bob(oblivious_transfer=oblivious_transfer, input=input,
+                  ot_extension=ot_extension, batched_ot=batched_ot,
+                  ot_group=ot_group)
         bob.listen()
     elif party == "local":
-        local = LocalTest(circuit_path, print_mode=print_mode)
+        local = LocalTest(circuit_path, print_mode=print_mode,
+                          free_xor=free_xor, half_gates=half_gates,
+                          backend=backend, optimize=optimize,
+                          cache_dir=cache_dir, workers=workers,
+                          seeded=seeded, samples=samples, seed=seed)
         local.start()
+        if local.mismatches:
+            sys.exit(1)
     else:
         logging.error(f"Unknown party '{party}'")
 
@@ -302,26 +819,174 @@ if __name__ == "__main__":
 
         parser = argparse.ArgumentParser(description="Run Yao protocol.")
         parser.add_argument(
-            "party", choices=["alice", "bob", "local"], help="the yao party to run"
+            "party",
+            choices=["alice", "bob", "local", "pool"],
+            help="the yao party to run, pool fills a pool of garbled circuits",
         )
         parser.add_argument(
             "-c",
             "--circuit",
             metavar="circuit.json",
             default="circuits/default.json",
-            help=("the JSON circuit file for alice and local tests"),
+            help=("the circuit file for alice and local tests, JSON or "
+                  "Bristol Fashion (any other suffix)"),
         )
         parser.add_argument(
             "--no-oblivious-transfer",
             action="store_true",
             help="disable oblivious transfer",
         )
+        parser.add_argument(
+            "--ot-extension",
+            action="store_true",
+            help="use OT extension, on both alice and bob",
+        )
+        parser.add_argument(
+            "--batched-ot",
+            action="store_true",
+            help="run all OTs of a circuit in one round trip, on both sides",
+        )
+        parser.add_argument(
+            "--ot-group",
+            choices=ot.OT_GROUPS,
+            default="x25519",
+            help="the group of public-key OTs (default 'x25519')",
+        )
+        parser.add_argument(
+            "--free-xor",
+            action="store_true",
+            help="garble XOR, XNOR and NOT gates for free (alice and local)",
+        )
+        parser.add_argument(
+            "--half-gates",
+            action="store_true",
+            help="garble non-linear gates with half-gates, implies --free-xor",
+        )
+        parser.add_argument(
+            "-b",
+            "--backend",
+            choices=["aes", "fernet"],
+            default="aes",
+            help="the garbling backend, fernet is legacy (default 'aes')",
+        )
+        parser.add_argument(
+            "--pool",
+            metavar="directory",
+            help="the pool of pre-garbled circuits alice takes circuits from",
+        )
+        parser.add_argument(
+            "--pool-size",
+            type=int,
+            default=pool.POOL_SIZE,
+            help=f"the number of pre-garbled instances of each circuit "
+                 f"(default {pool.POOL_SIZE})",
+        )
+        parser.add_argument(
+            "--low-water",
+            type=int,
+            default=pool.LOW_WATER,
+            help=f"refill the pool below this number of instances "
+                 f"(default {pool.LOW_WATER})",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="garble while streaming garbled tables to bob (alice, AES)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=yao.CHUNK_SIZE,
+            help=f"the size in bytes of streamed chunks "
+                 f"(default {yao.CHUNK_SIZE})",
+        )
+        parser.add_argument(
+            "--optimize",
+            action="store_true",
+            help="optimize circuits before garbling them (alice and local)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="the number of processes garbling circuits (alice and "
+                 "local, AES) or evaluating sessions (bob --server), 0 for "
+                 "one per core (default 1)",
+        )
+        parser.add_argument(
+            "--seeded",
+            action="store_true",
+            help="derive the keys of input wires from a secret seed per "
+                 "circuit, dropping all keys once garbled (alice and local, "
+                 "AES)",
+        )
+        parser.add_argument(
+            "--server",
+            action="store_true",
+            help="serve several alices at once on --workers processes (bob)",
+        )
+        parser.add_argument(
+            "--max-sessions",
+            type=int,
+            help="the maximum number of concurrent sessions of the server "
+                 "(default --workers)",
+        )
+        parser.add_argument(
+            "--asyncio",
+            action="store_true",
+            help="run alice or bob with asyncio: alice pipelines circuits, "
+                 "bob --server serves sessions in one process",
+        )
+        parser.add_argument(
+            "--stats",
+            metavar="stats.json",
+            help="write counters and timers of phases (garbling, evaluation, "
+                 "OTs, sockets) as JSON to this file on exit, - for the "
+                 "standard output",
+        )
+        parser.add_argument(
+            "--profile",
+            metavar="directory",
+            help="with --stats, write a cProfile capture of each phase to "
+                 "this directory",
+        )
+        parser.add_argument(
+            "--trace-memory",
+            action="store_true",
+            help="with --stats, record the peak of memory of each phase",
+        )
+        parser.add_argument(
+            "--cache",
+            metavar="directory",
+            default=cache.CACHE_DIR,
+            help=f"the cache of compiled circuits (default '{cache.CACHE_DIR}')",
+        )
+        parser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="parse circuit files without the cache of compiled circuits",
+        )
         parser.add_argument(
             "-m",
             metavar="mode",
-            choices=["circuit", "table"],
+            choices=["circuit", "table", "simulate", "verify"],
             default="circuit",
-            help="the print mode for local tests (default 'circuit')",
+            help="the print mode for local tests: simulate prints the truth "
+                 "table with the plaintext simulator, verify checks garbled "
+                 "evaluations against it (default 'circuit')",
+        )
+        parser.add_argument(
+            "--samples",
+            type=int,
+            default=VERIFY_SAMPLES,
+            help=f"the number of random assignments of inputs garbled by "
+                 f"verify mode, all of them if there are not more "
+                 f"(default {VERIFY_SAMPLES})",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            help="the seed of random assignments of verify mode",
         )
         parser.add_argument(
             "-l",
@@ -347,6 +1012,29 @@ if __name__ == "__main__":
             print_mode=args.m,
             loglevel=loglevels[args.loglevel],
             input=args.input,
+            free_xor=args.free_xor,
+            half_gates=args.half_gates,
+            backend=args.backend,
+            ot_extension=args.ot_extension,
+            batched_ot=args.batched_ot,
+            ot_group=args.ot_group,
+            pool_dir=args.pool,
+            pool_size=args.pool_size,
+            low_water=args.low_water,
+            streaming=args.stream,
+            chunk_size=args.chunk_size,
+            optimize=args.optimize,
+            cache_dir=None if args.no_cache else args.cache,
+            workers=args.workers,
+            seeded=args.seeded,
+            serve=args.server,
+            max_sessions=args.max_sessions,
+            use_asyncio=args.asyncio,
+            stats_path=args.stats,
+            profile_dir=args.profile,
+            trace_memory=args.trace_memory,
+            samples=args.samples,
+            seed=args.seed,
         )
 
     init()
@@ -0,0 +1,114 @@
+import asyncio
+import functools
+
+# Steps yielded by protocols
+SEND = "send"  # (SEND, msg, frames): send a message
+RECEIVE = "receive"  # (RECEIVE, last): receive a message
+CALL = "call"  # (CALL, function): run a computation
+
+
+def send(msg, frames=()):
+    """Step sending a message, see util.Socket.send."""
+    yield SEND, msg, frames
+
+
+def receive(last=False):
+    """Step receiving a message.
+
+    Args:
+        last: Optional; whether the protocol sends nothing after this
+            message, so that pipelined protocols may start sending theirs.
+
+    Returns:
+        The message received.
+    """
+    return (yield RECEIVE, last)
+
+
+def send_wait(msg, frames=(), last=False):
+    """Steps sending a message and receiving the reply."""
+    yield from send(msg, frames)
+    return (yield from receive(last))
+
+
+def call(function, *args, **kwargs):
+    """Step running a computation, e.g. the evaluation of a circuit, which
+    asyncio runs in a thread to keep serving other protocols meanwhile."""
+    return (yield CALL, functools.partial(function, *args, **kwargs))
+
+
+def run(protocol, socket):
+    """Run a protocol on a blocking socket.
+
+    Protocols are generators yielding the steps above, e.g.
+    'reply = yield from messages.send_wait(msg)', so that the same code runs
+    with run on a util.Socket and with run_async on a util.AsyncSocket.
+
+    Args:
+        protocol: The generator of the protocol.
+        socket: The util.Socket to the other party.
+
+    Returns:
+        The value returned by the protocol.
+    """
+    value = None
+    while True:
+        try:
+            step = protocol.send(value)
+        except StopIteration as stop:
+            return stop.value
+        value = None
+        if step[0] == SEND:
+            socket.send(step[1], step[2])
+        elif step[0] == RECEIVE:
+            value = socket.receive()
+        else:
+            value = step[1]()
+
+
+async def run_async(protocol, socket):
+    """Run a protocol on an asyncio socket, see run.
+
+    Protocols sharing a socket send their messages in turn: a protocol
+    takes the turn of the socket (util.AsyncSocket.turn) at its first
+    message and gives it back once it waits for its last reply, so that
+    the next protocol sends its messages while the peer still works on the
+    previous one. Replies of a requesting socket (util.AsyncGarblerSocket)
+    are matched to requests in order.
+
+    Args:
+        protocol: The generator of the protocol.
+        socket: The util.AsyncSocket to the other party.
+
+    Returns:
+        The value returned by the protocol.
+    """
+    replies = []  # futures of the replies to the messages sent
+    turn = False  # whether the protocol holds the turn of the socket
+    value = None
+    try:
+        while True:
+            try:
+                step = protocol.send(value)
+            except StopIteration as stop:
+                return stop.value
+            value = None
+            if step[0] == SEND:
+                if not turn:
+                    await socket.turn.acquire()
+                    turn = True
+                reply = await socket.send(step[1], step[2])
+                if reply is not None:
+                    replies.append(reply)
+            elif step[0] == RECEIVE:
+                if step[1] and turn:
+                    socket.turn.release()
+                    turn = False
+                value = await (replies.pop(0) if replies
+                               else socket.receive())
+            else:
+                value = await asyncio.get_running_loop().run_in_executor(
+                    None, step[1])
+    finally:
+        if turn:
+            socket.turn.release()
@@ -0,0 +1,409 @@
+import functools
+
+import compiler
+
+NON_LINEAR_GATES = ("AND", "OR", "NAND", "NOR")  # gates costing a table
+CUT_SIZE = 3  # number of leaves of the cuts a gate is resynthesized from
+MAX_CUTS = 6  # number of cuts kept for each node
+
+# Nodes of the XOR-AND graph
+CONST, INPUT, AND, XOR = range(4)
+
+
+class XorAndGraph:
+    """A structurally hashed XOR-AND graph with complemented edges.
+
+    A literal is '2 * node + inverted', node 0 being the constant 0, hence
+    NOT gates are free and literals 0 and 1 are the constants. Each node
+    keeps its cuts, i.e. sets of at most CUT_SIZE nodes ('leaves') it is a
+    function of, with its truth table on them: a gate is replaced by XORs of
+    leaves of a cut whenever it is linear on them, or by an existing AND
+    of two leaves. An AND of inputs that are never both 0, e.g. the NOR of
+    an OR of exclusive terms, is an XNOR.
+
+    A truth table on leaves (l_0, ..., l_m) is an integer whose i-th bit is
+    the value of the node when each l_j is the j-th bit of i.
+    """
+
+    def __init__(self):
+        self.nodes = [(CONST, 0, 0)]  # (type, literal a, literal b)
+        self.cuts = [[((), 0)]]  # (leaves, truth table) of each node
+        self.table = {}  # map from (type, literal a, literal b) to node
+
+    def input(self):
+        """Add an input and return its literal."""
+        node = len(self.nodes)
+        self.nodes.append((INPUT, 0, 0))
+        self.cuts.append([((node,), 0b10)])
+        return 2 * node
+
+    def and_(self, lit_a, lit_b, rewrite=True):
+        """Return the literal of lit_a AND lit_b.
+
+        Args:
+            rewrite: Optional; resynthesize the gate from its cuts (True by
+                default), resynthesized gates being added as they are.
+        """
+        if lit_a > lit_b:
+            lit_a, lit_b = lit_b, lit_a
+        if lit_a == 0 or lit_a == lit_b ^ 1:
+            return 0
+        if lit_a == 1 or lit_a == lit_b:
+            return lit_b
+        return self._node(AND, lit_a, lit_b, rewrite)
+
+    def xor(self, lit_a, lit_b, rewrite=True):
+        """Return the literal of lit_a XOR lit_b, see and_."""
+        inverted = (lit_a ^ lit_b) & 1
+        lit_a, lit_b = sorted((lit_a & ~1, lit_b & ~1))
+        if lit_a == lit_b:
+            return inverted
+        if lit_a == 0:
+            return lit_b ^ inverted
+        return self._node(XOR, lit_a, lit_b, rewrite) ^ inverted
+
+    def _node(self, node_type, lit_a, lit_b, rewrite):
+        """Return the literal of a gate, reusing any equivalent node."""
+        key = (node_type, lit_a, lit_b)
+        if key in self.table:
+            return 2 * self.table[key]
+
+        cuts, exclusive = self._merge_cuts(node_type, lit_a, lit_b)
+        if exclusive and rewrite:
+            return self.xor(lit_a, lit_b) ^ 1
+        inputs = {lit_a >> 1, lit_b >> 1}
+        # XORs of linear nodes only rewrite into other XORs on 3 leaves
+        nonlinear = AND in (node_type, self.nodes[lit_a >> 1][0],
+                            self.nodes[lit_b >> 1][0])
+        for linear in (True, False) if rewrite else ():
+            for leaves, truth_table in cuts:
+                if len(leaves) > 2 and not nonlinear:
+                    continue
+                literal = self._resynthesize(leaves, truth_table, inputs,
+                                             linear)
+                if literal is not None:
+                    return literal
+
+        node = len(self.nodes)
+        self.nodes.append(key)
+        self.cuts.append([((node,), 0b10)] + cuts[:MAX_CUTS - 1])
+        self.table[key] = node
+        return 2 * node
+
+    def _merge_cuts(self, node_type, lit_a, lit_b):
+        """Return the cuts of a gate on the literals, from their cuts.
+
+        Returns:
+            A pair (cuts, exclusive), 'exclusive' being whether the gate is
+            an AND of literals that are never both 0 on some cut.
+        """
+        cuts = {}
+        exclusive = False
+        for leaves_a, table_a in self.cuts[lit_a >> 1]:
+            for leaves_b, table_b in self.cuts[lit_b >> 1]:
+                leaves = tuple(sorted(set(leaves_a) | set(leaves_b)))
+                if len(leaves) > CUT_SIZE or leaves in cuts:
+                    continue
+                full = (1 << 2**len(leaves)) - 1
+                a = _expand(table_a, leaves_a, leaves) ^ full * (lit_a & 1)
+                b = _expand(table_b, leaves_b, leaves) ^ full * (lit_b & 1)
+                if node_type == AND:
+                    cuts[leaves] = a & b
+                    exclusive |= a | b == full
+                else:
+                    cuts[leaves] = a ^ b
+        return sorted(cuts.items(), key=lambda cut: len(cut[0])), exclusive
+
+    def _resynthesize(self, leaves, truth_table, inputs, linear):
+        """Return the literal of a function of a cut if it is cheaper.
+
+        A linear function of the leaves is free, and so is an existing AND
+        of two literals of other leaves than 'inputs'. Returns None
+        otherwise, or if 'linear' and the function is not linear.
+        """
+        leaves, truth_table = _shrink(leaves, truth_table)
+        if len(leaves) <= 1:
+            return (2 * leaves[0] + (truth_table == 0b01) if leaves
+                    else truth_table)
+        if set(leaves) == inputs:
+            return None
+        mask = _linear_mask(truth_table, len(leaves))
+        if mask is not None:
+            literal = truth_table & 1
+            for j, leaf in enumerate(leaves):
+                if mask >> j & 1:
+                    literal = self.xor(literal, 2 * leaf, rewrite=False)
+            return literal
+        if linear or len(leaves) > 2:
+            return None
+        # An AND of literals is true for one row, a NAND false for one row;
+        # only an existing AND is reused, a new one could duplicate the gate
+        inverted = bin(truth_table).count("1") == 3
+        row = (truth_table ^ 0b1111 * inverted).bit_length() - 1
+        lit_a = 2 * leaves[0] + (row & 1 ^ 1)
+        lit_b = 2 * leaves[1] + (row >> 1 & 1 ^ 1)
+        key = (AND, min(lit_a, lit_b), max(lit_a, lit_b))
+        if key not in self.table:
+            return None
+        return 2 * self.table[key] ^ inverted
+
+
+def _expand(truth_table, leaves, new_leaves):
+    """Return a truth table on leaves as a truth table on more leaves."""
+    if leaves == new_leaves:
+        return truth_table
+    positions = tuple(new_leaves.index(leaf) for leaf in leaves)
+    return _expand_table(truth_table, positions, len(new_leaves))
+
+
+@functools.lru_cache(maxsize=None)
+def _expand_table(truth_table, positions, num_leaves):
+    """Return a truth table whose j-th leaf is the positions[j]-th leaf."""
+    expanded = 0
+    for i in range(2**num_leaves):
+        row = sum((i >> p & 1) << j for j, p in enumerate(positions))
+        expanded |= (truth_table >> row & 1) << i
+    return expanded
+
+
+def _shrink(leaves, truth_table):
+    """Remove the leaves a truth table does not depend on."""
+    kept, truth_table = _shrink_table(truth_table, len(leaves))
+    return tuple(leaves[j] for j in kept), truth_table
+
+
+@functools.lru_cache(maxsize=None)
+def _linear_mask(truth_table, num_leaves):
+    """Return the leaves a linear truth table is the XOR of, as a bit mask,
+    None if it is not linear."""
+    # A linear function is the XOR of a constant and of some leaves
+    constant = truth_table & 1
+    mask = sum((truth_table >> (1 << j) & 1 ^ constant) << j
+               for j in range(num_leaves))
+    if all(truth_table >> i & 1 == constant ^ bin(i & mask).count("1") % 2
+           for i in range(2**num_leaves)):
+        return mask
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _shrink_table(truth_table, num_leaves):
+    """Return the positions of the leaves a truth table depends on, and the
+    truth table on them."""
+    kept = list(range(num_leaves))
+    for j in reversed(range(num_leaves)):
+        rows = range(2**len(kept))
+        if all(truth_table >> i & 1 == truth_table >> (i ^ 1 << j) & 1
+               for i in rows):
+            truth_table = sum((truth_table >> i & 1) << k
+                              for k, i in enumerate(i for i in rows
+                                                    if not i >> j & 1))
+            del kept[j]
+    return tuple(kept), truth_table
+
+
+def optimize(circuit):
+    """Optimize a circuit, keeping its input and output wires.
+
+    Gates are rewritten into an XOR-AND graph with constant propagation,
+    double-NOT removal and common subexpression elimination, OR, NAND and
+    NOR gates being ANDs of inverted literals. Gates are then resynthesized
+    from cuts of at most CUT_SIZE wires, and only the gates outputs depend
+    on are written back, each AND node as one AND, NAND, OR or NOR gate.
+
+    Args:
+        circuit: A dict containing circuit spec.
+
+    Returns:
+        A dict containing the spec of the optimized circuit.
+    """
+    gates = compiler.topological_order(circuit["gates"])
+    a_wires = circuit.get("alice", [])
+    b_wires = circuit.get("bob", [])
+    outputs = {gate["id"] for gate in gates}
+
+    # Inputs: Alice's, Bob's then any other wire no gate computes
+    input_ids = list(a_wires) + list(b_wires)
+    for w in sorted({w for gate in gates for w in gate["in"]}):
+        if w not in outputs and w not in input_ids:
+            input_ids.append(w)
+    if not input_ids:
+        raise ValueError(f"Circuit '{circuit['id']}' has no input")
+
+    graph = XorAndGraph()
+    literals = {w: graph.input() for w in input_ids}
+    for gate in gates:
+        lits = [literals[w] for w in gate["in"]]
+        gate_type = gate["type"]
+        if gate_type == "NOT":
+            literal = lits[0] ^ 1
+        elif gate_type in ("XOR", "XNOR"):
+            literal = graph.xor(*lits) ^ (gate_type == "XNOR")
+        elif gate_type in ("AND", "NAND"):
+            literal = graph.and_(*lits) ^ (gate_type == "NAND")
+        else:  # OR and NOR are ANDs of inverted inputs
+            literal = graph.and_(lits[0] ^ 1, lits[1] ^ 1) ^ (
+                gate_type == "OR")
+        literals[gate["id"]] = literal
+
+    out_literals = [literals[w] for w in circuit["out"]]
+    return {
+        **{k: v for k, v in circuit.items() if k != "gates"},
+        "gates": _write_gates(graph, input_ids, circuit["out"], out_literals,
+                              max(literals) + 1),
+    }
+
+
+def _write_gates(graph, input_ids, out_ids, out_literals, next_gate_id):
+    """Write the nodes outputs depend on back as gates.
+
+    A node whose uses all need its inverse is written as an inverted gate
+    (e.g. NAND), other nodes being inverted with a NOT gate where needed. Outputs keep
+    their wire IDs: the gate of an output node takes the ID of the output,
+    and other outputs (e.g. an input or a constant) get a gate of their own.
+    """
+    nodes = graph.nodes
+    input_nodes = {i + 1: w for i, w in enumerate(input_ids)}
+
+    # Nodes the outputs depend on, and the polarity of their uses
+    live = set()
+    stack = [literal >> 1 for literal in out_literals]
+    while stack:
+        node = stack.pop()
+        if node not in live:
+            live.add(node)
+            if nodes[node][0] in (AND, XOR):
+                stack += [nodes[node][1] >> 1, nodes[node][2] >> 1]
+    uses = {}  # map from node to the polarities of uses needing a polarity
+    for node in live:
+        if nodes[node][0] == AND:
+            for literal in nodes[node][1:]:
+                uses.setdefault(literal >> 1, set()).add(literal & 1)
+    for literal in out_literals:
+        uses.setdefault(literal >> 1, set()).add(literal & 1)
+    polarity = {node: int(uses.get(node) == {1}) for node in live
+                if nodes[node][0] in (AND, XOR)}
+
+    # The gate of an output node takes the ID of the first such output
+    gate_ids = {}  # map from node to the ID of its gate
+    written_outputs = set()
+    for w, literal in zip(out_ids, out_literals):
+        node = literal >> 1
+        if (node in polarity and node not in gate_ids
+                and polarity[node] == literal & 1):
+            gate_ids[node] = w
+            written_outputs.add(w)
+
+    gates = []
+
+    def add_gate(gate_type, inputs, gate_id=None):
+        nonlocal next_gate_id
+        if gate_id is None:
+            gate_id, next_gate_id = next_gate_id, next_gate_id + 1
+        gates.append({"id": gate_id, "type": gate_type, "in": inputs})
+        return gate_id
+
+    wires = {}  # map from node to its wire, carrying its value ^ polarity
+    inverted_wires = {}  # map from node to a wire carrying its inverse
+
+    def wire(literal):
+        """Return a wire carrying a literal."""
+        node = literal >> 1
+        if literal & 1 == polarity.get(node, 0):
+            return wires[node]
+        if node not in inverted_wires:
+            inverted_wires[node] = add_gate("NOT", [wires[node]])
+        return inverted_wires[node]
+
+    for node in sorted(live):
+        node_type, lit_a, lit_b = nodes[node]
+        if node_type == INPUT:
+            wires[node] = input_nodes[node]
+            continue
+        if node_type == CONST:
+            continue
+        pol = polarity[node]
+        if node_type == XOR:
+            pol_a = polarity.get(lit_a >> 1, 0)
+            pol_b = polarity.get(lit_b >> 1, 0)
+            gate_type = "XNOR" if pol ^ pol_a ^ pol_b else "XOR"
+            inputs = [wires[lit_a >> 1], wires[lit_b >> 1]]
+        else:
+            # Both inputs inverted: NOR, else an AND of (maybe NOT) wires
+            inv_a = lit_a & 1 ^ polarity.get(lit_a >> 1, 0)
+            inv_b = lit_b & 1 ^ polarity.get(lit_b >> 1, 0)
+            if inv_a and inv_b:
+                gate_type = "OR" if pol else "NOR"
+                inputs = [wires[lit_a >> 1], wires[lit_b >> 1]]
+            else:
+                gate_type = "NAND" if pol else "AND"
+                inputs = [wire(lit_a), wire(lit_b)]
+        wires[node] = add_gate(gate_type, inputs, gate_ids.get(node))
+
+    # Other outputs: NOT of a wire, two NOTs to copy one, or a constant
+    for w, literal in zip(out_ids, out_literals):
+        if w in written_outputs:
+            continue
+        node = literal >> 1
+        if node == 0:
+            add_gate("XNOR" if literal else "XOR",
+                     [input_ids[0], input_ids[0]], w)
+        elif literal & 1 != polarity.get(node, 0):
+            add_gate("NOT", [wires[node]], w)
+        elif wires[node] != w:
+            add_gate("NOT", [wire(literal ^ 1)], w)
+        written_outputs.add(w)
+
+    return gates
+
+
+def gate_stats(circuit):
+    """Return the number of gates of a circuit, in total and by type.
+
+    Args:
+        circuit: A dict containing circuit spec.
+
+    Returns:
+        A dict with the number of 'gates', of 'non_linear' gates (i.e.
+        with a garbled table even with Free-XOR) and of each gate type.
+    """
+    stats = {"gates": len(circuit["gates"]), "non_linear": 0}
+    stats.update({gate_type: 0 for gate_type in compiler.GATE_TYPES})
+    for gate in circuit["gates"]:
+        stats[gate["type"]] += 1
+        stats["non_linear"] += gate["type"] in NON_LINEAR_GATES
+    return stats
+
+
+def format_stats(circuit_id, before, after):
+    """Return a line comparing the statistics of a circuit and its
+    optimization (see gate_stats)."""
+    changes = ", ".join(
+        f"{key} {before[key]} -> {after[key]}"
+        for key in ("gates", "non_linear") + compiler.GATE_TYPES
+        if before[key] or after[key]
+    )
+    return f"Optimized {circuit_id}: {changes}"
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import util
+
+    parser = argparse.ArgumentParser(description="Optimize circuits.")
+    parser.add_argument("circuit", metavar="circuit.json",
+                        help="the JSON circuit file to optimize")
+    parser.add_argument("-o", "--output", metavar="optimized.json",
+                        help="write the optimized circuits to this file")
+    args = parser.parse_args()
+
+    spec = util.parse_json(args.circuit)
+    optimized = []
+    for circuit in spec["circuits"]:
+        optimized.append(optimize(circuit))
+        print(format_stats(circuit["id"], gate_stats(circuit),
+                           gate_stats(optimized[-1])))
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump(dict(spec, circuits=optimized), json_file, indent=2)
@@ -1,42 +1,106 @@
 import hashlib
 import logging
-import pickle
+import messages
+import numpy as np
+import os
+import stats
 import util
 import yao
 
+SECURITY_PARAMETER = 128  # number of base OTs of OT extension
+SEED_SIZE = 16  # size in bytes of the seeds exchanged by base OTs
+OT_GROUPS = ("x25519", "modp", "prime")  # groups of public-key OTs
+
 
 class ObliviousTransfer:
-    def __init__(self, socket, enabled=True):
+    """Oblivious transfer of the labels of Bob's input wires.
+
+    Each protocol runs on a blocking util.Socket (e.g. get_result) or on
+    a util.AsyncSocket (e.g. get_result_async), its steps (e.g.
+    get_result_steps) being shared, see messages.run.
+
+    Args:
+        socket: The socket connecting Alice and Bob, blocking or asyncio.
+        enabled: Optional; enable the Oblivious Transfer protocol (True by
+            default), otherwise both labels of each wire are sent to Bob.
+        extension: Optional; derive all OTs from a single set of base OTs
+            per session with OT extension (False by default), instead of
+            running one public-key OT per wire.
+        batched: Optional; run the OTs of all wires at once and fold the
+            circuit upload and Alice's inputs into the first OT message
+            (False by default), so that each circuit costs a constant number
+            of round trips.
+        group: Optional; the group of public-key OTs (see OT_GROUPS):
+            'x25519' (the default), 'modp' or 'prime'.
+    """
+    def __init__(self, socket, enabled=True, extension=False, batched=False,
+                 group="x25519"):
+        if group not in OT_GROUPS:
+            raise ValueError(f"Unknown OT group '{group}', "
+                             f"must be in {list(OT_GROUPS)}")
         self.socket = socket
         self.enabled = enabled
+        self.group = group
+        self.extension = OTExtension(group) if enabled and extension else None
+        self.batched = batched
+        self.protocol = None  # public-key OT protocol, created once
 
-    def get_result(self, a_inputs, b_keys):
+    def get_result(self, a_inputs, b_keys, upload=None, frames=()):
         """Send Alice's inputs and retrieve Bob's result of evaluation.
 
         Args:
             a_inputs: A dict mapping Alice's wires to (key, encr_bit) inputs.
             b_keys: A dict mapping each Bob's wire to a pair (key, encr_bit).
+            upload: Optional; the dict message uploading the circuit to Bob.
+            frames: Optional; keys of 'upload' to send as separate frames.
 
         Returns:
             The result of the yao circuit evaluation.
         """
+        return messages.run(
+            self.get_result_steps(a_inputs, b_keys, upload, frames),
+            self.socket)
+
+    async def get_result_async(self, a_inputs, b_keys, upload=None,
+                               frames=()):
+        """Asyncio version of get_result, on a util.AsyncSocket."""
+        return await messages.run_async(
+            self.get_result_steps(a_inputs, b_keys, upload, frames),
+            self.socket)
+
+    def get_result_steps(self, a_inputs, b_keys, upload=None, frames=()):
+        """Protocol of get_result, see messages.run."""
+        if self.enabled:
+            stats.count("ot.transfers", len(b_keys))
+        if self.batched:
+            return (yield from self._get_result_batched(
+                a_inputs, b_keys, upload or {}, frames))
+        if upload is not None:
+            yield from messages.send_wait(upload, frames)
+
         logging.debug("Sending inputs to Bob")
-        self.socket.send(a_inputs)
+        yield from messages.send(a_inputs)
+
+        if self.extension:
+            yield from self.extension.send({w: _pack_pair(b_keys[w])
+                                            for w in b_keys})
+            return (yield from messages.receive(last=True))
 
         for _ in range(len(b_keys)):
-            w = self.socket.receive()  # receive gate ID where to perform OT
+            # receive gate ID where to perform OT
+            w = yield from messages.receive()
             logging.debug(f"Received gate ID {w}")
 
             if self.enabled:  # perform oblivious transfer
-                pair = (pickle.dumps(b_keys[w][0]), pickle.dumps(b_keys[w][1]))
-                self.ot_garbler(pair)
+                yield from self.ot_garbler(_pack_pair(b_keys[w]))
             else:
                 to_send = (b_keys[w][0], b_keys[w][1])
-                self.socket.send(to_send)
+                yield from messages.send(to_send)
 
-        return self.socket.receive()
+        return (yield from messages.receive(last=True))
 
-    def send_result(self, circuit, g_tables, pbits_out, b_inputs):
+    def send_result(self, circuit, g_tables, pbits_out, b_inputs, upload=None,
+                    **scheme):
         """Evaluate circuit and send the result to Alice.
 
         Args:
@@ -44,56 +108,162 @@ class ObliviousTransfer:
             g_tables: Garbled tables of yao circuit.
             pbits_out: p-bits of outputs.
             b_inputs: A dict mapping Bob's wires to (clear) input bits.
+            upload: Optional; the message that uploaded the circuit, which
+                also carries Alice's inputs and the first OT message when
+                OTs are batched.
+            scheme: The garbling options of the circuit (see yao.evaluate).
         """
+        return messages.run(
+            self.send_result_steps(circuit, g_tables, pbits_out, b_inputs,
+                                   upload, **scheme),
+            self.socket)
+
+    async def send_result_async(self, circuit, g_tables, pbits_out, b_inputs,
+                                upload=None, **scheme):
+        """Asyncio version of send_result, on a util.AsyncSocket."""
+        return await messages.run_async(
+            self.send_result_steps(circuit, g_tables, pbits_out, b_inputs,
+                                   upload, **scheme),
+            self.socket)
+
+    def send_result_steps(self, circuit, g_tables, pbits_out, b_inputs,
+                          upload=None, **scheme):
+        """Protocol of send_result, see messages.run."""
+        if self.enabled and not self.batched:
+            stats.count("ot.transfers", len(b_inputs))
+        if self.batched:
+            b_inputs_encr = yield from self.receive_inputs_steps(upload,
+                                                                 b_inputs)
+            result = yield from messages.call(
+                yao.evaluate, circuit, g_tables, pbits_out,
+                upload["a_inputs"], b_inputs_encr, **scheme)
+            yield from messages.send(result)
+            return result
+
         # map from Alice's wires to (key, encr_bit) inputs
-        a_inputs = self.socket.receive()
+        a_inputs = yield from messages.receive()
         # map from Bob's wires to (key, encr_bit) inputs
         b_inputs_encr = {}
 
         logging.debug("Received Alice's inputs")
 
-        for w, b_input in b_inputs.items():
-            logging.debug(f"Sending gate ID {w}")
-            self.socket.send(w)
+        if self.extension:
+            msgs = yield from self.extension.receive(b_inputs)
+            b_inputs_encr = {w: yao.unpack_input(m) for w, m in msgs.items()}
+        else:
+            for w, b_input in b_inputs.items():
+                logging.debug(f"Sending gate ID {w}")
+                yield from messages.send(w)
 
-            if self.enabled:
-                b_inputs_encr[w] = pickle.loads(self.ot_evaluator(b_input))
-            else:
-                pair = self.socket.receive()
-                logging.debug(f"Received key pair, key {b_input} selected")
-                b_inputs_encr[w] = pair[b_input]
+                if self.enabled:
+                    b_inputs_encr[w] = yao.unpack_input(
+                        (yield from self.ot_evaluator(b_input)))
+                else:
+                    pair = yield from messages.receive()
+                    logging.debug(f"Received key pair, key {b_input} selected")
+                    b_inputs_encr[w] = pair[b_input]
 
-        result = yao.evaluate(circuit, g_tables, pbits_out, a_inputs,
-                              b_inputs_encr)
+        result = yield from messages.call(yao.evaluate, circuit, g_tables,
+                                          pbits_out, a_inputs, b_inputs_encr,
+                                          **scheme)
 
-        self.socket.send(result)
+        yield from messages.send(result)
 
         return result
 
+    def _get_result_batched(self, a_inputs, b_keys, upload, frames):
+        """Batched version of get_result, Alice's side."""
+        message = dict(upload, a_inputs=a_inputs)
+        pairs = {w: _pack_pair(b_keys[w]) for w in b_keys}
+
+        if not self.enabled:
+            message["ot"] = {w: (b_keys[w][0], b_keys[w][1]) for w in b_keys}
+            return (yield from messages.send_wait(message, frames, last=True))
+
+        if self.extension:
+            yield from messages.send(message, frames)
+            yield from self.extension.send(pairs)
+            return (yield from messages.receive(last=True))
+
+        # The protocol and its group are sent along with the first batch only
+        if self.protocol is None:
+            self.protocol = new_protocol(self.group)
+            message["ot_protocol"] = self.protocol.params()
+        protocol = self.protocol
+        secret, public = protocol.setup()
+        message["ot"] = public
+        logging.debug(f"Sending inputs and batched OT of {len(pairs)} wires")
+        wires, keys = yield from messages.send_wait(message, frames)
+
+        encrypted = protocol.reply(secret, public, keys,
+                                   [pairs[w] for w in wires])
+        return (yield from messages.send_wait(encrypted, last=True))
+
+    def receive_inputs(self, upload, b_inputs):
+        """Return the labels of Bob's inputs with batched OT, Bob's side.
+
+        Bob may then evaluate any number of circuits with them, and must
+        reply to Alice's get_result with the results.
+
+        Args:
+            upload: The message Alice sent with get_result.
+            b_inputs: A dict mapping IDs of Bob's inputs, e.g. wires, to
+                (clear) input bits.
+
+        Returns:
+            A dict mapping the same IDs to (key, encr_bit) inputs.
+        """
+        return messages.run(self.receive_inputs_steps(upload, b_inputs),
+                            self.socket)
+
+    async def receive_inputs_async(self, upload, b_inputs):
+        """Asyncio version of receive_inputs, on a util.AsyncSocket."""
+        return await messages.run_async(
+            self.receive_inputs_steps(upload, b_inputs), self.socket)
+
+    def receive_inputs_steps(self, upload, b_inputs):
+        """Protocol of receive_inputs, see messages.run."""
+        if not self.enabled:
+            pairs = upload["ot"]
+            return {w: pairs[w][b] for w, b in b_inputs.items()}
+        stats.count("ot.transfers", len(b_inputs))
+
+        if self.extension:
+            msgs = yield from self.extension.receive(b_inputs)
+            return {w: yao.unpack_input(m) for w, m in msgs.items()}
+
+        if "ot_protocol" in upload:
+            self.protocol = load_protocol(upload["ot_protocol"])
+        protocol, public = self.protocol, upload["ot"]
+        wires = list(b_inputs)
+        bits = [b_inputs[w] for w in wires]
+
+        secrets, keys = protocol.query(public, bits)
+        encrypted = yield from messages.send_wait((wires, keys))
+        msgs = protocol.decrypt(public, secrets, bits, encrypted)
+        return {w: yao.unpack_input(m) for w, m in zip(wires, msgs)}
+
     def ot_garbler(self, msgs):
-        """Oblivious transfer, Alice's side.
+        """Oblivious transfer, Alice's side (protocol steps).
 
         Args:
             msgs: A pair (msg1, msg2) to suggest to Bob.
         """
         logging.debug("OT protocol started")
-        G = util.PrimeGroup()
-        self.socket.send_wait(G)
-
-        # OT protocol based on Nigel Smart’s "Cryptography Made Simple"
-        c = G.gen_pow(G.rand_int())
-        h0 = self.socket.send_wait(c)
-        h1 = G.mul(c, G.inv(h0))
-        k = G.rand_int()
-        c1 = G.gen_pow(k)
-        e0 = util.xor_bytes(msgs[0], self.ot_hash(G.pow(h0, k), len(msgs[0])))
-        e1 = util.xor_bytes(msgs[1], self.ot_hash(G.pow(h1, k), len(msgs[1])))
-
-        self.socket.send((c1, e0, e1))
+        if self.protocol is None:
+            self.protocol = new_protocol(self.group)
+        protocol = self.protocol
+        yield from messages.send_wait(protocol.params())
+
+        secret, public = protocol.setup()
+        keys = yield from messages.send_wait(public)
+        encrypted = protocol.reply(secret, public, [keys], [msgs])
+
+        yield from messages.send(encrypted[0])
         logging.debug("OT protocol ended")
 
     def ot_evaluator(self, b):
-        """Oblivious transfer, Bob's side.
+        """Oblivious transfer, Bob's side (protocol steps).
 
         Args:
             b: Bob's input bit used to select one of Alice's messages.
@@ -102,18 +272,13 @@ class ObliviousTransfer:
             The message selected by Bob.
         """
         logging.debug("OT protocol started")
-        G = self.socket.receive()
-        self.socket.send(True)
-
-        # OT protocol based on Nigel Smart’s "Cryptography Made Simple"
-        c = self.socket.receive()
-        x = G.rand_int()
-        x_pow = G.gen_pow(x)
-        h = (x_pow, G.mul(c, G.inv(x_pow)))
-        c1, e0, e1 = self.socket.send_wait(h[b])
-        e = (e0, e1)
-        ot_hash = self.ot_hash(G.pow(c1, x), len(e[b]))
-        mb = util.xor_bytes(e[b], ot_hash)
+        protocol = load_protocol((yield from messages.receive()))
+        yield from messages.send(True)
+
+        public = yield from messages.receive()
+        secrets, keys = protocol.query(public, [b])
+        encrypted = yield from messages.send_wait(keys[0])
+        mb = protocol.decrypt(public, secrets, [b], [encrypted])[0]
 
         logging.debug("OT protocol ended")
         return mb
@@ -124,3 +289,338 @@ class ObliviousTransfer:
         key_length = (pub_key.bit_length() + 7) // 8  # key length in bytes
         bytes = pub_key.to_bytes(key_length, byteorder="big")
         return hashlib.shake_256(bytes).digest(msg_length)
+
+
+class SmartOT:
+    """Batched OT based on Nigel Smart’s "Cryptography Made Simple".
+
+    A batch of OTs takes three messages: the sender's public element c, the
+    receiver's keys h, and the sender's encrypted pairs (c1, e0, e1).
+
+    Args:
+        G: The prime group.
+    """
+    def __init__(self, G):
+        self.G = G
+
+    def params(self):
+        """Return the parameters of the protocol, see load_protocol."""
+        G = self.G
+        return "smart", G.prime, G.generator, G.exponent_bits
+
+    @stats.timed("ot.setup")
+    def setup(self):
+        """Return the sender's (secret, public) of a batch."""
+        return None, self.G.gen_pow(self.G.rand_int())
+
+    @stats.timed("ot.query")
+    def query(self, c, bits):
+        """Select messages of a batch of OTs, receiver's side.
+
+        Args:
+            c: The sender's public element.
+            bits: The receiver's choice bits.
+
+        Returns:
+            A pair (xs, hs) of the receiver's secret exponents and the
+            keys to send.
+        """
+        G = self.G
+        xs = [G.rand_int() for _ in bits]
+        hs = []
+        for b, x in zip(bits, xs):
+            x_pow = G.gen_pow(x)
+            hs.append(G.mul(c, G.inv(x_pow)) if b else x_pow)
+        return xs, hs
+
+    @stats.timed("ot.reply")
+    def reply(self, secret, c, hs, msgs):
+        """Encrypt the messages of a batch of OTs, sender's side.
+
+        Args:
+            secret: The sender's secret of the batch (unused).
+            c: The sender's public element.
+            hs: The keys received from the receiver.
+            msgs: A list of pairs (msg0, msg1) of bytes.
+
+        Returns:
+            The list of (c1, e0, e1) to send to the receiver.
+        """
+        G = self.G
+        encrypted = []
+        for h0, (msg0, msg1) in zip(hs, msgs):
+            h1 = G.mul(c, G.inv(h0))
+            k = G.rand_int()
+            e0 = util.xor_bytes(msg0, ObliviousTransfer.ot_hash(
+                G.pow(h0, k), len(msg0)))
+            e1 = util.xor_bytes(msg1, ObliviousTransfer.ot_hash(
+                G.pow(h1, k), len(msg1)))
+            encrypted.append((G.gen_pow(k), e0, e1))
+        return encrypted
+
+    @stats.timed("ot.decrypt")
+    def decrypt(self, c, xs, bits, encrypted):
+        """Decrypt the selected messages of a batch of OTs, receiver's side.
+
+        Args:
+            c: The sender's public element.
+            xs: The receiver's secret exponents.
+            bits: The receiver's choice bits.
+            encrypted: The list of (c1, e0, e1) received from the sender.
+
+        Returns:
+            The list of selected messages.
+        """
+        msgs = []
+        for b, x, (c1, e0, e1) in zip(bits, xs, encrypted):
+            e = (e0, e1)[b]
+            ot_hash = ObliviousTransfer.ot_hash(self.G.pow(c1, x), len(e))
+            msgs.append(util.xor_bytes(e, ot_hash))
+        return msgs
+
+
+class ChouOrlandiOT:
+    """Batched "simplest OT" of Chou and Orlandi on Curve25519.
+
+    The sender publishes A = aG once per batch, the receiver sends
+    B = bG or A + bG for each OT, and messages are hidden with hashes of
+    aB, a(B - A) and, on the receiver's side, bA. Only x-coordinates of
+    multiples are hashed, see util.Curve25519. Same interface as SmartOT.
+    """
+    def __init__(self):
+        self.curve = util.Curve25519()
+
+    def params(self):
+        """Return the parameters of the protocol, see load_protocol."""
+        return ("chou-orlandi",)
+
+    @stats.timed("ot.setup")
+    def setup(self):
+        """Return the sender's (a, A) of a batch."""
+        a = self.curve.rand_scalar()
+        return a, self.curve.gen_mul(a)
+
+    @stats.timed("ot.query")
+    def query(self, A, bits):
+        """Select messages of a batch of OTs, receiver's side.
+
+        Returns:
+            A pair of the receiver's secrets (b, B) and the points B to send.
+        """
+        curve = self.curve
+        if not curve.is_point(A):
+            raise ValueError("Invalid point received from the OT sender")
+        secrets = []
+        for bit in bits:
+            b = curve.rand_scalar()
+            B = curve.gen_mul(b)
+            secrets.append((b, curve.add(A, B) if bit else B))
+        return secrets, [B for _, B in secrets]
+
+    @stats.timed("ot.reply")
+    def reply(self, a, A, Bs, msgs):
+        """Encrypt the messages of a batch of OTs, sender's side.
+
+        Returns:
+            The list of (e0, e1) to send to the receiver.
+        """
+        curve = self.curve
+        neg_A = curve.neg(A)
+        encrypted = []
+        for B, (msg0, msg1) in zip(Bs, msgs):
+            if not curve.is_point(B):
+                raise ValueError("Invalid point received from the OT receiver")
+            key0 = self.ot_hash(A, B, curve.mul_x(B, a), len(msg0))
+            key1 = self.ot_hash(A, B, curve.mul_x(curve.add(B, neg_A), a),
+                                len(msg1))
+            encrypted.append((util.xor_bytes(msg0, key0),
+                              util.xor_bytes(msg1, key1)))
+        return encrypted
+
+    @stats.timed("ot.decrypt")
+    def decrypt(self, A, secrets, bits, encrypted):
+        """Decrypt the selected messages of a batch of OTs, receiver's side.
+
+        Returns:
+            The list of selected messages.
+        """
+        msgs = []
+        for bit, (b, B), pair in zip(bits, secrets, encrypted):
+            e = pair[bit]
+            key = self.ot_hash(A, B, self.curve.mul_x(A, b), len(e))
+            msgs.append(util.xor_bytes(e, key))
+        return msgs
+
+    @staticmethod
+    def ot_hash(A, B, shared, msg_length):
+        """Hash a shared x-coordinate along with the public points."""
+        size = util.SCALAR_SIZE
+        data = A[0].to_bytes(size, "little") + B[0].to_bytes(size, "little")
+        return hashlib.shake_256(data + shared).digest(msg_length)
+
+
+def load_protocol(params):
+    """Return the public-key OT protocol of parameters sent by the other
+    party, see SmartOT.params and ChouOrlandiOT.params."""
+    if params[0] == "chou-orlandi":
+        return ChouOrlandiOT()
+    if params[0] == "smart":
+        _, prime, generator, exponent_bits = params
+        return SmartOT(util.PrimeGroup(prime, generator, exponent_bits))
+    raise ValueError(f"Unknown OT protocol '{params[0]}'")
+
+
+def _pack_pair(keys):
+    """Return the messages of the OT of a pair of (key, encr_bit) inputs."""
+    return yao.pack_input(*keys[0]), yao.pack_input(*keys[1])
+
+
+def new_protocol(group):
+    """Return a public-key OT protocol for a group name in OT_GROUPS.
+
+    'x25519' is Chou-Orlandi OT on Curve25519, 'modp' the OT of Nigel Smart
+    in the precomputed 2048-bit group of RFC 3526 and 'prime' the same OT in
+    a random 64-bit prime group, generated once by the caller.
+    """
+    if group == "x25519":
+        return ChouOrlandiOT()
+    if group == "modp":
+        return SmartOT(util.PrimeGroup(util.MODP_PRIME, util.MODP_GENERATOR,
+                                       util.MODP_EXPONENT_BITS))
+    return SmartOT(util.PrimeGroup())
+
+
+class OTExtension:
+    """IKNP OT extension, with Alice as sender and Bob as receiver.
+
+    The first call runs SECURITY_PARAMETER base OTs with reversed roles: Bob
+    sends pairs of random seeds and Alice selects one seed of each pair with
+    her secret bits s. Then any batch of OTs only costs hashes and XORs: Bob
+    expands his seeds into a matrix T whose rows t_j he keeps, Alice obtains
+    q_j = t_j ^ (r_j * s) where r_j is Bob's choice bit, and hides the
+    messages of OT j with H(j, q_j) and H(j, q_j ^ s).
+
+    Methods are protocol steps (see messages.run) of the protocols of
+    ObliviousTransfer, both sides running them in the same order. Each batch
+    starts with Bob's turn to send a message, i.e. right after Alice sent one.
+
+    Args:
+        group: Optional; the group of base OTs chosen by Bob (see OT_GROUPS).
+    """
+    def __init__(self, group="x25519"):
+        self.group = group
+        self.seeds = None  # Alice's selected seeds, or Bob's pairs of seeds
+        self.secret = None  # Alice's secret bits s
+        self.batch = 0  # number of batches, to expand seeds into new bits
+        self.count = 0  # number of OTs, to hash each OT with a new index
+
+    def send(self, msgs):
+        """Send a batch of messages to Bob, Alice's side.
+
+        Args:
+            msgs: A dict mapping IDs of OTs to pairs (msg0, msg1) of bytes.
+        """
+        if self.seeds is None:
+            yield from self._base_ot_receiver()
+
+        # Bob sends the IDs of OTs in order, along with the matrix U
+        ids, matrix_u = yield from messages.receive()
+        num_ots = len(ids)
+        matrix_q = self._expand(self.seeds, num_ots)
+        matrix_q = matrix_q ^ self.secret[:, None] * matrix_u
+        rows_q = self._transpose(matrix_q, num_ots)
+        self.batch += 1
+        secret = np.packbits(self.secret)
+
+        logging.debug(f"OT extension of {num_ots} OTs")
+        encrypted = []
+        with stats.timer("ot.extension.hash"):
+            for j, (i, row) in enumerate(zip(ids, rows_q)):
+                msg0, msg1 = msgs[i]
+                index = self.count + j
+                encrypted.append((
+                    util.xor_bytes(msg0, self.ot_hash(index, row, len(msg0))),
+                    util.xor_bytes(msg1, self.ot_hash(index, row ^ secret,
+                                                      len(msg1))),
+                ))
+        self.count += num_ots
+        yield from messages.send(encrypted)
+
+    def receive(self, choices):
+        """Receive a batch of messages from Alice, Bob's side.
+
+        Args:
+            choices: A dict mapping IDs of OTs to Bob's choice bits.
+
+        Returns:
+            A dict mapping IDs of OTs to the selected messages.
+        """
+        if self.seeds is None:
+            yield from self._base_ot_sender()
+
+        ids = list(choices)
+        num_ots = len(ids)
+        bits = np.packbits(np.array([choices[i] for i in ids], dtype=np.uint8))
+        matrix_t = self._expand([s[0] for s in self.seeds], num_ots)
+        matrix_u = matrix_t ^ self._expand([s[1] for s in self.seeds],
+                                           num_ots) ^ bits
+        rows_t = self._transpose(matrix_t, num_ots)
+        self.batch += 1
+
+        encrypted = yield from messages.send_wait((ids, matrix_u))
+        result = {}
+        with stats.timer("ot.extension.hash"):
+            for j, (i, row) in enumerate(zip(ids, rows_t)):
+                msg = encrypted[j][choices[i]]
+                result[i] = util.xor_bytes(
+                    msg, self.ot_hash(self.count + j, row, len(msg)))
+        self.count += num_ots
+        return result
+
+    @stats.timed("ot.extension.expand")
+    def _expand(self, seeds, num_ots):
+        """Expand seeds into the columns of a (seeds, bytes) bit matrix."""
+        size = (num_ots + 7) // 8
+        counter = self.batch.to_bytes(8, "big")
+        columns = b"".join(hashlib.shake_256(seed + counter).digest(size)
+                           for seed in seeds)
+        return np.frombuffer(columns, dtype=np.uint8).reshape(len(seeds), size)
+
+    @staticmethod
+    @stats.timed("ot.extension.transpose")
+    def _transpose(matrix, num_ots):
+        """Return the rows of OTs, as bytes, of a bit matrix of columns."""
+        bits = np.unpackbits(matrix, axis=1)[:, :num_ots]
+        rows = np.packbits(bits.T, axis=1)
+        return list(rows)
+
+    def _base_ot_sender(self):
+        """Send pairs of random seeds with base OTs, Bob's side."""
+        logging.debug("Base OTs started")
+        self.seeds = [(os.urandom(SEED_SIZE), os.urandom(SEED_SIZE))
+                      for _ in range(SECURITY_PARAMETER)]
+        protocol = new_protocol(self.group)
+        secret, public = protocol.setup()
+        keys = yield from messages.send_wait((protocol.params(), public))
+        yield from messages.send_wait(protocol.reply(secret, public, keys,
+                                                     self.seeds))
+        logging.debug("Base OTs ended")
+
+    def _base_ot_receiver(self):
+        """Select one seed of each pair with base OTs, Alice's side."""
+        logging.debug("Base OTs started")
+        self.secret = np.frombuffer(os.urandom(SECURITY_PARAMETER),
+                                    dtype=np.uint8) & 1
+        params, public = yield from messages.receive()
+        protocol = load_protocol(params)
+        secrets, keys = protocol.query(public, self.secret)
+        encrypted = yield from messages.send_wait(keys)
+        self.seeds = protocol.decrypt(public, secrets, self.secret, encrypted)
+        yield from messages.send(True)
+        logging.debug("Base OTs ended")
+
+    @staticmethod
+    def ot_hash(index, row, msg_length):
+        """Correlation robust hash of the row of an OT."""
+        data = index.to_bytes(8, "big") + bytes(row)
+        return hashlib.shake_256(data).digest(msg_length)
@@ -0,0 +1,214 @@
+import compiler
+import os
+import stats
+import yao
+from array import array
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+SPLIT_GATES = 20000  # circuits with more gates are split across workers
+TASK_GATES = 1024  # minimum number of gates of a task garbling a level
+KEYS_SIZE = 2 * yao.LABEL_SIZE  # size in bytes of the pair of keys of a wire
+
+# Arrays of the shared buffer of a split circuit, before keys and tables
+SHARED_ARRAYS = (("gate_types", "B"), ("gate_in_a", "i"), ("gate_in_b", "i"),
+                 ("gate_ids", "q"), ("order", "i"), ("rows", "q"))
+
+_shared = None  # the shared buffer a worker is attached to
+
+
+class ParallelGarbler:
+    """Garble circuits on several cores with a pool of processes (AES only).
+
+    Small circuits are garbled whole, one per worker. A circuit of more than
+    SPLIT_GATES gates is split by levels: the gates of a level only read
+    wires of lower levels, hence each level is split into ranges of gates
+    garbled in parallel. The gates of the circuit, the keys of every wire
+    and the garbled tables live in a shared memory buffer, each gate writing
+    its rows at a precomputed offset, so that tasks only carry a range.
+
+    Args:
+        workers: Optional; the number of processes (the number of cores by
+            default).
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.executor = ProcessPoolExecutor(self.workers)
+
+    @stats.timed("garble.parallel")
+    def garble(self, circuits, free_xor=False, half_gates=False):
+        """Garble circuits in parallel.
+
+        Args:
+            circuits: A list of CompiledCircuit.
+            free_xor: Optional; garble circuits with Free-XOR.
+            half_gates: Optional; garble non-linear gates with half-gates.
+
+        Returns:
+            The list of yao.GarbledCircuit, in the order of 'circuits'.
+        """
+        scheme = {"free_xor": free_xor, "half_gates": half_gates}
+        garbled = [self.executor.submit(yao.GarbledCircuit, c, **scheme)
+                   if c.num_gates <= SPLIT_GATES else None for c in circuits]
+        for index, circuit in enumerate(circuits):
+            if garbled[index] is None:
+                garbled[index] = self._garble_split(circuit, **scheme)
+        return [g if isinstance(g, yao.GarbledCircuit) else g.result()
+                for g in garbled]
+
+    def _garble_split(self, circuit, free_xor, half_gates):
+        """Garble a circuit by levels, splitting levels across workers."""
+        garbled_circuit = yao.GarbledCircuit(circuit, free_xor=free_xor,
+                                             half_gates=half_gates,
+                                             stream=True)
+        free_xor = garbled_circuit.free_xor
+        order, levels = _levels(circuit)
+        rows = array("q", [0]) * circuit.num_gates  # first row of each gate
+        num_rows = 0
+        for k, gate_type in enumerate(circuit.gate_types):
+            rows[k] = num_rows
+            num_rows += yao.table_rows(gate_type, free_xor, half_gates)
+
+        arrays = [getattr(circuit, name) for name, _ in SHARED_ARRAYS[:4]]
+        arrays += [order, rows]
+        layout = {}  # map from name to (start, end) in the shared buffer
+        size = 0
+        for (name, _), values in zip(SHARED_ARRAYS, arrays):
+            layout[name] = (size, size + len(values) * values.itemsize)
+            size = layout[name][1]
+        layout["keys"] = (size, size + KEYS_SIZE * circuit.num_wires)
+        layout["tables"] = (layout["keys"][1],
+                            layout["keys"][1] + num_rows * yao.LABEL_SIZE)
+
+        shared = shared_memory.SharedMemory(create=True,
+                                            size=max(layout["tables"][1], 1))
+        try:
+            for (name, _), values in zip(SHARED_ARRAYS, arrays):
+                start, end = layout[name]
+                shared.buf[start:end] = values.tobytes()
+            start = layout["keys"][0]
+            for key0, key1 in garbled_circuit.keys[:circuit.num_inputs]:
+                shared.buf[start:start + KEYS_SIZE] = key0 + key1
+                start += KEYS_SIZE
+
+            task = (shared.name, layout, circuit.num_inputs,
+                    garbled_circuit.offset, half_gates)
+            for start, end in zip(levels, levels[1:]):
+                step = max(TASK_GATES, -(-(end - start) // self.workers))
+                if end - start <= step:  # a small level: garble it here
+                    _garble_gates(*task, start, end, shared)
+                    continue
+                wait([self.executor.submit(_garble_gates, *task, k,
+                                           min(k + step, end))
+                      for k in range(start, end, step)])
+
+            keys = shared.buf[slice(*layout["keys"])]
+            garbled_circuit.keys = [
+                (bytes(keys[i:i + yao.LABEL_SIZE]),
+                 bytes(keys[i + yao.LABEL_SIZE:i + KEYS_SIZE]))
+                for i in range(0, len(keys), KEYS_SIZE)
+            ]
+            garbled_circuit.pbits[circuit.num_inputs:] = [
+                yao.lsb(key0)
+                for key0, _ in garbled_circuit.keys[circuit.num_inputs:]
+            ]
+            garbled_circuit.garbled_tables = bytearray(
+                shared.buf[slice(*layout["tables"])])
+            del keys
+        finally:
+            shared.close()
+            shared.unlink()
+        return garbled_circuit
+
+    def close(self):
+        """Shut the pool of processes down."""
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _levels(circuit):
+    """Sort gates by level, the level of a gate being its depth.
+
+    Returns:
+        A pair (order, levels): the positions of gates sorted by level, and
+        the bounds of levels in 'order', level i being
+        order[levels[i]:levels[i + 1]].
+    """
+    depth = array("i", [0]) * circuit.num_wires
+    buckets = []
+    gates = zip(circuit.gate_types, circuit.gate_in_a, circuit.gate_in_b)
+    for k, (gate_type, in_a, in_b) in enumerate(gates):
+        level = depth[in_a]
+        if gate_type != compiler.NOT:
+            level = max(level, depth[in_b])
+        depth[circuit.num_inputs + k] = level + 1
+        if level == len(buckets):
+            buckets.append([])
+        buckets[level].append(k)
+
+    order = array("i")
+    levels = [0]
+    for bucket in buckets:
+        order.extend(bucket)
+        levels.append(len(order))
+    return order, levels
+
+
+def _garble_gates(name, layout, num_inputs, offset, half_gates, start, end,
+                  shared=None):
+    """Garble the gates order[start:end] of a circuit in a shared buffer.
+
+    Args:
+        name: The name of the shared buffer, see ParallelGarbler.
+        layout: The map from arrays of the buffer to their (start, end).
+        num_inputs: The number of input wires of the circuit.
+        offset: The global Free-XOR offset R, None without Free-XOR.
+        half_gates: Garble non-linear gates with half-gates.
+        start: The first position in 'order' to garble.
+        end: The position in 'order' to stop at.
+        shared: Optional; the shared buffer, attached by name if None.
+    """
+    global _shared
+    if shared is None:
+        if _shared is None or _shared.name != name:
+            if _shared is not None:
+                _shared.close()
+            _shared = shared_memory.SharedMemory(name)
+        shared = _shared
+
+    buffer = shared.buf
+    views = {field: buffer[slice(*layout[field])].cast(typecode)
+             for field, typecode in SHARED_ARRAYS}
+    keys = buffer[slice(*layout["keys"])]
+    tables = buffer[slice(*layout["tables"])]
+    gate_types, gate_in_a = views["gate_types"], views["gate_in_a"]
+    gate_in_b, gate_ids, rows = (views["gate_in_b"], views["gate_ids"],
+                                 views["rows"])
+
+    def get_keys(wire):
+        i = wire * KEYS_SIZE
+        return (bytes(keys[i:i + yao.LABEL_SIZE]),
+                bytes(keys[i + yao.LABEL_SIZE:i + KEYS_SIZE]))
+
+    for k in views["order"][start:end]:
+        gate_type = gate_types[k]
+        keys_out, garbled_table = yao.garble_gate(
+            gate_ids[k], gate_type, get_keys(gate_in_a[k]),
+            get_keys(gate_in_b[k]) if gate_type != compiler.NOT else None,
+            offset, half_gates)
+        i = (num_inputs + k) * KEYS_SIZE
+        keys[i:i + KEYS_SIZE] = keys_out[0] + keys_out[1]
+        if garbled_table is not None:
+            i = rows[k] * yao.LABEL_SIZE
+            tables[i:i + len(garbled_table)] = garbled_table
+
+    for view in views.values():
+        view.release()
+    keys.release()
+    tables.release()
@@ -0,0 +1,196 @@
+import cache
+import hashlib
+import logging
+import mmap
+import os
+import threading
+import yao
+
+POOL_DIR = "pool"  # default directory of pools
+POOL_SIZE = 16  # default number of instances of each circuit
+LOW_WATER = 4  # default number of instances below which a pool is refilled
+REFILL_INTERVAL = 1.0  # seconds between checks of the background worker
+SUFFIX = ".gc"  # suffix of instances ready to be taken
+
+
+class GarblingPool:
+    """A bounded on-disk pool of pre-garbled instances of a circuit file.
+
+    Each instance of a circuit is a file holding its packed garbled tables,
+    the pair of labels of each input wire, then the p-bits of input wires and
+    of output wires. Files are published atomically once written, and an
+    instance is memory-mapped and deleted when taken, hence used at most once
+    even if several processes share the pool. Only the AES backend is
+    supported.
+
+    Args:
+        circuits: The circuit file, JSON or Bristol Fashion.
+        directory: Optional; the directory of pools (POOL_DIR by default).
+        size: Optional; the number of instances of each circuit to keep.
+        low_water: Optional; the number of instances of a circuit below
+            which the background worker refills its pool.
+        free_xor: Optional; garble circuits with Free-XOR (False by default).
+        half_gates: Optional; garble non-linear gates with half-gates
+            (False by default).
+        optimize: Optional; garble optimized circuits, see
+            optimizer.optimize (False by default).
+        cache_dir: Optional; the cache of compiled circuits, see
+            cache.load_circuits.
+    """
+    def __init__(self, circuits, directory=POOL_DIR, size=POOL_SIZE,
+                 low_water=LOW_WATER, free_xor=False, half_gates=False,
+                 optimize=False, cache_dir=cache.CACHE_DIR):
+        if not 0 <= low_water <= size:
+            raise ValueError("The low-water mark must be in [0, size]")
+        with open(circuits, "rb") as circuit_file:
+            data = circuit_file.read()
+
+        self.size = size
+        self.low_water = low_water
+        self.free_xor = free_xor or half_gates
+        self.half_gates = half_gates
+        name, self.circuits = cache.load_circuits(circuits, cache_dir,
+                                                  optimize=optimize)
+
+        # One directory per circuit, invalidated by any change of the file
+        scheme = ("half_gates" if half_gates else
+                  "free_xor" if free_xor else "row_reduced")
+        if optimize:
+            scheme += "-optimized"
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        root = os.path.join(directory, f"{name}-{digest}-{scheme}")
+        self.directories = [os.path.join(root, str(i))
+                            for i in range(len(self.circuits))]
+        for path in self.directories:
+            os.makedirs(path, exist_ok=True)
+
+        self._counter = 0  # number of instances written by this pool
+        self._refill = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get_scheme(self):
+        """Return the garbling options of the instances of the pool."""
+        return {
+            "free_xor": self.free_xor,
+            "half_gates": self.half_gates,
+            "backend": "aes",
+        }
+
+    def count(self, index):
+        """Return the number of instances of the index-th circuit."""
+        return sum(name.endswith(SUFFIX)
+                   for name in os.listdir(self.directories[index]))
+
+    def fill(self):
+        """Garble instances until the pool of every circuit is full."""
+        for index in range(len(self.circuits)):
+            for _ in range(self.size - self.count(index)):
+                if self._stop.is_set():
+                    return
+                self._put(index)
+
+    def take(self, index):
+        """Take an instance of the index-th circuit out of the pool.
+
+        Args:
+            index: The position of the circuit in the circuit file.
+
+        Returns:
+            A dict with the packed garbled tables (a memoryview of the
+            mapped file), the keys of input wires and the p-bits of input and
+            output wires, keyed by original wire IDs; or None if the pool of
+            the circuit is empty.
+        """
+        directory = self.directories[index]
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(SUFFIX):
+                continue
+            # Renaming claims the instance, unless another process did first
+            path = os.path.join(directory, name)
+            taken = path + ".taken"
+            try:
+                os.rename(path, taken)
+            except FileNotFoundError:
+                continue
+            with open(taken, "rb") as instance_file:
+                buffer = mmap.mmap(instance_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            os.unlink(taken)  # the mapping outlives the file
+
+            if self.count(index) < self.low_water:
+                self._refill.set()
+            return self._load(index, buffer)
+
+        logging.info(f"Empty pool for circuit {self.circuits[index].id}")
+        self._refill.set()
+        return None
+
+    def start(self):
+        """Start the background worker filling the pool."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background worker."""
+        if self._thread is not None:
+            self._stop.set()
+            self._refill.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        """Refill the pool whenever it runs low, until stopped."""
+        while not self._stop.is_set():
+            if any(self.count(i) < self.low_water
+                   for i in range(len(self.circuits))):
+                self.fill()
+            self._refill.wait(REFILL_INTERVAL)
+            self._refill.clear()
+
+    def _put(self, index):
+        """Garble an instance of the index-th circuit and add it."""
+        circuit = self.circuits[index]
+        garbled_circuit = yao.GarbledCircuit(circuit, free_xor=self.free_xor,
+                                             half_gates=self.half_gates)
+        inputs = range(circuit.num_inputs)
+        keys, pbits = garbled_circuit.keys, garbled_circuit.pbits
+
+        self._counter += 1
+        name = f"{os.getpid()}-{id(self)}-{self._counter}"
+        path = os.path.join(self.directories[index], name)
+        with open(path + ".tmp", "wb") as instance_file:
+            instance_file.write(garbled_circuit.get_garbled_tables())
+            instance_file.write(b"".join(keys[w][0] + keys[w][1]
+                                         for w in inputs))
+            instance_file.write(bytes(pbits[w] for w in inputs))
+            instance_file.write(bytes(pbits[w] for w in circuit.out))
+        os.replace(path + ".tmp", path + SUFFIX)  # publish the instance
+
+    def _load(self, index, buffer):
+        """Return the instance of the index-th circuit stored in a buffer."""
+        circuit = self.circuits[index]
+        num_rows = sum(yao.table_rows(t, self.free_xor, self.half_gates)
+                       for t in circuit.gate_types)
+        view = memoryview(buffer)
+        tables_end = num_rows * yao.LABEL_SIZE
+        keys_end = tables_end + 2 * yao.LABEL_SIZE * circuit.num_inputs
+        labels = view[tables_end:keys_end]
+        pbits = view[keys_end:]
+        inputs = circuit.wire_ids[:circuit.num_inputs]
+
+        keys = {}
+        for w, wire in enumerate(inputs):
+            pair = labels[2 * w * yao.LABEL_SIZE:2 * (w + 1) * yao.LABEL_SIZE]
+            keys[wire] = (bytes(pair[:yao.LABEL_SIZE]),
+                          bytes(pair[yao.LABEL_SIZE:]))
+        wires = list(inputs) + circuit.original(circuit.out)
+
+        return {
+            "garbled_tables": view[:tables_end],
+            "keys": keys,
+            "pbits": dict(zip(wires, pbits)),
+            "buffer": buffer,
+        }
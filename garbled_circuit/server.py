@@ -0,0 +1,280 @@
+import asyncio
+import collections
+import contextlib
+import logging
+import multiprocessing
+import os
+import util
+import zmq
+import zmq.asyncio
+
+SESSION_TIMEOUT = 300  # seconds of silence of Alice before a session is dropped
+READY = b"ready"  # control message of a worker waiting for a session
+
+
+class SessionSocket(util.Socket):
+    """A worker's socket to the Alice of a session, through the broker.
+
+    Messages of the worker's DEALER socket carry the session ID first, so
+    that the broker routes them to the right Alice.
+
+    Args:
+        socket: The DEALER socket of the worker.
+        session_id: The session ID, i.e. the routing ID of Alice's socket.
+        first: The frames of the message opening the session.
+        timeout: Optional; seconds to wait for a message of Alice before
+            raising TimeoutError.
+    """
+    def __init__(self, socket, session_id, first, timeout=SESSION_TIMEOUT):
+        self.socket = socket
+        self.poller = zmq.Poller()
+        self.poller.register(self.socket, zmq.POLLIN)
+        self.session_id = session_id
+        self.timeout = timeout
+        self._first = first
+
+    def _send_parts(self, parts):
+        self.socket.send_multipart([self.session_id] + list(parts), copy=False)
+
+    def _receive_parts(self):
+        if self._first is not None:
+            parts, self._first = self._first, None
+            return parts
+        if not self.poller.poll(self.timeout * 1000):
+            raise TimeoutError(f"Session {self.session_id.hex()} timed out")
+        session_id, *parts = self.socket.recv_multipart(copy=False)
+        if session_id.bytes != self.session_id:
+            raise ValueError("Message of another session")
+        return parts
+
+
+class AsyncSessionSocket(util.AsyncSocket):
+    """The asyncio socket of a session of an AsyncEvaluatorServer.
+
+    Args:
+        socket: The ROUTER socket of the server.
+        session_id: The session ID, i.e. the routing ID of Alice's socket.
+        timeout: Optional; seconds to wait for a message of Alice before
+            raising TimeoutError.
+    """
+    def __init__(self, socket, session_id, timeout=SESSION_TIMEOUT):
+        self.socket = socket
+        self.turn = asyncio.Lock()
+        self.session_id = session_id
+        self.timeout = timeout
+        self.queue = asyncio.Queue()  # frames of the messages of Alice
+
+    async def _send_parts(self, parts):
+        await self.socket.send_multipart([self.session_id, b""] + list(parts),
+                                         copy=False)
+
+    async def _receive_parts(self):
+        try:
+            return await asyncio.wait_for(self.queue.get(), self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Session {self.session_id.hex()} timed out")
+
+
+class EvaluatorServer:
+    """Bob's server, evaluating circuits of several Alices at once.
+
+    A broker binds a ROUTER socket for Alices, whose routing IDs are their
+    session IDs (see util.GarblerSocket), and a ROUTER socket for a pool of
+    worker processes, each one serving a session at a time with a Bob. The
+    first message of a session is routed to a free worker, which keeps the
+    session until Alice ends it (or times out); sessions wait for a worker
+    while 'max_sessions' are running.
+
+    Args:
+        evaluator: A callable creating a session's evaluator from its
+            socket, e.g. a main.Bob with its options, whose 'handle' method
+            handles a message and returns False at the end of the session,
+            and whose 'close' method releases its resources afterwards.
+        endpoint: Optional; the endpoint to listen on.
+        workers: Optional; the number of worker processes (one per core by
+            default).
+        max_sessions: Optional; the maximum number of concurrent sessions
+            ('workers' by default).
+        timeout: Optional; seconds of silence of Alice before a worker drops
+            her session.
+    """
+    def __init__(self, evaluator, endpoint=f"tcp://*:{util.LOCAL_PORT}",
+                 workers=None, max_sessions=None, timeout=SESSION_TIMEOUT):
+        self.evaluator = evaluator
+        self.workers = workers or os.cpu_count()
+        self.max_sessions = min(max_sessions or self.workers, self.workers)
+        self.timeout = timeout
+
+        context = zmq.Context()
+        self.frontend = context.socket(zmq.ROUTER)
+        self.frontend.bind(endpoint)
+        self.backend = context.socket(zmq.ROUTER)
+        port = self.backend.bind_to_random_port("tcp://127.0.0.1")
+        self.backend_endpoint = f"tcp://127.0.0.1:{port}"
+
+        self.free = collections.deque()  # IDs of workers waiting for sessions
+        self.sessions = {}  # map from session ID to the ID of its worker
+        self.busy = {}  # map from worker ID to the ID of its session
+        self.waiting = collections.deque()  # first messages of sessions
+
+    def serve(self):
+        """Start the workers and route messages until interrupted."""
+        processes = [
+            multiprocessing.Process(
+                target=_work,
+                args=(self.backend_endpoint, f"worker-{i}".encode(),
+                      self.evaluator, self.timeout),
+                daemon=True)
+            for i in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+
+        poller = zmq.Poller()
+        poller.register(self.frontend, zmq.POLLIN)
+        poller.register(self.backend, zmq.POLLIN)
+        logging.info(f"Serving with {self.workers} workers, at most "
+                     f"{self.max_sessions} sessions")
+        try:
+            while True:
+                events = dict(poller.poll())
+                if self.backend in events:
+                    self._from_worker(self.backend.recv_multipart(copy=False))
+                if self.frontend in events:
+                    self._from_alice(self.frontend.recv_multipart(copy=False))
+                self._dispatch()
+        except KeyboardInterrupt:
+            logging.info("Stop serving")
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+
+    def _from_alice(self, parts):
+        """Route a message of Alice: [session ID, empty delimiter, frames]."""
+        session_id, _, *frames = parts
+        session_id = session_id.bytes
+        worker_id = self.sessions.get(session_id)
+        if worker_id is None:
+            self.waiting.append((session_id, frames))
+        else:
+            self.backend.send_multipart([worker_id, session_id] + frames,
+                                        copy=False)
+
+    def _from_worker(self, parts):
+        """Route a message of a worker: [worker ID, session ID, frames], or
+        [worker ID, empty, READY] once the worker waits for a session."""
+        worker_id, session_id, *frames = (part.bytes if i < 2 else part
+                                          for i, part in enumerate(parts))
+        if session_id:
+            self.frontend.send_multipart([session_id, b""] + frames,
+                                         copy=False)
+            return
+        session_id = self.busy.pop(worker_id, None)
+        if session_id is not None:
+            del self.sessions[session_id]
+            logging.info(f"Session {session_id.hex()} ended")
+        self.free.append(worker_id)
+
+    def _dispatch(self):
+        """Open waiting sessions on free workers, up to max_sessions."""
+        while (self.waiting and self.free
+               and len(self.sessions) < self.max_sessions):
+            session_id, frames = self.waiting.popleft()
+            worker_id = self.free.popleft()
+            self.sessions[session_id] = worker_id
+            self.busy[worker_id] = session_id
+            logging.info(f"Session {session_id.hex()} opened on "
+                         f"{worker_id.decode()}")
+            self.backend.send_multipart([worker_id, session_id] + frames,
+                                        copy=False)
+
+
+def _work(endpoint, worker_id, evaluator, timeout):
+    """Serve sessions one at a time, as a worker of an EvaluatorServer."""
+    socket = zmq.Context().socket(zmq.DEALER)
+    socket.setsockopt(zmq.ROUTING_ID, worker_id)
+    socket.connect(endpoint)
+    try:
+        while True:
+            socket.send_multipart([b"", READY])
+            session_id, *first = socket.recv_multipart(copy=False)
+            session = SessionSocket(socket, session_id.bytes, first, timeout)
+            bob = evaluator(socket=session)
+            try:
+                while bob.handle(session.receive()):
+                    pass
+            except Exception:
+                logging.exception(f"Session {session_id.bytes.hex()} failed")
+            finally:
+                bob.close()
+    except KeyboardInterrupt:
+        pass
+
+
+class AsyncEvaluatorServer:
+    """Bob's server, evaluating circuits of several Alices in one process.
+
+    Unlike EvaluatorServer, sessions are asyncio tasks sharing the ROUTER
+    socket of Alices, each one with its own Bob, and evaluations run in
+    threads (see messages.call) while other sessions exchange messages.
+
+    Args:
+        evaluator: A callable creating a session's evaluator from its
+            socket, e.g. a main.Bob with its options, whose 'handle_async'
+            method handles a message and returns False at the end of the
+            session, and whose 'close' method releases its resources
+            afterwards.
+        endpoint: Optional; the endpoint to listen on.
+        max_sessions: Optional; the maximum number of concurrent sessions,
+            other sessions waiting for one to end (no limit by default).
+        timeout: Optional; seconds of silence of Alice before her session
+            is dropped.
+    """
+    def __init__(self, evaluator, endpoint=f"tcp://*:{util.LOCAL_PORT}",
+                 max_sessions=None, timeout=SESSION_TIMEOUT):
+        self.evaluator = evaluator
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self.socket = zmq.asyncio.Context.instance().socket(zmq.ROUTER)
+        self.socket.bind(endpoint)
+        self.sessions = {}  # map from session ID to AsyncSessionSocket
+
+    async def serve(self):
+        """Route messages of Alices to their sessions until cancelled."""
+        limit = (asyncio.Semaphore(self.max_sessions) if self.max_sessions
+                 else contextlib.nullcontext())
+        tasks = set()
+        logging.info(f"Serving at most {self.max_sessions or 'any'} sessions")
+        while True:
+            session_id, _, *frames = await self.socket.recv_multipart(
+                copy=False)
+            session_id = session_id.bytes
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = AsyncSessionSocket(self.socket, session_id,
+                                             self.timeout)
+                self.sessions[session_id] = session
+                task = asyncio.create_task(self._run(session, limit))
+                tasks.add(task)  # keep a reference until the task is done
+                task.add_done_callback(tasks.discard)
+            session.queue.put_nowait(frames)
+
+    async def _run(self, session, limit):
+        """Serve a session, once there are less than max_sessions."""
+        session_id = session.session_id.hex()
+        bob = None
+        try:
+            async with limit:
+                logging.info(f"Session {session_id} opened")
+                bob = self.evaluator(socket=session)
+                while await bob.handle_async(await session.receive()):
+                    pass
+            logging.info(f"Session {session_id} ended")
+        except Exception:
+            logging.exception(f"Session {session_id} failed")
+        finally:
+            if bob is not None:
+                bob.close()
+            del self.sessions[session.session_id]
@@ -0,0 +1,252 @@
+import numpy as np
+import compiler
+
+WORD_BITS = 64  # assignments of inputs packed in each word
+CHUNK_WORDS = 1024  # words simulated at once, i.e. 65536 assignments
+ALL_ONES = np.uint64((1 << WORD_BITS) - 1)
+EXHAUSTIVE_INPUTS = 24  # circuits compared on all assignments up to this
+RANDOM_WORDS = 16 * CHUNK_WORDS  # words of random assignments otherwise
+
+# Words of the exhaustive assignments of an input of the 6 lowest bits of
+# assignment numbers: bit j of the word of bit s is bit s of j
+PATTERNS = (
+    np.uint64(0xAAAAAAAAAAAAAAAA),
+    np.uint64(0xCCCCCCCCCCCCCCCC),
+    np.uint64(0xF0F0F0F0F0F0F0F0),
+    np.uint64(0xFF00FF00FF00FF00),
+    np.uint64(0xFFFF0000FFFF0000),
+    np.uint64(0xFFFFFFFF00000000),
+)
+
+# Bitwise operation of each gate type and whether its result is inverted,
+# NOT gates having no operation
+OPERATIONS = {
+    compiler.NOT: (None, True),
+    compiler.XOR: (np.bitwise_xor, False),
+    compiler.XNOR: (np.bitwise_xor, True),
+    compiler.AND: (np.bitwise_and, False),
+    compiler.OR: (np.bitwise_or, False),
+    compiler.NAND: (np.bitwise_and, True),
+    compiler.NOR: (np.bitwise_or, True),
+}
+
+
+def simulate(circuit, inputs):
+    """Evaluate a circuit in the clear on many assignments of its inputs.
+
+    Assignments are bitsliced: bit j of word i of a wire is its value in
+    assignment WORD_BITS * i + j, hence each gate is one bitwise operation
+    on the words of its inputs, whatever the number of assignments. Words
+    of wires are dropped once no later gate reads them.
+
+    Args:
+        circuit: A CompiledCircuit, or a dict containing circuit spec.
+        inputs: A (num_inputs, words) array of uint64, the words of each
+            input wire in dense order (see compiler.CompiledCircuit).
+
+    Returns:
+        The (outputs, words) array of the words of the output wires.
+    """
+    if isinstance(circuit, dict):
+        circuit = compiler.compile_circuit(circuit)
+    inputs = np.asarray(inputs, dtype=np.uint64)
+    if len(inputs) != circuit.num_inputs:
+        raise ValueError(f"Circuit '{circuit.id}' has {circuit.num_inputs} "
+                         f"inputs, got {len(inputs)}")
+    num_inputs = circuit.num_inputs
+    values = list(inputs) + [None] * circuit.num_gates  # words of each wire
+    last_use = compiler.last_uses(circuit)
+
+    gates = zip(circuit.gate_types, circuit.gate_in_a, circuit.gate_in_b)
+    for k, (gate_type, in_a, in_b) in enumerate(gates):
+        operation, invert = OPERATIONS[gate_type]
+        if operation is None:
+            value = np.invert(values[in_a])
+        else:
+            value = operation(values[in_a], values[in_b])
+            if invert:
+                np.invert(value, out=value)
+        values[num_inputs + k] = value
+
+        if last_use[in_a] == k:
+            values[in_a] = None
+        if in_b >= 0 and last_use[in_b] == k:
+            values[in_b] = None
+
+    if not len(circuit.out):
+        return np.empty((0, inputs.shape[1]), dtype=np.uint64)
+    return np.stack([values[w] for w in circuit.out])
+
+
+def exhaustive_inputs(num_inputs, start, words):
+    """Return the words of consecutive assignments of inputs.
+
+    In assignment n, input i is bit 'num_inputs - 1 - i' of n, i.e. the
+    first input is the most significant bit, as in the truth tables of
+    main.LocalTest.
+
+    Args:
+        num_inputs: The number of inputs.
+        start: The first assignment, a multiple of WORD_BITS.
+        words: The number of words, i.e. of WORD_BITS assignments.
+
+    Returns:
+        The (num_inputs, words) array of uint64 of the inputs.
+    """
+    if start % WORD_BITS:
+        raise ValueError(f"Assignments start at multiples of {WORD_BITS}")
+    index = np.arange(start // WORD_BITS, start // WORD_BITS + words,
+                      dtype=np.uint64)  # the number of each word
+    inputs = np.empty((num_inputs, words), dtype=np.uint64)
+    for i in range(num_inputs):
+        bit = num_inputs - 1 - i
+        if bit < len(PATTERNS):
+            inputs[i] = PATTERNS[bit]
+        else:
+            inputs[i] = (index >> np.uint64(bit - len(PATTERNS))) & 1
+            inputs[i] *= ALL_ONES
+    return inputs
+
+
+def random_inputs(num_inputs, words, rng=None):
+    """Return the words of random assignments of inputs.
+
+    The first two assignments are all zeros and all ones, corner cases
+    uniform assignments would miss, e.g. equal inputs of equality circuits.
+
+    Args:
+        num_inputs: The number of inputs.
+        words: The number of words, i.e. of WORD_BITS assignments.
+        rng: Optional; the numpy.random.Generator to draw words from.
+
+    Returns:
+        The (num_inputs, words) array of uint64 of the inputs.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    inputs = rng.integers(0, 1 << WORD_BITS, size=(num_inputs, words),
+                          dtype=np.uint64)
+    if words:
+        inputs[:, 0] &= ~np.uint64(0b11)
+        inputs[:, 0] |= np.uint64(0b10)
+    return inputs
+
+
+def pack_bits(bits):
+    """Pack assignments of bits into words, see unpack_bits.
+
+    Args:
+        bits: An (assignments, wires) array of bits.
+
+    Returns:
+        The (wires, words) array of uint64, unused bits of the last words
+        being 0.
+    """
+    bits = np.asarray(bits, dtype=np.uint8)
+    count, num_wires = bits.shape
+    words = -(-count // WORD_BITS)
+    padded = np.zeros((num_wires, words * WORD_BITS), dtype=np.uint8)
+    padded[:, :count] = bits.T
+    packed = np.packbits(padded, axis=1, bitorder="little")
+    return packed.view("<u8").astype(np.uint64)
+
+
+def unpack_bits(words, count):
+    """Unpack the first assignments of words into bits.
+
+    Args:
+        words: A (wires, words) array of uint64.
+        count: The number of assignments to unpack.
+
+    Returns:
+        The (count, wires) array of bits, as uint8.
+    """
+    data = np.ascontiguousarray(words, dtype="<u8").view(np.uint8)
+    return np.unpackbits(data, axis=1, count=count, bitorder="little").T
+
+
+def truth_table(circuit, chunk_words=CHUNK_WORDS):
+    """Simulate a circuit on all the assignments of its inputs.
+
+    Assignments are simulated by chunks, hence memory does not grow with
+    the number of inputs, only time does.
+
+    Args:
+        circuit: A CompiledCircuit, or a dict containing circuit spec.
+        chunk_words: Optional; the number of words of each chunk.
+
+    Yields:
+        Pairs (start, outputs) of the first assignment of each chunk, see
+        exhaustive_inputs, and the (outputs, words) array of its outputs.
+        The last words may hold assignments beyond 2**num_inputs.
+    """
+    if isinstance(circuit, dict):
+        circuit = compiler.compile_circuit(circuit)
+    total = 1 << circuit.num_inputs
+    for start in range(0, total, chunk_words * WORD_BITS):
+        words = min(chunk_words, -(-(total - start) // WORD_BITS))
+        inputs = exhaustive_inputs(circuit.num_inputs, start, words)
+        yield start, simulate(circuit, inputs)
+
+
+def first_difference(words_a, words_b, count):
+    """Return the first assignment whose words differ, or None.
+
+    Args:
+        words_a: A (wires, words) array of uint64.
+        words_b: A (wires, words) array of uint64 of the same shape.
+        count: The number of assignments to compare.
+    """
+    diff = np.bitwise_or.reduce(words_a ^ words_b, axis=0)
+    for i in np.flatnonzero(diff):
+        bit = (int(diff[i]) & -int(diff[i])).bit_length() - 1
+        assignment = WORD_BITS * int(i) + bit
+        return assignment if assignment < count else None
+    return None
+
+
+def compare(circuit_a, circuit_b, max_exhaustive=EXHAUSTIVE_INPUTS,
+            random_words=RANDOM_WORDS, rng=None):
+    """Simulate two circuits of the same inputs on the same assignments.
+
+    Circuits of at most 'max_exhaustive' inputs are simulated on all the
+    assignments of their inputs, other circuits on random assignments.
+
+    Args:
+        circuit_a: A CompiledCircuit, or a dict containing circuit spec.
+        circuit_b: A CompiledCircuit, or a dict containing circuit spec,
+            of the same inputs and outputs as 'circuit_a', e.g. optimized.
+        max_exhaustive: Optional; the maximum number of inputs of circuits
+            simulated on all assignments (EXHAUSTIVE_INPUTS by default).
+        random_words: Optional; the number of words of random assignments
+            of other circuits (RANDOM_WORDS by default).
+        rng: Optional; the numpy.random.Generator of random assignments.
+
+    Returns:
+        A pair (count, bits) of the number of assignments compared and the
+        array of input bits of the first assignment whose outputs differ,
+        None if there is none.
+    """
+    if isinstance(circuit_a, dict):
+        circuit_a = compiler.compile_circuit(circuit_a)
+    if isinstance(circuit_b, dict):
+        circuit_b = compiler.compile_circuit(circuit_b)
+    num_inputs = circuit_a.num_inputs
+    if (circuit_b.num_inputs != num_inputs
+            or len(circuit_b.out) != len(circuit_a.out)):
+        raise ValueError(f"Circuits '{circuit_a.id}' and '{circuit_b.id}' "
+                         f"differ in inputs or outputs")
+
+    exhaustive = num_inputs <= max_exhaustive
+    total = 1 << num_inputs if exhaustive else random_words * WORD_BITS
+    for start in range(0, total, CHUNK_WORDS * WORD_BITS):
+        words = min(CHUNK_WORDS, -(-(total - start) // WORD_BITS))
+        if exhaustive:
+            inputs = exhaustive_inputs(num_inputs, start, words)
+        else:
+            inputs = random_inputs(num_inputs, words, rng)
+        count = min(words * WORD_BITS, total - start)
+        difference = first_difference(simulate(circuit_a, inputs),
+                                      simulate(circuit_b, inputs), count)
+        if difference is not None:
+            return total, unpack_bits(inputs, difference + 1)[difference]
+    return total, None
@@ -0,0 +1,201 @@
+import cProfile
+import collections
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+_enabled = False  # whether counters and timers record anything
+_profile_dir = None  # the directory of cProfile captures, None to skip them
+_trace_memory = False  # whether phases record their peak of memory
+
+_lock = threading.Lock()  # guards counters and timers shared by threads
+_capture = threading.Lock()  # held by the phase being captured, if any
+_local = threading.local()  # depth of the phases running in each thread
+_counters = collections.Counter()
+_timers = {}  # map from phase to [calls, seconds, peak bytes]
+_profiles = {}  # map from phase to its cProfile.Profile
+
+_NO_TIMER = contextlib.nullcontext()
+
+
+def enable(profile_dir=None, trace_memory=False):
+    """Start recording counters and timers, which cost nothing until then.
+
+    Args:
+        profile_dir: Optional; the directory where dump writes a cProfile
+            capture of each phase, '<phase>.prof'.
+        trace_memory: Optional; record the peak of memory allocated by each
+            phase with tracemalloc, which slows everything down.
+    """
+    global _enabled, _profile_dir, _trace_memory
+    _enabled = True
+    _profile_dir = profile_dir
+    _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """Stop recording, keeping what was recorded."""
+    global _enabled
+    _enabled = False
+    if _trace_memory:
+        tracemalloc.stop()
+
+
+def reset():
+    """Drop what was recorded."""
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+        _profiles.clear()
+
+
+def count(name, value=1):
+    """Add 'value' to a counter."""
+    if _enabled:
+        with _lock:
+            _counters[name] += value
+
+
+def count_message(name, parts):
+    """Count a message and its size in bytes, e.g. 'socket.sent'.
+
+    Args:
+        name: The prefix of the counters '<name>.messages' and
+            '<name>.bytes'.
+        parts: The frames of the message, bytes or zmq.Frame objects.
+    """
+    if _enabled:
+        size = sum(memoryview(part).nbytes for part in parts)
+        with _lock:
+            _counters[name + ".messages"] += 1
+            _counters[name + ".bytes"] += size
+
+
+class _Timer:
+    """Time a phase, capturing it if it is the outermost phase of its thread
+    and no other thread is being captured (see timer). Phases that may not
+    be captured, e.g. waits, do not count in the depth of phases."""
+    __slots__ = ("name", "capture", "depth", "start", "memory")
+
+    def __init__(self, name, capture):
+        self.name = name
+        self.capture = capture
+        self.depth = None  # depth of the phase, if it may be captured
+
+    def __enter__(self):
+        if self.capture:
+            depth = getattr(_local, "depth", 0)
+            _local.depth = depth + 1
+            self.depth = depth
+            self.capture = (depth == 0
+                            and (_profile_dir is not None or _trace_memory)
+                            and _capture.acquire(blocking=False))
+        if self.capture:
+            if _trace_memory:
+                tracemalloc.reset_peak()
+                self.memory = tracemalloc.get_traced_memory()[0]
+            if _profile_dir is not None:
+                with _lock:
+                    profile = _profiles.setdefault(self.name,
+                                                   cProfile.Profile())
+                profile.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        if self.depth is not None:
+            _local.depth = self.depth
+        peak = 0
+        if self.capture:
+            if _profile_dir is not None:
+                _profiles[self.name].disable()
+            if _trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - self.memory
+            _capture.release()
+        with _lock:
+            timer = _timers.setdefault(self.name, [0, 0.0, 0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], peak)
+
+
+def timer(name, capture=True):
+    """Return a context manager timing a phase, e.g. 'garble'.
+
+    Nested phases are timed too, but only the outermost phase of a thread
+    is profiled and traced, one thread at a time: the others are timed
+    only. Timers cost a call returning a null context while stats are
+    disabled.
+
+    Args:
+        name: The name of the phase.
+        capture: Optional; whether the phase may be profiled and traced,
+            False for waits, e.g. of sockets, which would keep phases of
+            other threads and asyncio tasks from being captured.
+    """
+    if not _enabled:
+        return _NO_TIMER
+    return _Timer(name, capture)
+
+
+def timed(name):
+    """Decorator timing each call of a function as a phase, see timer."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Timer(name, True):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """Return what was recorded as a dict of JSON types.
+
+    Returns:
+        A dict with 'counters', mapping names to values, and 'timers',
+        mapping phases to their number of calls, total seconds and, when
+        tracing memory, peak of bytes allocated by a call.
+    """
+    with _lock:
+        timers = {}
+        for name, (calls, seconds, peak) in sorted(_timers.items()):
+            timers[name] = {"calls": calls, "seconds": seconds}
+            if _trace_memory:
+                timers[name]["peak_bytes"] = peak
+        return {"counters": dict(sorted(_counters.items())),
+                "timers": timers}
+
+
+def dump(path):
+    """Write the snapshot as JSON, and the cProfile captures of phases.
+
+    Args:
+        path: The JSON file, '-' for the standard output.
+    """
+    results = snapshot()
+    if _profile_dir is not None:
+        os.makedirs(_profile_dir, exist_ok=True)
+        results["profiles"] = {}
+        with _lock:
+            for name, profile in sorted(_profiles.items()):
+                profile_path = os.path.join(_profile_dir, f"{name}.prof")
+                profile.dump_stats(profile_path)
+                results["profiles"][name] = profile_path
+
+    if path == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(path, "w") as json_file:
+            json.dump(results, json_file, indent=2)
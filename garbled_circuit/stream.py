@@ -0,0 +1,100 @@
+import logging
+import os
+import threading
+import util
+import yao
+
+
+class StreamWriter:
+    """Alice's end of streams of garbled tables.
+
+    A background thread garbles a circuit and sends its packed rows in
+    chunks as they are produced. Sending blocks while Bob is STREAM_HWM
+    chunks behind, hence garbling never runs far ahead of evaluation.
+    Streams are sent to the port of the session's stream socket, which Bob
+    reports when Alice opens the stream (see open).
+
+    Args:
+        host: Optional; Bob's host.
+        chunk_size: Optional; the size in bytes of chunks.
+    """
+    def __init__(self, host=util.SERVER_HOST, chunk_size=yao.CHUNK_SIZE):
+        self.host = host
+        self.socket = None  # connected by open
+        self.chunk_size = chunk_size
+        self._thread = None
+
+    def open(self, port):
+        """Connect to the stream socket of Bob's session on 'port'."""
+        self.socket = util.StreamSenderSocket(port, host=self.host)
+
+    def start(self, garbled_circuit):
+        """Start streaming a circuit created with GarbledCircuit(stream=True).
+
+        Returns:
+            The ID of the stream, to send to Bob along with the circuit.
+        """
+        if self.socket is None:
+            raise RuntimeError("The stream is not open")
+        self.join()
+        stream_id = os.urandom(8).hex()
+        self._thread = threading.Thread(target=self._run,
+                                        args=(garbled_circuit, stream_id),
+                                        daemon=True)
+        self._thread.start()
+        return stream_id
+
+    def join(self):
+        """Wait until the current stream is sent."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, garbled_circuit, stream_id):
+        """Send the chunks of a circuit, then the p-bits of its outputs."""
+        circuit = garbled_circuit.circuit
+        try:
+            for chunk in garbled_circuit.stream_garbled_tables(self.chunk_size):
+                self.socket.send({"stream": stream_id, "chunk": chunk},
+                                 ["chunk"])
+        except Exception:
+            logging.exception(f"Streaming {circuit.id} failed")
+            raise
+        self.socket.send({
+            "stream": stream_id,
+            "pbits_out": garbled_circuit.get_pbits_out(),
+        })
+        logging.debug(f"Streamed {circuit.id}")
+
+
+class StreamReader:
+    """Bob's end of the stream of a circuit, an iterator over its chunks.
+
+    The last message of a stream carries the p-bits of outputs, which fill
+    'pbits_out' once the iterator is exhausted: yao.evaluate checks the end
+    of the stream before decoding outputs. Messages of other streams, e.g.
+    left by an interrupted run, are skipped.
+
+    Args:
+        socket: A util.StreamReceiverSocket.
+        stream_id: The ID of the stream.
+    """
+    def __init__(self, socket, stream_id):
+        self.socket = socket
+        self.stream_id = stream_id
+        self.pbits_out = {}
+        self.done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self.done:
+            msg = self.socket.receive()
+            if msg["stream"] != self.stream_id:
+                continue
+            if "chunk" in msg:
+                return msg["chunk"]
+            self.pbits_out.update(msg["pbits_out"])
+            self.done = True
+        raise StopIteration
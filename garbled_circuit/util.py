@@ -1,14 +1,24 @@
+import asyncio
+import collections
 import json
 import operator
+import os
 import random
 import secrets
+import stats
 import sympy
+import wire
 import zmq
+import zmq.asyncio
+from cryptography.hazmat.primitives.asymmetric.x25519 import (
+    X25519PrivateKey, X25519PublicKey)
 
 # SOCKET
 LOCAL_PORT = 4080
 SERVER_HOST = "localhost"
 SERVER_PORT = 4080
+STREAM_HWM = 16  # number of chunks of a stream queued on each side
+SESSION_ID_SIZE = 16  # size in bytes of the session IDs of garblers
 
 
 class Socket:
@@ -17,16 +27,48 @@ class Socket:
         self.poller = zmq.Poller()
         self.poller.register(self.socket, zmq.POLLIN)
 
-    def send(self, msg):
-        self.socket.send_pyobj(msg)
+    def send(self, msg, frames=()):
+        """Send a message, encoded with wire.encode.
+
+        Args:
+            msg: The object to send: None, bool, int, float, str, bytes-like,
+                list, tuple, dict, array.array, numpy.ndarray or
+                compiler.CompiledCircuit values.
+            frames: Optional; keys of the dict 'msg' whose values are buffers
+                to send as separate zero-copy frames, whatever their size.
+        """
+        parts = wire.encode(msg, frames)
+        stats.count_message("socket.sent", parts)
+        with stats.timer("socket.send", capture=False):
+            self._send_parts(parts)
 
     def receive(self):
-        return self.socket.recv_pyobj()
-
-    def send_wait(self, msg):
-        self.send(msg)
+        """Receive a message, frames being returned as memoryviews.
+
+        The time spent in receive, mostly waiting for the other party, is
+        the 'socket.receive' phase of stats.
+        """
+        with stats.timer("socket.receive", capture=False):
+            parts = self._receive_parts()
+        stats.count_message("socket.received", parts)
+        return wire.decode(parts)
+
+    def _send_parts(self, parts):
+        """Send the frames of a message."""
+        self.socket.send_multipart(parts, copy=False)
+
+    def _receive_parts(self):
+        """Receive the frames of a message, as zmq.Frame objects."""
+        return self.socket.recv_multipart(copy=False)
+
+    def send_wait(self, msg, frames=()):
+        self.send(msg, frames)
         return self.receive()
 
+    def close(self):
+        """Close the socket, dropping unsent messages."""
+        self.socket.close(linger=0)
+
     """
     From https://stackoverflow.com/questions/17174001/stop-pyzmq-receiver-by-keyboardinterrupt
     """
@@ -36,7 +78,7 @@ class Socket:
             while True:
                 obj = dict(self.poller.poll(timetick))
                 if self.socket in obj and obj[self.socket] == zmq.POLLIN:
-                    yield self.socket.recv_pyobj()
+                    yield self.receive()
         except KeyboardInterrupt:
             pass
 
@@ -48,13 +90,141 @@ class EvaluatorSocket(Socket):
 
 
 class GarblerSocket(Socket):
+    """Alice's socket, whose routing ID is a random session ID, so that an
+    evaluator server (see server.EvaluatorServer) tells sessions apart."""
     def __init__(self, endpoint=f"tcp://{SERVER_HOST}:{SERVER_PORT}"):
         super().__init__(zmq.REQ)
+        self.session_id = secrets.token_bytes(SESSION_ID_SIZE)
+        self.socket.setsockopt(zmq.ROUTING_ID, self.session_id)
+        self.socket.connect(endpoint)
+
+
+class StreamSenderSocket(Socket):
+    """Alice's end of streams, sending blocks once 'hwm' messages queue."""
+    def __init__(self, port, host=SERVER_HOST, hwm=STREAM_HWM):
+        super().__init__(zmq.PUSH)
+        self.socket.setsockopt(zmq.SNDHWM, hwm)
+        self.socket.connect(f"tcp://{host}:{port}")
+
+
+class StreamReceiverSocket(Socket):
+    """Bob's end of streams, queuing at most 'hwm' received messages.
+
+    Each session binds its own socket on a random port, which Bob reports
+    to Alice, so that sessions of a server never share a stream.
+    """
+    def __init__(self, address="tcp://*", hwm=STREAM_HWM):
+        super().__init__(zmq.PULL)
+        self.socket.setsockopt(zmq.RCVHWM, hwm)
+        self.port = self.socket.bind_to_random_port(address)
+
+
+class AsyncSocket:
+    """A socket of asyncio coroutines, built on zmq.asyncio.
+
+    Messages are the ones of Socket, hence asyncio parties talk to blocking
+    ones. Protocols run on asyncio sockets with messages.run_async, taking
+    the turn of the socket in order to send their messages.
+    """
+    def __init__(self, socket_type):
+        self.socket = zmq.asyncio.Context.instance().socket(socket_type)
+        self.turn = asyncio.Lock()  # held by the protocol sending messages
+
+    async def send(self, msg, frames=()):
+        """Send a message, see Socket.send.
+
+        Returns:
+            None, or the future of the reply for requesting sockets.
+        """
+        parts = wire.encode(msg, frames)
+        stats.count_message("socket.sent", parts)
+        with stats.timer("socket.send", capture=False):
+            await self._send_parts(parts)
+
+    async def receive(self):
+        """Receive a message, see Socket.receive."""
+        with stats.timer("socket.receive", capture=False):
+            parts = await self._receive_parts()
+        stats.count_message("socket.received", parts)
+        return wire.decode(parts)
+
+    async def send_wait(self, msg, frames=()):
+        reply = await self.send(msg, frames)
+        return await (reply if reply is not None else self.receive())
+
+    async def _send_parts(self, parts):
+        await self.socket.send_multipart(parts, copy=False)
+
+    async def _receive_parts(self):
+        return await self.socket.recv_multipart(copy=False)
+
+
+class AsyncEvaluatorSocket(AsyncSocket):
+    """Bob's asyncio socket, see EvaluatorSocket."""
+    def __init__(self, endpoint=f"tcp://*:{LOCAL_PORT}"):
+        super().__init__(zmq.REP)
+        self.socket.bind(endpoint)
+
+
+class AsyncGarblerSocket(AsyncSocket):
+    """Alice's asyncio socket, with several requests in flight.
+
+    Unlike the REQ socket of GarblerSocket, a DEALER socket sends requests
+    without waiting for replies, which evaluators (REP or ROUTER sockets)
+    send back in order: each request returns the future of its reply.
+    """
+    def __init__(self, endpoint=f"tcp://{SERVER_HOST}:{SERVER_PORT}"):
+        super().__init__(zmq.DEALER)
+        self.session_id = secrets.token_bytes(SESSION_ID_SIZE)
+        self.socket.setsockopt(zmq.ROUTING_ID, self.session_id)
         self.socket.connect(endpoint)
+        self.replies = collections.deque()  # futures of pending replies
+        self._reader = None  # task receiving replies
+
+    async def send(self, msg, frames=()):
+        reply = asyncio.get_running_loop().create_future()
+        self.replies.append(reply)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read_replies())
+        parts = wire.encode(msg, frames)
+        stats.count_message("socket.sent", parts)
+        with stats.timer("socket.send", capture=False):
+            # The empty delimiter of REQ sockets
+            await self._send_parts([b""] + parts)
+        return reply
+
+    async def receive(self):
+        raise RuntimeError("Replies are the futures returned by send")
+
+    async def _read_replies(self):
+        """Resolve the futures of pending replies, in order."""
+        try:
+            while self.replies:
+                with stats.timer("socket.receive", capture=False):
+                    _, *parts = await self._receive_parts()
+                stats.count_message("socket.received", parts)
+                self.replies.popleft().set_result(wire.decode(parts))
+        except Exception as error:
+            while self.replies:
+                self.replies.popleft().set_exception(error)
 
 
 # PRIME GROUP
 PRIME_BITS = 64  # order of magnitude of prime in base 2
+# 2048-bit MODP group of RFC 3526, with generator 2
+MODP_PRIME = int(
+    "FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74"
+    "020BBEA63B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F1437"
+    "4FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED"
+    "EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF05"
+    "98DA48361C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB"
+    "9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B"
+    "E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF695581718"
+    "3995497CEA956AE515D2261898FA051015728E5A8AACAA68FFFFFFFFFFFFFFFF",
+    16,
+)
+MODP_GENERATOR = 2
+MODP_EXPONENT_BITS = 256  # short exponents, as advised by RFC 3526
 
 
 def next_prime(num):
@@ -79,12 +249,24 @@ def bits(num, width):
 
 
 class PrimeGroup:
-    """Cyclic abelian group of prime order 'prime'."""
-    def __init__(self, prime=None):
+    """Cyclic abelian group of prime order 'prime'.
+
+    Without parameters, a random prime and generator are generated, which
+    is slow: use known parameters (e.g. MODP_PRIME and MODP_GENERATOR) or
+    reuse the group where possible.
+
+    Args:
+        prime: Optional; the prime, random by default.
+        generator: Optional; a generator, searched for by default.
+        exponent_bits: Optional; the bit size of random exponents, which are
+            in [1, prime - 1] by default.
+    """
+    def __init__(self, prime=None, generator=None, exponent_bits=None):
         self.prime = prime or gen_prime(num_bits=PRIME_BITS)
         self.prime_m1 = self.prime - 1
         self.prime_m2 = self.prime - 2
-        self.generator = self.find_generator()
+        self.exponent_bits = exponent_bits
+        self.generator = generator or self.find_generator()
 
     def mul(self, num1, num2):
         "Multiply two elements." ""
@@ -100,10 +282,12 @@ class PrimeGroup:
 
     def inv(self, num):
         "Multiplicative inverse of an element." ""
-        return pow(num, self.prime_m2, self.prime)
+        return pow(num, -1, self.prime)
 
     def rand_int(self):  # random int in [1, prime-1]
         "Return an random int in [1, prime - 1]." ""
+        if self.exponent_bits:
+            return 1 + secrets.randbelow(2**self.exponent_bits - 1)
         return random.randint(1, self.prime_m1)
 
     def find_generator(self):  # find random generator for group
@@ -119,6 +303,75 @@ class PrimeGroup:
                 return candidate
 
 
+# CURVE25519
+CURVE_PRIME = 2**255 - 19
+CURVE_A = 486662  # curve y^2 = x^3 + A*x^2 + x
+CURVE_BASE_X = 9
+SQRT_M1 = pow(2, (CURVE_PRIME - 1) // 4, CURVE_PRIME)  # square root of -1
+SCALAR_SIZE = 32  # size in bytes of scalars and x-coordinates
+
+
+class Curve25519:
+    """Points of Curve25519 in affine Montgomery coordinates (x, y).
+
+    Scalar multiplications run in X25519, which only returns x-coordinates:
+    y is recovered with its canonical (even) sign, hence a point stands for
+    itself or its opposite. The x-coordinates of multiples of a point are
+    the same for both, so protocols only hash x-coordinates of multiples.
+    """
+    def rand_scalar(self):
+        """Return a random scalar, clamped by X25519."""
+        return os.urandom(SCALAR_SIZE)
+
+    def gen_mul(self, scalar):
+        """Multiply the base point by a scalar."""
+        key = X25519PrivateKey.from_private_bytes(scalar)
+        return self.lift_x(int.from_bytes(key.public_key().public_bytes_raw(),
+                                          "little"))
+
+    def mul_x(self, point, scalar):
+        """Return the x-coordinate, as bytes, of a multiple of a point."""
+        key = X25519PrivateKey.from_private_bytes(scalar)
+        peer = X25519PublicKey.from_public_bytes(
+            point[0].to_bytes(SCALAR_SIZE, "little"))
+        return key.exchange(peer)
+
+    def lift_x(self, x):
+        """Return the point with x-coordinate 'x' and an even y."""
+        p = CURVE_PRIME
+        rhs = (x * x * x + CURVE_A * x * x + x) % p
+        y = pow(rhs, (p + 3) // 8, p)
+        if y * y % p != rhs:
+            y = y * SQRT_M1 % p
+        if y * y % p != rhs:
+            raise ValueError(f"No point of Curve25519 has x = {x}")
+        return (x, p - y if y & 1 else y)
+
+    def is_point(self, point):
+        """Return whether a pair (x, y) is a point of the curve."""
+        x, y = point
+        p = CURVE_PRIME
+        return (0 <= x < p and 0 <= y < p
+                and (y * y - x * x * x - CURVE_A * x * x - x) % p == 0)
+
+    def add(self, point1, point2):
+        """Add two points, which must not be opposite."""
+        (x1, y1), (x2, y2) = point1, point2
+        p = CURVE_PRIME
+        if x1 == x2:
+            if (y1 + y2) % p == 0:
+                raise ValueError("The sum of opposite points is infinity")
+            slope = (3 * x1 * x1 + 2 * CURVE_A * x1 + 1) * pow(2 * y1, -1, p)
+        else:
+            slope = (y2 - y1) * pow(x2 - x1, -1, p)
+        x3 = (slope * slope - CURVE_A - x1 - x2) % p
+        return (x3, (slope * (x1 - x3) - y1) % p)
+
+    def neg(self, point):
+        """Return the opposite of a point."""
+        return (point[0], -point[1] % CURVE_PRIME)
+
+
 # HELPER FUNCTIONS
 def parse_json(json_path):
     with open(json_path) as json_file:
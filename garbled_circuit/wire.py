@@ -0,0 +1,650 @@
+import compiler
+import numpy as np
+import struct
+import sys
+from array import array
+
+MAGIC = b"GW"
+VERSION = 1
+HEADER = struct.Struct("<2sB")  # magic, version
+FRAME_SIZE = 4096  # blocks of at least this size are sent as frames
+LABEL_SIZE = 16  # size in bytes of labels, see yao.LABEL_SIZE
+MAX_DEPTH = 64  # nesting of decoded values, far below the recursion limit
+
+# Tags of values, followed by fixed-width fields (see encode)
+(NONE, FALSE, TRUE, INT8, INT32, INT64, BIGINT, FLOAT, BYTES, STR, LABEL,
+ FRAME, LIST, TUPLE, DICT, INTS, BLOBS, ROWS, ARRAY, NDARRAY,
+ CIRCUIT) = range(21)
+
+# Array codes: the struct format, of standard size, of items of arrays
+ARRAY_CODES = {}
+for _typecode in "bBhHiIlLqQ":
+    _code = {1: "b", 2: "h", 4: "i", 8: "q"}[array(_typecode).itemsize]
+    ARRAY_CODES[_typecode] = _code.upper() if _typecode.isupper() else _code
+TYPECODES = {}  # the first typecode of each array code, to decode arrays
+for _typecode, _code in ARRAY_CODES.items():
+    TYPECODES.setdefault(_code, _typecode)
+# Typecodes of the signed items of INTS values, by width
+INT_TYPECODES = {1: TYPECODES["b"], 2: TYPECODES["h"], 4: TYPECODES["i"],
+                 8: TYPECODES["q"]}
+NDARRAY_KINDS = "biuf"  # kinds of NumPy dtypes of NDARRAY values
+# Array codes of the arrays of compiler.CompiledCircuit, after id and
+# num_inputs (see compiler.compile_circuit)
+CIRCUIT_CODES = ("i", "i", "i", "B", "i", "i", "q", "q")
+
+_TAG_SIZE = struct.Struct("<BI")
+_TAG_INT8 = struct.Struct("<Bb")
+_TAG_INT32 = struct.Struct("<Bi")
+_TAG_INT64 = struct.Struct("<Bq")
+_TAG_FLOAT = struct.Struct("<Bd")
+_TAG_SIZE_SIZE = struct.Struct("<BII")
+_SIZE = struct.Struct("<I")
+_SIZE_SIZE = struct.Struct("<II")
+_INT8 = struct.Struct("<b")
+_INT32 = struct.Struct("<i")
+_INT64 = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+def encode(msg, frames=()):
+    """Return the frames of a message, in a versioned binary format.
+
+    The first frame holds a header (MAGIC, VERSION) and the encoded value,
+    the others hold large blocks of bytes the value refers to, sent without
+    copies. A value is a one-byte tag followed by fixed-width fields,
+    little-endian, counts and sizes being unsigned 32-bit integers:
+
+        NONE, FALSE, TRUE: nothing
+        INT8, INT32, INT64: the signed integer
+        BIGINT: the size, then the signed integer, e.g. a group element
+        FLOAT: the IEEE 754 double
+        BYTES, STR: the size, then the bytes (UTF-8 for STR)
+        LABEL: LABEL_SIZE bytes, i.e. a key of a wire
+        FRAME: the index of the frame holding the bytes
+        LIST, TUPLE: the count, then the items
+        DICT: the list of keys, then the list of values
+        INTS: the count and the width in bytes of items, then a block of
+            signed integers of this width, e.g. wire IDs or group elements
+        BLOBS: the count and the size of items, then a block of bytes of
+            this size, e.g. labels
+        ROWS: the count and the size of tuples, then a list of each item of
+            the tuples, e.g. pairs of labels
+        ARRAY: the array code (see ARRAY_CODES), then a block of items
+        NDARRAY: the size and string of the NumPy dtype, the number of
+            dimensions (one byte each), the dimensions, then a block of items
+        CIRCUIT: the fields of a compiler.CompiledCircuit
+
+    Blocks are BYTES, LABEL or FRAME values. Lists of ints, of bytes of the
+    same size or of tuples of the same size are INTS, BLOBS and ROWS values,
+    so that their items are encoded at once, unless items are empty.
+
+    Unlike pickle, decoding only builds these types, hence messages of
+    untrusted peers are safe to decode, and peers need not run Python.
+
+    Args:
+        msg: The value to send.
+        frames: Optional; keys of the dict 'msg' whose values are buffers
+            to send as frames, whatever their size.
+
+    Returns:
+        The list of frames, buffers of the message being frames themselves.
+    """
+    out = bytearray(HEADER.pack(MAGIC, VERSION))
+    parts = [out]
+    if frames:
+        out.append(DICT)
+        _encode_list(list(msg), out, parts)
+        out += _TAG_SIZE.pack(LIST, len(msg))
+        for key, value in msg.items():
+            if key in frames:
+                _encode_frame(value, out, parts)
+            else:
+                _encode_value(value, out, parts)
+    else:
+        _encode_value(msg, out, parts)
+    return parts
+
+
+def decode(parts):
+    """Return the message of frames, see encode.
+
+    Args:
+        parts: The frames of the message, e.g. zmq.Frame objects.
+
+    Returns:
+        The message, blocks sent as frames being memoryviews of them.
+    """
+    views = [memoryview(part) for part in parts]
+    view = views[0]
+    try:
+        magic, version = HEADER.unpack_from(view)
+    except struct.error:
+        raise ValueError("Truncated message") from None
+    if magic != MAGIC:
+        raise ValueError("Not a message of the wire format")
+    if version != VERSION:
+        raise ValueError(f"Unsupported version {version} of the wire "
+                         f"format, expected {VERSION}")
+    try:
+        msg, offset = _decode_value(view, HEADER.size, views)
+    except (struct.error, IndexError):
+        raise ValueError("Truncated message") from None
+    except TypeError as error:  # e.g. a list as a key of a dict
+        raise ValueError(f"Invalid message: {error}") from None
+    if offset != len(view):
+        raise ValueError("Trailing bytes after the message")
+    return msg
+
+
+def _encode_value(value, out, parts):
+    """Append the encoding of a value to 'out', frames to 'parts'."""
+    encoder = _ENCODERS.get(type(value))
+    if encoder is not None:
+        encoder(value, out, parts)
+    elif isinstance(value, np.generic):  # e.g. an item of a NumPy array
+        _encode_value(value.item(), out, parts)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} objects")
+
+
+def _encode_none(value, out, parts):
+    out.append(NONE)
+
+
+def _encode_bool(value, out, parts):
+    out.append(TRUE if value else FALSE)
+
+
+def _encode_int(value, out, parts):
+    if -0x80 <= value < 0x80:
+        out += _TAG_INT8.pack(INT8, value)
+    elif -0x80000000 <= value < 0x80000000:
+        out += _TAG_INT32.pack(INT32, value)
+    elif -0x8000000000000000 <= value < 0x8000000000000000:
+        out += _TAG_INT64.pack(INT64, value)
+    else:
+        size = value.bit_length() // 8 + 1  # with the sign bit
+        out += _TAG_SIZE.pack(BIGINT, size)
+        out += value.to_bytes(size, "little", signed=True)
+
+
+def _encode_float(value, out, parts):
+    out += _TAG_FLOAT.pack(FLOAT, value)
+
+
+def _encode_bytes(value, out, parts):
+    size = len(value) if type(value) is not memoryview else value.nbytes
+    if size >= FRAME_SIZE:
+        _encode_frame(value, out, parts)
+    elif size == LABEL_SIZE:
+        out.append(LABEL)
+        out += value
+    else:
+        out += _TAG_SIZE.pack(BYTES, size)
+        out += value
+
+
+def _encode_frame(value, out, parts):
+    out += _TAG_SIZE.pack(FRAME, len(parts))
+    parts.append(value)
+
+
+def _encode_str(value, out, parts):
+    data = value.encode()
+    out += _TAG_SIZE.pack(STR, len(data))
+    out += data
+
+
+def _encode_list(value, out, parts):
+    types = set(map(type, value))
+    if len(types) == 1:
+        item_type = types.pop()
+        if item_type is int:
+            _encode_ints(value, out, parts)
+            return
+        if item_type is bytes or item_type is tuple:
+            sizes = set(map(len, value))
+            if len(sizes) == 1 and 0 not in sizes:
+                size = sizes.pop()
+                if item_type is bytes:
+                    out += _TAG_SIZE_SIZE.pack(BLOBS, len(value), size)
+                    _encode_bytes(b"".join(value), out, parts)
+                else:
+                    out += _TAG_SIZE_SIZE.pack(ROWS, len(value), size)
+                    for column in zip(*value):
+                        _encode_list(list(column), out, parts)
+                return
+    out += _TAG_SIZE.pack(LIST, len(value))
+    for item in value:
+        _encode_value(item, out, parts)
+
+
+def _encode_ints(value, out, parts):
+    """Encode a list of ints as an INTS value, of the smallest width."""
+    low, high = min(value), max(value)
+    width = max(high.bit_length(), (~low).bit_length()) // 8 + 1
+    if width <= 8:
+        width = 1 << (width - 1).bit_length()  # 1, 2, 4 or 8
+        items = array(INT_TYPECODES[width], value)
+        if _BIG_ENDIAN:
+            items.byteswap()
+        data = memoryview(items).cast("B")
+    else:
+        data = b"".join(item.to_bytes(width, "little", signed=True)
+                        for item in value)
+    out += _TAG_SIZE_SIZE.pack(INTS, len(value), width)
+    _encode_bytes(data, out, parts)
+
+
+def _encode_tuple(value, out, parts):
+    out += _TAG_SIZE.pack(TUPLE, len(value))
+    for item in value:
+        _encode_value(item, out, parts)
+
+
+def _encode_dict(value, out, parts):
+    out.append(DICT)
+    _encode_list(list(value), out, parts)
+    _encode_list(list(value.values()), out, parts)
+
+
+def _encode_array(value, out, parts):
+    out.append(ARRAY)
+    out += ARRAY_CODES[value.typecode].encode()
+    if _BIG_ENDIAN and value.itemsize > 1:
+        value = array(value.typecode, value)
+        value.byteswap()
+    _encode_bytes(memoryview(value).cast("B"), out, parts)
+
+
+def _encode_ndarray(value, out, parts):
+    if value.dtype.kind not in NDARRAY_KINDS:
+        raise TypeError(f"Cannot encode arrays of {value.dtype}")
+    dtype = value.dtype.str.encode()
+    out.append(NDARRAY)
+    out.append(len(dtype))
+    out += dtype
+    out.append(value.ndim)
+    for dimension in value.shape:
+        out += _SIZE.pack(dimension)
+    data = np.ascontiguousarray(value).reshape(-1).view(np.uint8)
+    _encode_bytes(memoryview(data), out, parts)
+
+
+def _encode_circuit(value, out, parts):
+    out.append(CIRCUIT)
+    for field in value:
+        _encode_value(field, out, parts)
+
+
+_ENCODERS = {
+    type(None): _encode_none,
+    bool: _encode_bool,
+    int: _encode_int,
+    float: _encode_float,
+    bytes: _encode_bytes,
+    bytearray: _encode_bytes,
+    memoryview: _encode_bytes,
+    str: _encode_str,
+    list: _encode_list,
+    tuple: _encode_tuple,
+    dict: _encode_dict,
+    array: _encode_array,
+    np.ndarray: _encode_ndarray,
+    compiler.CompiledCircuit: _encode_circuit,
+}
+
+
+def _decode_value(view, offset, parts, depth=0):
+    """Decode the value at 'offset' of the first frame.
+
+    Args:
+        depth: Optional; the number of values the value is nested in, at
+            most MAX_DEPTH.
+
+    Returns:
+        A pair (value, offset) of the value and the offset of the next one.
+    """
+    if depth > MAX_DEPTH:
+        raise ValueError(f"Values nested more than {MAX_DEPTH} times")
+    tag = view[offset]
+    offset += 1
+    if tag == LABEL:
+        end = offset + LABEL_SIZE
+        if end > len(view):
+            raise IndexError
+        return bytes(view[offset:end]), end
+    if tag == INT8:
+        return _INT8.unpack_from(view, offset)[0], offset + 1
+    if tag == INT32:
+        return _INT32.unpack_from(view, offset)[0], offset + 4
+    if tag == INT64:
+        return _INT64.unpack_from(view, offset)[0], offset + 8
+    if tag == NONE:
+        return None, offset
+    if tag == FALSE:
+        return False, offset
+    if tag == TRUE:
+        return True, offset
+    if tag == FLOAT:
+        return _FLOAT.unpack_from(view, offset)[0], offset + 8
+    if tag == DICT:
+        keys, offset = _decode_list(view, offset, parts, depth + 1)
+        values, offset = _decode_list(view, offset, parts, depth + 1)
+        if len(keys) != len(values):
+            raise ValueError("Keys and values of a dict differ in number")
+        return dict(zip(keys, values)), offset
+    if tag == INTS:
+        count, width = _SIZE_SIZE.unpack_from(view, offset)
+        if not width:
+            raise ValueError("Items of INTS values have no width")
+        data, offset = _decode_block(view, offset + 8, parts, count * width)
+        if width in INT_TYPECODES:
+            items = array(INT_TYPECODES[width])
+            items.frombytes(data)
+            if _BIG_ENDIAN:
+                items.byteswap()
+            return items.tolist(), offset
+        data = bytes(data)
+        return [int.from_bytes(data[i:i + width], "little", signed=True)
+                for i in range(0, count * width, width)], offset
+    if tag == BLOBS:
+        count, size = _SIZE_SIZE.unpack_from(view, offset)
+        if not size:  # else a few bytes would decode as a huge list
+            raise ValueError("Items of BLOBS values are empty")
+        data, offset = _decode_block(view, offset + 8, parts, count * size)
+        data = bytes(data)
+        return [data[i:i + size] for i in range(0, count * size, size)], offset
+    if tag == ROWS:
+        count, size = _SIZE_SIZE.unpack_from(view, offset)
+        if not size:
+            raise ValueError("Items of ROWS values are empty")
+        offset += 8
+        columns = []
+        for _ in range(size):
+            column, offset = _decode_list(view, offset, parts, depth + 1)
+            if len(column) != count:
+                raise ValueError("Columns of rows differ in length")
+            columns.append(column)
+        return list(zip(*columns)), offset
+    if tag == ARRAY:
+        typecode = TYPECODES.get(chr(view[offset]))
+        if typecode is None:
+            raise ValueError(f"Unknown array code {view[offset]}")
+        data, offset = _decode_block(view, offset + 1, parts)
+        items = array(typecode)
+        if len(data) % items.itemsize:
+            raise ValueError("Truncated array")
+        items.frombytes(data)
+        if _BIG_ENDIAN and items.itemsize > 1:
+            items.byteswap()
+        return items, offset
+    if tag == NDARRAY:
+        size = view[offset]
+        dtype = bytes(view[offset + 1:offset + 1 + size]).decode("ascii")
+        # Only plain dtypes, e.g. '<u8', reach the parser of NumPy
+        if (dtype[:1] not in ("<", ">", "|") or dtype[1:2] == ""
+                or dtype[1] not in NDARRAY_KINDS or not dtype[2:].isdigit()):
+            raise ValueError(f"Cannot decode arrays of {dtype!r}")
+        dtype = np.dtype(dtype)
+        offset += 1 + size
+        ndim = view[offset]
+        shape = struct.unpack_from(f"<{ndim}I", view, offset + 1)
+        data, offset = _decode_block(view, offset + 1 + 4 * ndim, parts)
+        return np.frombuffer(data, dtype).reshape(shape), offset
+    if tag == CIRCUIT:
+        fields = []
+        for _ in compiler.CompiledCircuit._fields:
+            field, offset = _decode_value(view, offset, parts, depth + 1)
+            fields.append(field)
+        if (type(fields[0]) is not str or type(fields[1]) is not int
+                or any(type(field) is not array for field in fields[2:])):
+            raise ValueError("Invalid circuit")
+        circuit = compiler.CompiledCircuit(*fields)
+        _check_circuit(circuit)
+        return circuit, offset
+
+    # Values of a size or a count
+    if tag not in _SIZED_TAGS:
+        raise ValueError(f"Unknown tag {tag}")
+    size = _SIZE.unpack_from(view, offset)[0]
+    offset += 4
+    if tag == FRAME:
+        if size == 0:
+            raise ValueError("Frame 0 is the message")
+        return parts[size], offset
+    if tag == LIST or tag == TUPLE:
+        items = []
+        for _ in range(size):
+            item, offset = _decode_value(view, offset, parts, depth + 1)
+            items.append(item)
+        return (items if tag == LIST else tuple(items)), offset
+    end = offset + size  # BYTES, STR or BIGINT
+    if end > len(view):
+        raise IndexError
+    data = bytes(view[offset:end])
+    if tag == STR:
+        return data.decode(), end
+    if tag == BIGINT:
+        return int.from_bytes(data, "little", signed=True), end
+    return data, end
+
+
+_SIZED_TAGS = {BIGINT, BYTES, STR, FRAME, LIST, TUPLE}
+
+
+def _check_circuit(circuit):
+    """Raise ValueError unless a decoded circuit is one compile_circuit may
+    return, so that evaluating it cannot fail on its wires or gates.
+
+    Arrays have the types and lengths of compiled circuits, input wires are
+    distinct inputs, outputs are wires, gate types are in GATE_TYPES, and
+    gate k reads wires below 'num_inputs + k', its second input being -1
+    for NOT gates only.
+    """
+    arrays = circuit[2:]
+    if any(ARRAY_CODES[field.typecode] != code
+           for field, code in zip(arrays, CIRCUIT_CODES)):
+        raise ValueError("Invalid circuit: arrays of wrong types")
+    num_inputs, num_gates = circuit.num_inputs, circuit.num_gates
+    if (num_inputs < 0 or len(circuit.wire_ids) != num_inputs + num_gates
+            or any(len(field) != num_gates for field in (
+                circuit.gate_in_a, circuit.gate_in_b, circuit.gate_ids))):
+        raise ValueError("Invalid circuit: arrays of wrong lengths")
+
+    inputs = np.frombuffer(circuit.alice + circuit.bob, np.int32)
+    outputs = np.frombuffer(circuit.out, np.int32)
+    if (np.any((inputs < 0) | (inputs >= num_inputs))
+            or len(np.unique(inputs)) != len(inputs)
+            or np.any((outputs < 0) | (outputs >= num_inputs + num_gates))):
+        raise ValueError("Invalid circuit: inputs or outputs out of range")
+
+    gate_types = np.frombuffer(circuit.gate_types, np.uint8)
+    in_a = np.frombuffer(circuit.gate_in_a, np.int32)
+    in_b = np.frombuffer(circuit.gate_in_b, np.int32)
+    limit = num_inputs + np.arange(num_gates)  # the wire of each gate
+    unary = gate_types == compiler.NOT
+    if (np.any(gate_types >= len(compiler.GATE_TYPES))
+            or np.any((in_a < 0) | (in_a >= limit))
+            or np.any(np.where(unary, in_b != -1,
+                               (in_b < 0) | (in_b >= limit)))):
+        raise ValueError("Invalid circuit: gates out of range")
+
+
+def _decode_list(view, offset, parts, depth):
+    """Decode a LIST, INTS, BLOBS or ROWS value."""
+    if view[offset] not in (LIST, INTS, BLOBS, ROWS):
+        raise ValueError("Expected a list")
+    return _decode_value(view, offset, parts, depth)
+
+
+def _decode_block(view, offset, parts, size=None):
+    """Decode a block of bytes, i.e. a BYTES, LABEL or FRAME value.
+
+    Args:
+        size: Optional; the expected size of the block.
+    """
+    if view[offset] not in (BYTES, LABEL, FRAME):
+        raise ValueError("Expected a block of bytes")
+    data, offset = _decode_value(view, offset, parts)
+    if size is not None and len(data) != size:
+        raise ValueError("Truncated block of bytes")
+    return data, offset
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import random
+
+    def sample_circuit():
+        """Return the compiled circuit of circuits/add.json."""
+        with open("circuits/add.json") as json_file:
+            spec = json.load(json_file)["circuits"][0]
+        return compiler.compile_circuit(spec)
+
+    def invalid_circuits(circuit):
+        """Return variants of a circuit that decoding must reject."""
+        k = circuit.num_gates - 1  # the last gate
+
+        def replaced(field, value):
+            values = array(getattr(circuit, field).typecode,
+                           getattr(circuit, field))
+            values[k] = value
+            return circuit._replace(**{field: values})
+
+        return [
+            replaced("gate_in_a", circuit.num_inputs + k),
+            replaced("gate_in_b", -2),
+            replaced("gate_types", len(compiler.GATE_TYPES)),
+            circuit._replace(gate_ids=circuit.gate_ids[:-1]),
+            circuit._replace(num_inputs=-1),
+            circuit._replace(bob=circuit.bob + circuit.alice[:1]),
+            circuit._replace(out=circuit.out
+                             + array("i", [circuit.num_wires])),
+            circuit._replace(wire_ids=array("i", circuit.wire_ids)),
+        ]
+
+    def samples():
+        """Return messages covering every tag, and the frames to send."""
+        circuit = sample_circuit()
+        nested = None
+        for _ in range(MAX_DEPTH):
+            nested = [nested]
+        return [
+            (None, ()), (False, ()), (True, ()),
+            (-0x80, ()), (0x7FFFFFFF, ()), (-0x8000000000000000, ()),
+            (1 << 2048, ()), (-(1 << 70), ()), (-2.5, ()),
+            (b"", ()), (b"label of a wire.", ()), (b"x" * FRAME_SIZE, ()),
+            ("wire", ()), ("", ()),
+            ([], ()), ([None, 1, "a", [b"b"]], ()), ((1, (2, 3)), ()),
+            ({"a": 1, 2: [True], (3, 4): {}}, ()),
+            ([-1, 0x7F], ()), ([0x80, -0x8000], ()), ([1 << 31], ()),
+            ([1 << 63, -1], ()), ([1 << 200, 5], ()),
+            ([b"ab", b"cd"], ()), ([b"", b""], ()), ([b"a", b"bc"], ()),
+            ([(1, b"k" * LABEL_SIZE), (2, b"l" * LABEL_SIZE)], ()),
+            ([(), ()], ()), ([(1, 2), (3,)], ()),
+            (array("b", [-1, 2]), ()), (array("H", [1, 0xFFFF]), ()),
+            (array("q", [-1 << 63]), ()), (array("Q"), ()),
+            (np.arange(12, dtype=np.uint64).reshape(3, 4), ()),
+            (np.array([[True], [False]]), ()),
+            (np.linspace(0, 1, 5), ()), (np.zeros((0, 3), np.int8), ()),
+            (circuit, ()), (nested, ()),
+            ({"circuit": circuit, "tables": bytes(range(32)),
+              "pbits_out": {1: 0, 2: 1}}, ("tables",)),
+        ]
+
+    def normalize(value):
+        """Return a value comparable with ==, e.g. frames as bytes."""
+        if isinstance(value, compiler.CompiledCircuit):
+            return value
+        if isinstance(value, memoryview):
+            return bytes(value)
+        if isinstance(value, np.ndarray):
+            return value.dtype.str, value.shape, value.tobytes()
+        if isinstance(value, (list, tuple)):
+            return type(value)([normalize(item) for item in value])
+        if isinstance(value, dict):
+            return {key: normalize(item) for key, item in value.items()}
+        return value
+
+    def expect_error(parts):
+        """Return whether decoding fails with ValueError, as it should."""
+        try:
+            decode(parts)
+        except ValueError:
+            return True
+        except Exception:
+            return False
+        return False
+
+    def check(flips, seed):
+        """Check round-trips of samples, then decoding of corrupted ones.
+
+        Truncated messages and unknown tags must raise ValueError, and
+        messages with flipped bits must decode or raise ValueError only.
+
+        Returns:
+            The list of failures, empty if all checks pass.
+        """
+        rng = random.Random(seed)
+        failures = []
+        corrupted = 0
+        for msg, frames in samples():
+            parts = [bytes(part) for part in encode(msg, frames)]
+            if normalize(decode(parts)) != normalize(msg):
+                failures.append(f"Round-trip of {msg!r:.60}")
+            first, rest = parts[0], parts[1:]
+            for end in range(len(first)):
+                corrupted += 1
+                if not expect_error([first[:end]] + rest):
+                    failures.append(f"Truncation at {end} of {msg!r:.60}")
+            for _ in range(flips):
+                data = bytearray(first)
+                bit = rng.randrange(8 * len(data))
+                data[bit // 8] ^= 1 << bit % 8
+                corrupted += 1
+                try:
+                    decode([bytes(data)] + rest)
+                except ValueError:
+                    pass
+                except Exception as error:
+                    failures.append(f"{type(error).__name__} on bit {bit} "
+                                    f"of {msg!r:.60}: {error}")
+        for data in (bytes([CIRCUIT + 1]), bytes([255]),
+                     bytes([INTS]) + _SIZE_SIZE.pack(1, 0)
+                     + _TAG_SIZE.pack(BYTES, 0),
+                     _TAG_SIZE.pack(LIST, 1) * (MAX_DEPTH + 1) + bytes([NONE]),
+                     _TAG_SIZE.pack(LIST, 1) * 5000 + bytes([NONE]),
+                     (bytes([DICT]) + _TAG_SIZE.pack(LIST, 1)) * 5000):
+            corrupted += 1
+            if not expect_error([HEADER.pack(MAGIC, VERSION) + data]):
+                failures.append(f"Invalid value {data.hex()}")
+        for circuit in invalid_circuits(sample_circuit()):
+            corrupted += 1
+            if not expect_error(encode(circuit)):
+                failures.append(f"Invalid circuit {circuit!r:.60}")
+        for header in (HEADER.pack(b"PK", VERSION),
+                       HEADER.pack(MAGIC, VERSION + 1)):
+            corrupted += 1
+            if not expect_error([header + bytes([NONE])]):
+                failures.append(f"Invalid header {header.hex()}")
+        print(f"Wire format: {len(samples())} round-trips, {corrupted} "
+              f"corrupted messages: {len(failures)} failures")
+        return failures
+
+    parser = argparse.ArgumentParser(
+        description="Check round-trips of the wire format and that invalid "
+                    "messages raise ValueError.")
+    parser.add_argument("--flips", type=int, default=1000,
+                        help="the number of messages with a flipped bit of "
+                             "each sample (default 1000)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="the seed of flipped bits (default 0)")
+    args = parser.parse_args()
+
+    failures = check(args.flips, args.seed)
+    for failure in failures:
+        print(f"  {failure}")
+    sys.exit(1 if failures else 0)
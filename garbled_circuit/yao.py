@@ -1,6 +1,53 @@
-import pickle
-import random
+import base64
+import itertools
+import numpy as np
+import os
+from collections.abc import Iterator, Mapping
+from functools import reduce
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+import compiler
+import stats
+from compiler import GATE_TYPES, NOT
+
+# Gates evaluated without garbled table when using Free-XOR
+FREE_GATES = (compiler.XOR, compiler.XNOR, compiler.NOT)
+
+# Half-gates: (invert input a, invert input b, invert output) of an AND gate
+HALF_GATES_INVERSIONS = {
+    "AND": (0, 0, 0),
+    "NAND": (0, 0, 1),
+    "OR": (1, 1, 1),
+    "NOR": (1, 1, 0),
+}
+
+# Logical function of each gate type
+OPERATORS = {
+    "NOT": lambda b: not b,
+    "OR": lambda b1, b2: b1 or b2,
+    "AND": lambda b1, b2: b1 and b2,
+    "XOR": lambda b1, b2: b1 ^ b2,
+    "NOR": lambda b1, b2: not (b1 or b2),
+    "NAND": lambda b1, b2: not (b1 and b2),
+    "XNOR": lambda b1, b2: not (b1 ^ b2)
+}
+
+# Garbling backends: fixed-key AES hash (default) or Fernet (legacy)
+BACKENDS = ("aes", "fernet")
+
+LABEL_SIZE = 16  # size in bytes of labels of the AES backend
+SEED_SIZE = 16  # size in bytes of the secret seeds of seeded circuits
+# Counters of the labels derived from seeds: the Free-XOR offset first, then
+# two labels per input wire (see GarbledCircuit.input_keys)
+OFFSET_COUNTER = 0
+WIRE_COUNTER = 1
+CHUNK_SIZE = 64 * 1024  # default size in bytes of streamed garbled tables
+MASK_64 = (1 << 64) - 1
+
+# Public key of the fixed-key AES permutation, any constant will do
+HASH_KEY = bytes.fromhex("000102030405060708090a0b0c0d0e0f")
+# ECB holds no state between blocks, hence one encryptor serves all calls
+_permutation = Cipher(algorithms.AES(HASH_KEY), modes.ECB()).encryptor()
 
 
 def encrypt(key, data):
@@ -31,52 +78,476 @@ def decrypt(key, data):
     return f.decrypt(data)
 
 
-def evaluate(circuit, g_tables, pbits_out, a_inputs, b_inputs):
+def xor_labels(label_a, label_b):
+    """XOR two labels of the same length.
+
+    Args:
+        label_a: A byte string.
+        label_b: A byte string.
+
+    Returns:
+        The XOR of both labels as a byte string.
+    """
+    value = int.from_bytes(label_a, "big") ^ int.from_bytes(label_b, "big")
+    return value.to_bytes(len(label_a), "big")
+
+
+def xor_keys(key_a, key_b):
+    """XOR two keys.
+
+    Args:
+        key_a: A Fernet key.
+        key_b: A Fernet key.
+
+    Returns:
+        The Fernet key whose raw bytes are the XOR of both keys.
+    """
+    raw_a = base64.urlsafe_b64decode(key_a)
+    raw_b = base64.urlsafe_b64decode(key_b)
+    return base64.urlsafe_b64encode(xor_labels(raw_a, raw_b))
+
+
+def lsb(label):
+    """Return the point-and-permute bit of a label."""
+    return label[-1] & 1
+
+
+def gen_label(pbit):
+    """Create a random label whose point-and-permute bit is 'pbit'."""
+    return set_lsb(os.urandom(LABEL_SIZE), pbit)
+
+
+def set_lsb(label, bit):
+    """Return a label whose point-and-permute bit is 'bit'."""
+    return label[:-1] + bytes([label[-1] & 0xFE | bit])
+
+
+def derive_labels(prf, start, count):
+    """Return labels derived from a secret seed.
+
+    Label i is the encryption of the 128-bit counter 'start + i' under the
+    seed, i.e. a block of the keystream of AES-CTR, hence any range of
+    labels is derived by a single call.
+
+    Args:
+        prf: An AES encryptor in ECB mode keyed by the seed, which holds no
+            state between calls.
+        start: The counter of the first label.
+        count: The number of labels.
+
+    Returns:
+        The list of labels.
+    """
+    counters = np.zeros((count, 2), dtype=">u8")
+    counters[:, 1] = np.arange(start, start + count, dtype=np.uint64)
+    blocks = prf.update(counters.tobytes())
+    return [blocks[i:i + LABEL_SIZE]
+            for i in range(0, len(blocks), LABEL_SIZE)]
+
+
+def pack_input(key, encr_bit):
+    """Return the bytes of a (key, encr_bit) input, e.g. a message of OTs."""
+    return key + bytes((encr_bit,))
+
+
+def unpack_input(data):
+    """Return the (key, encr_bit) input of bytes packed by pack_input."""
+    return bytes(data[:-1]), data[-1]
+
+
+def _sigma(value):
+    """Linear orthomorphism of 128-bit values: (L, R) -> (L ^ R, L)."""
+    high = value >> 64
+    return ((high ^ value & MASK_64) << 64) | high
+
+
+def _permute(values):
+    """Return fixed-key AES of 128-bit values, plus the values (MMO).
+
+    All values are encrypted with a single call to AES.
+    """
+    blocks = _permutation.update(
+        b"".join(value.to_bytes(LABEL_SIZE, "big") for value in values))
+    return [
+        int.from_bytes(blocks[i:i + LABEL_SIZE], "big") ^ value
+        for i, value in zip(range(0, len(blocks), LABEL_SIZE), values)
+    ]
+
+
+def _hash_input(labels, tweak):
+    """Return the value hashed for a tweak and a list of integer labels.
+
+    Labels are chained as value = sigma(value ^ label) from the tweak, i.e.
+    sigma(tweak ^ a) for one label and sigma(sigma(tweak ^ a) ^ b) =
+    sigma^2(tweak) ^ sigma^2(a) ^ sigma(b) for two, sigma being linear. The
+    inputs of two rows of a gate then differ by sigma^2(d), sigma(d) or
+    sigma^2(d) ^ sigma(d) = d for the Free-XOR offset d (sigma^2 ^ sigma is
+    the identity), all nonzero and unknown to the evaluator, so that the
+    hash of a row cannot be derived from the hashes of other rows.
+    """
+    value = tweak
+    for label in labels:
+        value = _sigma(value ^ label)
+    return value
+
+
+def hash_label(label, tweak):
+    """Hash a label into a new label.
+
+    The hash is the correlation-robust H(x, i) = AES(s) ^ s with
+    s = sigma(x) ^ i, where AES uses a fixed public key.
+
+    Args:
+        label: The label to hash.
+        tweak: An integer to tweak the hash with (e.g. derived from a gate ID).
+
+    Returns:
+        The hash as a label.
+    """
+    value = _sigma(int.from_bytes(label, "big")) ^ tweak
+    return _permute([value])[0].to_bytes(LABEL_SIZE, "big")
+
+
+def hash_labels(labels, tweak):
+    """Hash the input labels of a gate into a new label.
+
+    Args:
+        labels: A list of one or two labels.
+        tweak: An integer to tweak the hash with (e.g. the gate ID).
+
+    Returns:
+        The hash as a label.
+    """
+    value = _hash_input([int.from_bytes(l, "big") for l in labels], tweak)
+    return _permute([value])[0].to_bytes(LABEL_SIZE, "big")
+
+
+def garble_row_reduced_gate(gate_id, gate_type, keys_in, offset=None):
+    """Garble a gate with the AES backend and garbled row reduction.
+
+    Rows are indexed by the encrypted bits of the inputs (point-and-permute).
+    The label of the output for the first row is the hash of this row, hence
+    the first row is dropped from the table.
+
+    Args:
+        gate_id: The ID of the gate.
+        gate_type: The type of the gate.
+        keys_in: A list of the pairs of keys of the gate inputs.
+        offset: Optional; the global Free-XOR offset R.
+
+    Returns:
+        A pair (garbled_table, keys_out) where the garbled table is a tuple of
+        ciphertexts and keys_out the pair of keys of the output.
+    """
+    operator = OPERATORS[gate_type]
+    pbits = [lsb(pair[0]) for pair in keys_in]
+    keys_in = [[int.from_bytes(key, "big") for key in pair] for pair in keys_in]
+
+    # Clear bits of the inputs for each row, rows being ordered by encr bits
+    rows = [
+        [pbit ^ e for pbit, e in zip(pbits, encr_bits)]
+        for encr_bits in itertools.product((0, 1), repeat=len(keys_in))
+    ]
+    hashes = _permute([
+        _hash_input([pair[bit] for pair, bit in zip(keys_in, bits)], gate_id)
+        for bits in rows
+    ])
+
+    # The first row gives the key of its output bit
+    keys_out = [None, None]
+    bit_out = int(operator(*rows[0]))
+    keys_out[bit_out] = hashes[0]
+    if offset:
+        keys_out[1 - bit_out] = hashes[0] ^ int.from_bytes(offset, "big")
+    else:
+        keys_out[1 - bit_out] = int.from_bytes(gen_label(hashes[0] & 1 ^ 1),
+                                               "big")
+
+    garbled_table = tuple(
+        (row_hash ^ keys_out[int(operator(*bits))]).to_bytes(LABEL_SIZE, "big")
+        for bits, row_hash in zip(rows[1:], hashes[1:])
+    )
+    keys_out = tuple(key.to_bytes(LABEL_SIZE, "big") for key in keys_out)
+
+    return garbled_table, keys_out
+
+
+def evaluate_row_reduced_gate(gate_id, keys, garbled_table):
+    """Evaluate a gate garbled with garbled row reduction.
+
+    Args:
+        gate_id: The ID of the gate.
+        keys: A list of the keys of the gate inputs.
+        garbled_table: The tuple of ciphertexts of the gate.
+
+    Returns:
+        The key of the output.
+    """
+    row = reduce(lambda r, key: 2 * r + lsb(key), keys, 0)
+    row_hash = hash_labels(keys, gate_id)
+    if row == 0:
+        return row_hash
+    return xor_labels(row_hash, garbled_table[row - 1])
+
+
+def garble_half_gate(gate_id, gate_type, label_a, label_b, offset):
+    """Garble a non-linear gate with half-gates.
+
+    OR, NAND and NOR gates are garbled as an AND gate with inverted inputs
+    and/or output; inverting a wire amounts to swapping its labels.
+
+    Args:
+        gate_id: The ID of the gate.
+        gate_type: The type of the gate: AND, OR, NAND or NOR.
+        label_a: The label of the first input for bit 0.
+        label_b: The label of the second input for bit 0.
+        offset: The global Free-XOR offset R.
+
+    Returns:
+        A pair (garbled_table, label_out) where the garbled table is a pair of
+        ciphertexts and label_out the label of the output for bit 0.
+    """
+    inv_a, inv_b, inv_out = HALF_GATES_INVERSIONS[gate_type]
+    offset = int.from_bytes(offset, "big")
+    label_a = int.from_bytes(label_a, "big") ^ inv_a * offset
+    label_b = int.from_bytes(label_b, "big") ^ inv_b * offset
+    pbit_a, pbit_b = label_a & 1, label_b & 1
+    tweak_g, tweak_e = 2 * gate_id, 2 * gate_id + 1
+
+    hash_a0, hash_a1, hash_b0, hash_b1 = _permute([
+        _sigma(label_a) ^ tweak_g,
+        _sigma(label_a ^ offset) ^ tweak_g,
+        _sigma(label_b) ^ tweak_e,
+        _sigma(label_b ^ offset) ^ tweak_e,
+    ])
+
+    # Garbler half gate: the garbler knows p-bit of b
+    table_g = hash_a0 ^ hash_a1 ^ pbit_b * offset
+    label_g = hash_a0 ^ pbit_a * table_g
+
+    # Evaluator half gate: the evaluator knows the encrypted bit of b
+    table_e = hash_b0 ^ hash_b1 ^ label_a
+    label_e = hash_b1 if pbit_b else hash_b0
+
+    label_out = label_g ^ label_e ^ inv_out * offset
+    garbled_table = (table_g.to_bytes(LABEL_SIZE, "big"),
+                     table_e.to_bytes(LABEL_SIZE, "big"))
+
+    return garbled_table, label_out.to_bytes(LABEL_SIZE, "big")
+
+
+def evaluate_half_gate(gate_id, label_a, label_b, garbled_table):
+    """Evaluate a gate garbled with half-gates.
+
+    Args:
+        gate_id: The ID of the gate.
+        label_a: The label of the first input.
+        label_b: The label of the second input.
+        garbled_table: The pair of ciphertexts of the gate.
+
+    Returns:
+        The label of the output.
+    """
+    table_g, table_e = garbled_table
+    label_g = hash_label(label_a, 2 * gate_id)
+    if lsb(label_a):
+        label_g = xor_labels(label_g, table_g)
+    label_e = hash_label(label_b, 2 * gate_id + 1)
+    if lsb(label_b):
+        label_e = xor_labels(label_e, xor_labels(table_e, label_a))
+    return xor_labels(label_g, label_e)
+
+
+def garble_gate(gate_id, gate_type, keys_a, keys_b=None, offset=None,
+                half_gates=False):
+    """Garble a gate with the AES backend.
+
+    Args:
+        gate_id: The ID of the gate.
+        gate_type: The type of the gate (see compiler.GATE_TYPES).
+        keys_a: The pair of keys of the first input.
+        keys_b: Optional; the pair of keys of the second input, None for NOT
+            gates.
+        offset: Optional; the global Free-XOR offset R, None without
+            Free-XOR.
+        half_gates: Optional; garble non-linear gates with half-gates.
+
+    Returns:
+        A pair (keys_out, garbled_table): the pair of keys of the output and
+        the packed rows of the gate, None for free gates.
+    """
+    if offset is not None and gate_type in FREE_GATES:
+        key0 = keys_a[0]
+        if gate_type != NOT:
+            key0 = xor_labels(key0, keys_b[0])
+        # XNOR and NOT outputs are inverted: swap keys
+        if gate_type != compiler.XOR:
+            key0 = xor_labels(key0, offset)
+        return (key0, xor_labels(key0, offset)), None
+    if half_gates:
+        rows, key0 = garble_half_gate(gate_id, GATE_TYPES[gate_type],
+                                      keys_a[0], keys_b[0], offset)
+        return (key0, xor_labels(key0, offset)), b"".join(rows)
+    keys_in = [keys_a] if gate_type == NOT else [keys_a, keys_b]
+    rows, keys_out = garble_row_reduced_gate(gate_id, GATE_TYPES[gate_type],
+                                             keys_in, offset)
+    return keys_out, b"".join(rows)
+
+
+def table_rows(gate_type, free_xor=False, half_gates=False):
+    """Return the number of rows of a gate in packed garbled tables.
+
+    Args:
+        gate_type: The type of the gate (see compiler.GATE_TYPES).
+        free_xor: Optional; the circuit is garbled with Free-XOR.
+        half_gates: Optional; the circuit is garbled with half-gates.
+    """
+    if (free_xor or half_gates) and gate_type in FREE_GATES:
+        return 0
+    if half_gates:
+        return 2
+    return 1 if gate_type == NOT else 3
+
+
+def unpack_rows(g_tables, offset, count):
+    """Read rows from packed garbled tables.
+
+    Args:
+        g_tables: A buffer of LABEL_SIZE-byte rows.
+        offset: The offset in bytes of the first row to read.
+        count: The number of rows to read.
+
+    Returns:
+        A tuple of rows.
+    """
+    return tuple(
+        g_tables[i:i + LABEL_SIZE]
+        for i in range(offset, offset + count * LABEL_SIZE, LABEL_SIZE)
+    )
+
+
+class RowReader:
+    """Read the rows of packed garbled tables in order.
+
+    Args:
+        chunks: An iterable of buffers of packed rows, the rows of a gate
+            never spanning two buffers.
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.chunk = memoryview(b"")
+        self.offset = 0  # offset of the next row in the current chunk
+
+    def read(self, count):
+        """Return a tuple of the next 'count' rows."""
+        if self.offset == len(self.chunk):
+            # The previous chunk is released
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                raise ValueError("The garbled tables end before the circuit")
+            self.chunk, self.offset = memoryview(chunk), 0
+        rows = unpack_rows(self.chunk, self.offset, count)
+        self.offset += count * LABEL_SIZE
+        return rows
+
+
+@stats.timed("evaluate")
+def evaluate(circuit, g_tables, pbits_out, a_inputs, b_inputs, free_xor=False,
+             half_gates=False, backend="aes"):
     """Evaluate yao circuit with given inputs.
 
     Args:
-        circuit: A dict containing circuit spec.
-        g_tables: The yao circuit garbled tables.
-        pbits_out: The pbits of outputs.
+        circuit: A CompiledCircuit, or a dict containing circuit spec.
+        g_tables: The yao circuit garbled tables: a dict mapping the position
+            of gates to their table (Fernet), a buffer of packed rows (AES),
+            or an iterator over chunks of packed rows (AES, see
+            GarbledCircuit.stream_garbled_tables). Chunks are dropped once
+            evaluated, as are the labels of wires no later gate reads.
+        pbits_out: The pbits of outputs, read once 'g_tables' is exhausted.
         a_inputs: A dict mapping Alice's wires to (key, encr_bit) inputs.
         b_inputs: A dict mapping Bob's wires to (key, encr_bit) inputs.
+        free_xor: Optional; the circuit was garbled with Free-XOR, hence
+            XOR, XNOR and NOT gates have no garbled table.
+        half_gates: Optional; the non-linear gates were garbled with
+            half-gates (implies Free-XOR).
+        backend: Optional; the garbling backend, 'aes' (the default) or
+            'fernet'.
 
     Returns:
         A dict mapping output wires with their result bit.
     """
-    gates = circuit["gates"]  # dict containing circuit gates
-    wire_outputs = circuit["out"]  # list of output wires
-    wire_inputs = {}  # dict containing Alice and Bob inputs
-    evaluation = {}  # dict containing result of evaluation
+    if isinstance(circuit, dict):
+        circuit = compiler.compile_circuit(circuit)
+    stats.count("evaluate.gates", circuit.num_gates)
+    wire_ids = circuit.wire_ids
+    num_inputs = circuit.num_inputs
+    labels = [None] * circuit.num_wires  # (key, encr_bit) of each wire
+
+    for w in range(num_inputs):
+        labels[w] = a_inputs.get(wire_ids[w]) or b_inputs.get(wire_ids[w])
 
-    wire_inputs.update(a_inputs)
-    wire_inputs.update(b_inputs)
+    free_xor = free_xor or half_gates
+    xor = xor_keys if backend == "fernet" else xor_labels
+    streamed = isinstance(g_tables, Iterator)
+    if backend == "aes":
+        reader = RowReader(g_tables if streamed else [g_tables])
+    last_use = compiler.last_uses(circuit) if streamed else None
 
-    # Iterate over all gates
-    for gate in sorted(gates, key=lambda g: g["id"]):
-        gate_id, gate_in, msg = gate["id"], gate["in"], None
+    # Iterate over all gates, in topological order
+    gates = zip(circuit.gate_types, circuit.gate_in_a, circuit.gate_in_b)
+    for k, (gate_type, in_a, in_b) in enumerate(gates):
+        gate_id = circuit.gate_ids[k]
+        # With Free-XOR, output key and bit are the XOR of the inputs
+        if free_xor and gate_type in FREE_GATES:
+            key, encr_bit = labels[in_a]
+            if gate_type != NOT:
+                key_b, encr_bit_b = labels[in_b]
+                key, encr_bit = xor(key, key_b), encr_bit ^ encr_bit_b
+            labels[num_inputs + k] = (key, encr_bit)
+        # With half-gates, the encrypted bit is the label's last bit
+        elif half_gates:
+            key = evaluate_half_gate(gate_id, labels[in_a][0],
+                                     labels[in_b][0], reader.read(2))
+            labels[num_inputs + k] = (key, lsb(key))
+        elif backend == "aes":
+            keys = [labels[in_a][0]]
+            if gate_type != NOT:
+                keys.append(labels[in_b][0])
+            rows = reader.read(2**len(keys) - 1)
+            key = evaluate_row_reduced_gate(gate_id, keys, rows)
+            labels[num_inputs + k] = (key, lsb(key))
         # Special case if it's a NOT gate
-        if (len(gate_in) < 2) and (gate_in[0] in wire_inputs):
+        elif gate_type == NOT:
             # Fetch input key associated with the gate's input wire
-            key_in, encr_bit_in = wire_inputs[gate_in[0]]
+            key_in, encr_bit_in = labels[in_a]
             # Fetch the encrypted message in the gate's garbled table
-            encr_msg = g_tables[gate_id][(encr_bit_in, )]
+            encr_msg = g_tables[k][(encr_bit_in, )]
             # Decrypt message
             msg = decrypt(key_in, encr_msg)
+            labels[num_inputs + k] = unpack_input(msg)
         # Else the gate has two input wires (same model)
-        elif (gate_in[0] in wire_inputs) and (gate_in[1] in wire_inputs):
-            key_a, encr_bit_a = wire_inputs[gate_in[0]]
-            key_b, encr_bit_b = wire_inputs[gate_in[1]]
-            encr_msg = g_tables[gate_id][(encr_bit_a, encr_bit_b)]
+        else:
+            key_a, encr_bit_a = labels[in_a]
+            key_b, encr_bit_b = labels[in_b]
+            encr_msg = g_tables[k][(encr_bit_a, encr_bit_b)]
             msg = decrypt(key_b, decrypt(key_a, encr_msg))
-        if msg:
-            wire_inputs[gate_id] = pickle.loads(msg)
+            labels[num_inputs + k] = unpack_input(msg)
 
-    # After all gates have been evaluated, we populate the dict of results
-    for out in wire_outputs:
-        evaluation[out] = wire_inputs[out][1] ^ pbits_out[out]
+        if last_use is not None:
+            if last_use[in_a] == k:
+                labels[in_a] = None
+            if in_b >= 0 and last_use[in_b] == k:
+                labels[in_b] = None
 
-    return evaluation
+    # The end of a stream may carry the p-bits of outputs
+    if streamed and next(g_tables, None) is not None:
+        raise ValueError("The garbled tables outlast the circuit")
+
+    # After all gates have been evaluated, we populate the dict of results
+    return {
+        wire_ids[w]: labels[w][1] ^ pbits_out[wire_ids[w]]
+        for w in circuit.out
+    }
 
 
 class GarbledGate:
@@ -86,8 +557,10 @@ class GarbledGate:
         gate: A dict containing gate spec.
         keys: A dict mapping each wire to a pair of keys.
         pbits: A dict mapping each wire to its p-bit.
+        debug: Optional; also build a clear representation of the garbled
+            table, needed to print it (False by default).
     """
-    def __init__(self, gate, keys, pbits):
+    def __init__(self, gate, keys, pbits, debug=False):
         self.keys = keys  # dict of yao circuit keys
         self.pbits = pbits  # dict of p-bits
         self.input = gate["in"]  # list of inputs'ID
@@ -95,23 +568,13 @@ class GarbledGate:
         self.gate_type = gate["type"]  # Gate type: OR, AND, ...
         self.garbled_table = {}  # The garbled table of the gate
         # A clear representation of the garbled table for debugging purposes
-        self.clear_garbled_table = {}
-
-        # Create the garbled table according to the gate type
-        switch = {
-            "OR": lambda b1, b2: b1 or b2,
-            "AND": lambda b1, b2: b1 and b2,
-            "XOR": lambda b1, b2: b1 ^ b2,
-            "NOR": lambda b1, b2: not (b1 or b2),
-            "NAND": lambda b1, b2: not (b1 and b2),
-            "XNOR": lambda b1, b2: not (b1 ^ b2)
-        }
+        self.clear_garbled_table = {} if debug else None
 
         # NOT gate is a special case since it has only one input
         if (self.gate_type == "NOT"):
             self._gen_garbled_table_not()
         else:
-            operator = switch[self.gate_type]
+            operator = OPERATORS[self.gate_type]
             self._gen_garbled_table(operator)
 
     def _gen_garbled_table_not(self):
@@ -130,14 +593,15 @@ class GarbledGate:
             key_in = self.keys[inp][bit_in]
             key_out = self.keys[out][bit_out]
 
-            # Serialize the output key along with the encrypted bit
-            msg = pickle.dumps((key_out, encr_bit_out))
+            # Pack the output key along with the encrypted bit
+            msg = pack_input(key_out, encr_bit_out)
             # Encrypt message and add it to the garbled table
             self.garbled_table[(encr_bit_in, )] = encrypt(key_in, msg)
             # Add to the clear table indexes of each keys
-            self.clear_garbled_table[(encr_bit_in, )] = [(inp, bit_in),
-                                                         (out, bit_out),
-                                                         encr_bit_out]
+            if self.clear_garbled_table is not None:
+                self.clear_garbled_table[(encr_bit_in, )] = [(inp, bit_in),
+                                                             (out, bit_out),
+                                                             encr_bit_out]
 
     def _gen_garbled_table(self, operator):
         """Create the garbled table of a 2-input gate.
@@ -158,12 +622,14 @@ class GarbledGate:
                 key_b = self.keys[in_b][bit_b]
                 key_out = self.keys[out][bit_out]
 
-                msg = pickle.dumps((key_out, encr_bit_out))
+                msg = pack_input(key_out, encr_bit_out)
                 self.garbled_table[(encr_bit_a, encr_bit_b)] = encrypt(
                     key_a, encrypt(key_b, msg))
-                self.clear_garbled_table[(encr_bit_a, encr_bit_b)] = [
-                    (in_a, bit_a), (in_b, bit_b), (out, bit_out), encr_bit_out
-                ]
+                if self.clear_garbled_table is not None:
+                    self.clear_garbled_table[(encr_bit_a, encr_bit_b)] = [
+                        (in_a, bit_a), (in_b, bit_b), (out, bit_out),
+                        encr_bit_out
+                    ]
 
     def print_garbled_table(self):
         """Print a clear representation of the garbled table."""
@@ -193,63 +659,554 @@ class GarbledCircuit:
     """A representation of a garbled circuit.
 
     Args:
-        circuit: A dict containing circuit spec.
+        circuit: A CompiledCircuit, or a dict containing circuit spec.
         pbits: Optional; a dict of p-bits for the given circuit.
+        free_xor: Optional; use Free-XOR, i.e. the two keys of every wire
+            differ by a global offset so that XOR, XNOR and NOT gates need
+            no garbled table (False by default).
+        half_gates: Optional; garble non-linear gates with half-gates, i.e.
+            two ciphertexts per gate; implies Free-XOR (False by default).
+        backend: Optional; the garbling backend: 'aes' (the default) hashes
+            128-bit labels with fixed-key AES and drops one row per table,
+            'fernet' encrypts every row with Fernet (legacy).
+        stream: Optional; only create the keys of input wires, gates being
+            garbled while iterating over stream_garbled_tables (False by
+            default).
+        seed: Optional; a secret seed of SEED_SIZE bytes, e.g. from
+            os.urandom, to derive the keys of input wires from (see
+            input_keys) instead of storing them (AES only). The p-bit of a
+            wire is then the last bit of its key for bit 0, and keys are
+            dropped once garbled: only the seed and the p-bits of outputs
+            remain, whatever the size of the circuit.
     """
-    def __init__(self, circuit, pbits={}):
-        self.circuit = circuit
-        self.gates = circuit["gates"]  # list of gates
-        self.wires = set()  # list of circuit wires
+    @stats.timed("garble")
+    def __init__(self, circuit, pbits={}, free_xor=False, half_gates=False,
+                 backend="aes", stream=False, seed=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', "
+                             f"must be in {list(BACKENDS)}")
+        if half_gates and backend != "aes":
+            raise ValueError("Half-gates require the 'aes' backend")
+        if stream and backend != "aes":
+            raise ValueError("Streaming requires the 'aes' backend")
+        if seed is not None:
+            if backend != "aes":
+                raise ValueError("Seeded circuits require the 'aes' backend")
+            if pbits:
+                raise ValueError("Seeded circuits derive their p-bits")
+            if len(seed) != SEED_SIZE:
+                raise ValueError(f"Seeds have {SEED_SIZE} bytes")
+        if isinstance(circuit, dict):
+            circuit = compiler.compile_circuit(circuit)
 
-        self.pbits = {}  # dict of p-bits
-        self.keys = {}  # dict of keys
-        self.garbled_tables = {}  # dict of garbled tables
+        self.circuit = circuit
+        self.free_xor = free_xor or half_gates
+        self.half_gates = half_gates
+        self.backend = backend
+        self.seed = seed
+        # AES under the seed, which derives the keys of input wires
+        self._prf = (Cipher(algorithms.AES(seed), modes.ECB()).encryptor()
+                     if seed is not None else None)
 
-        # Retrieve all wire IDs from the circuit
-        for gate in self.gates:
-            self.wires.add(gate["id"])
-            self.wires.update(set(gate["in"]))
-        self.wires = list(self.wires)
+        self.pbits = []  # p-bit of each wire, None once a seeded circuit
+        self.keys = [None] * circuit.num_wires  # pair of keys of each wire
+        self.offset = None  # global offset between keys (Free-XOR only)
+        self.pbits_out = None  # p-bits of outputs, once garbled
+        # dict of garbled tables (Fernet) or packed rows of all tables (AES)
+        self.garbled_tables = {} if backend == "fernet" else bytearray()
 
         self._gen_pbits(pbits)
         self._gen_keys()
-        self._gen_garbled_tables()
+        if stream:
+            self.garbled_tables = None
+        else:
+            self._gen_garbled_tables()
 
     def _gen_pbits(self, pbits):
-        """Create a dict mapping each wire to a random p-bit."""
-        if pbits:
-            self.pbits = pbits
+        """Create a list mapping each wire to a random p-bit."""
+        if self.seed is not None:  # the last bits of keys, see _gen_keys
+            self.pbits = [None] * self.circuit.num_wires
+        elif pbits:
+            self.pbits = [pbits[w] for w in self.circuit.wire_ids]
         else:
-            self.pbits = {wire: random.randint(0, 1) for wire in self.wires}
+            self.pbits = [b & 1 for b in os.urandom(self.circuit.num_wires)]
 
     def _gen_keys(self):
-        """Create pair of keys for each wire."""
-        for wire in self.wires:
-            self.keys[wire] = (Fernet.generate_key(), Fernet.generate_key())
+        """Create pair of keys for each wire.
+
+        Except for the legacy Fernet backend without Free-XOR, only the
+        input wires get their keys here: the keys of gate outputs are
+        created along with the garbled tables.
+        """
+        if self.backend == "fernet" and not self.free_xor:
+            for wire in range(self.circuit.num_wires):
+                self.keys[wire] = (Fernet.generate_key(),
+                                   Fernet.generate_key())
+            return
+
+        if self.free_xor:
+            # With AES, the last bit of a key is its encrypted bit: R ends by 1
+            self.offset = (Fernet.generate_key() if self.backend == "fernet"
+                           else gen_label(1))
+            if self.seed is not None:
+                self.offset = set_lsb(
+                    derive_labels(self._prf, OFFSET_COUNTER, 1)[0], 1)
+
+        if self.seed is not None:
+            keys = self.input_keys()
+            self.keys[:self.circuit.num_inputs] = keys
+            self.pbits[:self.circuit.num_inputs] = [lsb(key0)
+                                                    for key0, _ in keys]
+            return
+        for wire in range(self.circuit.num_inputs):
+            if self.backend == "fernet":
+                self._set_keys(wire, Fernet.generate_key())
+            elif self.free_xor:
+                self._set_keys(wire, gen_label(self.pbits[wire]))
+            else:
+                pbit = self.pbits[wire]
+                self.keys[wire] = (gen_label(pbit), gen_label(pbit ^ 1))
+
+    def input_keys(self, start=0, count=None):
+        """Return the pairs of keys of consecutive input wires.
+
+        The keys of seeded circuits are derived again at each call: the
+        keys for bit 0 and 1 of input wire w are the labels of counters
+        WIRE_COUNTER + 2w and WIRE_COUNTER + 2w + 1 (see derive_labels),
+        the latter replaced by the XOR with the offset with Free-XOR, and
+        their last bits set apart.
+
+        Args:
+            start: Optional; the first (dense) input wire, 0 by default.
+            count: Optional; the number of wires, up to the last input wire
+                by default.
+
+        Returns:
+            The list of pairs of keys.
+        """
+        if count is None:
+            count = self.circuit.num_inputs - start
+        if self.seed is None:
+            return self.keys[start:start + count]
+
+        labels = derive_labels(self._prf, WIRE_COUNTER + 2 * start,
+                               2 * count)
+        keys = []
+        for key0, label in zip(labels[::2], labels[1::2]):
+            if self.free_xor:
+                keys.append((key0, xor_labels(key0, self.offset)))
+            else:
+                keys.append((key0, set_lsb(label, lsb(key0) ^ 1)))
+        return keys
+
+    def _forget_keys(self):
+        """Drop the keys and p-bits of a seeded circuit once garbled, but
+        the p-bits of outputs."""
+        self.pbits_out = [lsb(self.keys[w][0]) for w in self.circuit.out]
+        self.keys = None
+        self.pbits = None
+
+    def _set_keys(self, wire, key0):
+        """Set the pair of keys of a wire given its key for bit 0."""
+        xor = xor_keys if self.backend == "fernet" else xor_labels
+        self.keys[wire] = (key0, xor(key0, self.offset))
+
+    def _gate(self, k, original=False):
+        """Return the gate spec of the k-th gate.
+
+        Args:
+            k: The position of the gate in topological order.
+            original: Optional; use original wire IDs instead of dense ones.
+        """
+        circuit = self.circuit
+        gate_in = [circuit.gate_in_a[k]]
+        if circuit.gate_types[k] != NOT:
+            gate_in.append(circuit.gate_in_b[k])
+        gate = {
+            "id": circuit.num_inputs + k,
+            "type": GATE_TYPES[circuit.gate_types[k]],
+            "in": gate_in,
+        }
+        if original:
+            gate["id"] = circuit.gate_ids[k]
+            gate["in"] = circuit.original(gate_in)
+        return gate
 
     def _gen_garbled_tables(self):
-        """Create the garbled table of each gate."""
-        for gate in self.gates:
-            garbled_gate = GarbledGate(gate, self.keys, self.pbits)
-            self.garbled_tables[gate["id"]] = garbled_gate.get_garbled_table()
+        """Create the garbled table of each gate.
+
+        Keys and p-bits of gate outputs are derived from their inputs,
+        except for the legacy Fernet backend, hence gates are processed in
+        topological order.
+        """
+        circuit = self.circuit
+        stats.count("garble.gates", circuit.num_gates)
+        if self.backend == "fernet" and not self.free_xor:
+            for k in range(circuit.num_gates):
+                garbled_gate = GarbledGate(self._gate(k), self.keys,
+                                           self.pbits)
+                self.garbled_tables[k] = garbled_gate.get_garbled_table()
+            return
+
+        last_use = (compiler.last_uses(circuit) if self.seed is not None
+                    else None)
+        for k, garbled_table in self._garble_gates(last_use):
+            if self.backend == "aes":
+                self.garbled_tables += garbled_table
+            else:
+                self.garbled_tables[k] = garbled_table
+        if self.seed is not None:
+            self._forget_keys()
+
+    def _garble_gates(self, last_use=None):
+        """Garble gates in topological order.
+
+        Args:
+            last_use: Optional; the position of the last gate reading each
+                wire (see compiler.last_uses), to drop the keys of gate
+                outputs once no gate needs them, and of input wires for
+                seeded circuits, whose seed derives them again.
+
+        Yields:
+            A pair (k, garbled_table) for the k-th gate if it has a table:
+            its packed rows (AES) or a dict (Fernet).
+        """
+        circuit = self.circuit
+        xor = xor_keys if self.backend == "fernet" else xor_labels
+        keys, pbits = self.keys, self.pbits
+        # Keys of wires from this one on are dropped after their last use
+        first_dropped = 0 if self.seed is not None else circuit.num_inputs
+
+        gates = zip(circuit.gate_types, circuit.gate_in_a, circuit.gate_in_b)
+        for k, (gate_type, in_a, in_b) in enumerate(gates):
+            out, gate_id = circuit.num_inputs + k, circuit.gate_ids[k]
+            garbled_table = None
+            if self.backend == "aes":
+                keys[out], garbled_table = garble_gate(
+                    gate_id, gate_type, keys[in_a],
+                    keys[in_b] if gate_type != NOT else None, self.offset,
+                    self.half_gates)
+                pbits[out] = lsb(keys[out][0])
+            elif self.free_xor and gate_type in FREE_GATES:
+                key0, pbit = keys[in_a][0], pbits[in_a]
+                if gate_type != NOT:
+                    key0, pbit = xor(key0, keys[in_b][0]), pbit ^ pbits[in_b]
+                # XNOR and NOT outputs are inverted: swap keys and p-bit
+                if gate_type != compiler.XOR:
+                    key0 = xor(key0, self.offset)
+                    pbit ^= 1
+                pbits[out] = pbit
+                self._set_keys(out, key0)
+            else:
+                self._set_keys(out, Fernet.generate_key())
+                garbled_gate = GarbledGate(self._gate(k), keys, pbits)
+                garbled_table = garbled_gate.get_garbled_table()
+
+            if last_use is not None:
+                for w in (in_a, in_b):
+                    if w >= first_dropped and last_use[w] == k:
+                        keys[w] = None
+            if garbled_table is not None:
+                yield k, garbled_table
+
+    def stream_garbled_tables(self, chunk_size=CHUNK_SIZE):
+        """Garble the circuit and yield its packed rows in chunks (AES).
+
+        Each chunk holds whole garbled tables, at least 'chunk_size' bytes
+        of them except for the last chunk. The keys of a gate output are
+        dropped after the last gate reading it, hence only the keys of input
+        and output wires remain once the stream is exhausted.
+
+        Args:
+            chunk_size: Optional; the size in bytes of chunks.
+        """
+        if self.backend != "aes":
+            raise ValueError("Streaming requires the 'aes' backend")
+        stats.count("garble.gates", self.circuit.num_gates)
+        chunk = bytearray()
+        last_use = compiler.last_uses(self.circuit)
+        for _, garbled_table in self._garble_gates(last_use):
+            chunk += garbled_table
+            if len(chunk) >= chunk_size:
+                yield bytes(chunk)
+                chunk = bytearray()
+        if chunk:
+            yield bytes(chunk)
+        if self.seed is not None:
+            self._forget_keys()
 
     def print_garbled_tables(self):
         """Print p-bits and a clear representation of all garbled tables."""
-        print(f"======== {self.circuit['id']} ========")
-        print(f"P-BITS: {self.pbits}")
-        for gate in self.gates:
-            garbled_table = GarbledGate(gate, self.keys, self.pbits)
-            garbled_table.print_garbled_table()
+        circuit = self.circuit
+        keys, pbits = self.get_keys(), self.get_pbits()
+        print(f"======== {circuit.id} ========")
+        print(f"P-BITS: {pbits}")
+        offset = 0  # offset of the next row in packed garbled tables
+        for k in range(circuit.num_gates):
+            gate = self._gate(k, original=True)
+            gate_id, gate_type = gate["id"], gate["type"]
+            count = table_rows(circuit.gate_types[k], self.free_xor,
+                               self.half_gates)
+            if self.free_xor and circuit.gate_types[k] in FREE_GATES:
+                print(f"GATE: {gate_id}, TYPE: {gate_type} (free)")
+            elif self.half_gates:
+                table_g, table_e = unpack_rows(self.garbled_tables, offset, 2)
+                print(f"GATE: {gate_id}, TYPE: {gate_type} (half-gates)")
+                print(f"T_G: {table_g.hex()}")
+                print(f"T_E: {table_e.hex()}")
+            elif self.backend == "aes":
+                rows = itertools.product((0, 1), repeat=len(gate["in"]))
+                print(f"GATE: {gate_id}, TYPE: {gate_type} (row reduced)")
+                for encr_bits, row in zip(
+                        list(rows)[1:],
+                        unpack_rows(self.garbled_tables, offset, count)):
+                    print(f"{list(encr_bits)}: {row.hex()}")
+            else:
+                garbled_table = GarbledGate(gate, keys, pbits, debug=True)
+                garbled_table.print_garbled_table()
+            offset += count * LABEL_SIZE
         print()
 
     def get_pbits(self):
-        """Return dict mapping each wire to its p-bit."""
-        return self.pbits
+        """Return dict mapping each wire to its p-bit, only input and output
+        wires for seeded circuits once garbled."""
+        if self.pbits is not None:
+            return dict(zip(self.circuit.wire_ids, self.pbits))
+        circuit = self.circuit
+        pbits = {w: lsb(key0) for w, (key0, _) in zip(
+            circuit.wire_ids, self.input_keys())}
+        pbits.update(self.get_pbits_out())
+        return pbits
+
+    def get_pbits_out(self):
+        """Return dict mapping each output wire to its p-bit, once garbled."""
+        circuit = self.circuit
+        if self.pbits_out is not None:
+            pbits_out = self.pbits_out
+        else:
+            pbits_out = [self.pbits[w] for w in circuit.out]
+        return dict(zip(circuit.original(circuit.out), pbits_out))
 
     def get_garbled_tables(self):
-        """Return dict mapping each gate to its garbled table."""
+        """Return dict mapping the position of each gate to its garbled table
+        (Fernet) or the buffer of packed rows of all garbled tables (AES),
+        None if the circuit is streamed."""
         return self.garbled_tables
 
     def get_keys(self):
-        """Return dict mapping each wire to its pair of keys."""
-        return self.keys
+        """Return dict mapping each wire to its pair of keys, a SeededKeys
+        mapping of input wires for seeded circuits."""
+        if self.seed is not None:
+            return SeededKeys(self)
+        return dict(zip(self.circuit.wire_ids, self.keys))
+
+    def get_scheme(self):
+        """Return the garbling options Bob needs to evaluate the circuit."""
+        return {
+            "free_xor": self.free_xor,
+            "half_gates": self.half_gates,
+            "backend": self.backend,
+        }
+
+
+class SeededKeys(Mapping):
+    """The pairs of keys of the input wires of a seeded circuit, derived
+    from its seed at each access instead of being stored.
+
+    Args:
+        garbled_circuit: A seeded GarbledCircuit.
+    """
+    def __init__(self, garbled_circuit):
+        circuit = garbled_circuit.circuit
+        self.garbled_circuit = garbled_circuit
+        # map from input wires to their dense position
+        self.index = {w: i for i, w in enumerate(
+            circuit.wire_ids[:circuit.num_inputs])}
+
+    def __getitem__(self, wire):
+        return self.garbled_circuit.input_keys(self.index[wire], 1)[0]
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+def _random_labels(shape):
+    """Return an array of random labels of the given shape."""
+    size = int(np.prod(shape)) * LABEL_SIZE
+    labels = np.frombuffer(os.urandom(size), dtype=np.uint8)
+    return labels.reshape(*shape, LABEL_SIZE).copy()
+
+
+def _tweak_array(tweak):
+    """Return a tweak as an array of LABEL_SIZE bytes."""
+    return np.frombuffer(tweak.to_bytes(LABEL_SIZE, "big"), dtype=np.uint8)
+
+
+def hash_label_batch(labels, tweaks):
+    """Hash an array of labels, see hash_label.
+
+    Args:
+        labels: A (N, LABEL_SIZE) array of labels.
+        tweaks: A (N, LABEL_SIZE) array of tweaks, or a single tweak array.
+
+    Returns:
+        The (N, LABEL_SIZE) array of hashes.
+    """
+    high, low = labels[:, :LABEL_SIZE // 2], labels[:, LABEL_SIZE // 2:]
+    value = np.concatenate((high ^ low, high), axis=1) ^ tweaks
+    blocks = _permutation.update(value.tobytes())
+    return np.frombuffer(blocks, dtype=np.uint8).reshape(value.shape) ^ value
+
+
+class GarbledBatch:
+    """Independent instances of a circuit garbled with half-gates.
+
+    Instances are stored along the first axis of every array and crypto and
+    XOR operations run on all instances at once. Each instance is garbled as
+    with GarbledCircuit(circuit, half_gates=True): the rows of instance i,
+    garbled_tables[i], can also be evaluated by evaluate.
+
+    Args:
+        circuit: A CompiledCircuit, or a dict containing circuit spec.
+        count: The number of instances.
+    """
+    def __init__(self, circuit, count):
+        if isinstance(circuit, dict):
+            circuit = compiler.compile_circuit(circuit)
+
+        self.circuit = circuit
+        self.count = count
+        # Free-XOR offset R of each instance, its last bit being 1
+        self.offsets = _random_labels((count,))
+        self.offsets[:, -1] |= 1
+        # Label of bit 0 of each wire, shape (instances, wires, LABEL_SIZE)
+        self.labels = np.empty((count, circuit.num_wires, LABEL_SIZE),
+                               dtype=np.uint8)
+        self.labels[:, :circuit.num_inputs] = _random_labels(
+            (count, circuit.num_inputs))
+        # Packed rows, shape (instances, rows, LABEL_SIZE)
+        num_rows = sum(table_rows(t, half_gates=True)
+                       for t in circuit.gate_types)
+        self.garbled_tables = np.empty((count, num_rows, LABEL_SIZE),
+                                       dtype=np.uint8)
+
+        self._gen_garbled_tables()
+
+    def _gen_garbled_tables(self):
+        """Create the labels of gate outputs and the garbled tables."""
+        circuit, labels, offsets = self.circuit, self.labels, self.offsets
+        row = 0  # index of the next row in packed garbled tables
+
+        gates = zip(circuit.gate_types, circuit.gate_in_a, circuit.gate_in_b)
+        for k, (gate_type, in_a, in_b) in enumerate(gates):
+            out = circuit.num_inputs + k
+            if gate_type in FREE_GATES:
+                label = labels[:, in_a]
+                if gate_type != NOT:
+                    label = label ^ labels[:, in_b]
+                if gate_type != compiler.XOR:
+                    label = label ^ offsets
+                labels[:, out] = label
+                continue
+
+            inv_a, inv_b, inv_out = HALF_GATES_INVERSIONS[
+                GATE_TYPES[gate_type]]
+            label_a = labels[:, in_a] ^ inv_a * offsets
+            label_b = labels[:, in_b] ^ inv_b * offsets
+            pbit_a = (label_a[:, -1:] & 1)
+            pbit_b = (label_b[:, -1:] & 1)
+            gate_id = circuit.gate_ids[k]
+
+            # Hash both labels of both inputs with a single call to AES
+            tweaks = np.repeat(
+                np.stack((_tweak_array(2 * gate_id),
+                          _tweak_array(2 * gate_id + 1))), 2 * self.count,
+                axis=0)
+            hashes = hash_label_batch(
+                np.concatenate((label_a, label_a ^ offsets,
+                                label_b, label_b ^ offsets)), tweaks)
+            hash_a0, hash_a1, hash_b0, hash_b1 = np.split(hashes, 4)
+
+            # Garbler half gate
+            table_g = hash_a0 ^ hash_a1 ^ pbit_b * offsets
+            label_g = hash_a0 ^ pbit_a * table_g
+            # Evaluator half gate
+            table_e = hash_b0 ^ hash_b1 ^ label_a
+            label_e = hash_b0 ^ pbit_b * (hash_b0 ^ hash_b1)
+
+            labels[:, out] = label_g ^ label_e ^ inv_out * offsets
+            self.garbled_tables[:, row] = table_g
+            self.garbled_tables[:, row + 1] = table_e
+            row += 2
+
+    def encode(self, wires, bits):
+        """Return the labels of some wires for given bits.
+
+        Args:
+            wires: A list of dense wires.
+            bits: A (instances, len(wires)) array of bits.
+
+        Returns:
+            The (instances, len(wires), LABEL_SIZE) array of labels.
+        """
+        bits = np.asarray(bits, dtype=np.uint8)[:, :, None]
+        return self.labels[:, wires] ^ bits * self.offsets[:, None, :]
+
+    def get_pbits(self):
+        """Return the (instances, wires) array of p-bits."""
+        return self.labels[:, :, -1] & 1
+
+    def get_pbits_out(self):
+        """Return the (instances, outputs) array of p-bits of outputs."""
+        return self.labels[:, self.circuit.out, -1] & 1
+
+    def get_garbled_tables(self):
+        """Return the (instances, rows, LABEL_SIZE) array of packed rows."""
+        return self.garbled_tables
+
+
+def evaluate_batch(circuit, g_tables, pbits_out, inputs):
+    """Evaluate instances of a circuit garbled by GarbledBatch.
+
+    Args:
+        circuit: A CompiledCircuit, or a dict containing circuit spec.
+        g_tables: The (instances, rows, LABEL_SIZE) array of packed rows.
+        pbits_out: The (instances, outputs) array of p-bits of outputs.
+        inputs: The (instances, num_inputs, LABEL_SIZE) array of labels of
+            the input wires, in dense order.
+
+    Returns:
+        The (instances, outputs) array of result bits.
+    """
+    if isinstance(circuit, dict):
+        circuit = compiler.compile_circuit(circuit)
+    count = len(inputs)
+    labels = np.empty((count, circuit.num_wires, LABEL_SIZE), dtype=np.uint8)
+    labels[:, :circuit.num_inputs] = inputs
+    row = 0  # index of the next row in packed garbled tables
+
+    gates = zip(circuit.gate_types, circuit.gate_in_a, circuit.gate_in_b)
+    for k, (gate_type, in_a, in_b) in enumerate(gates):
+        out = circuit.num_inputs + k
+        if gate_type in FREE_GATES:
+            labels[:, out] = labels[:, in_a]
+            if gate_type != NOT:
+                labels[:, out] ^= labels[:, in_b]
+            continue
+
+        label_a, label_b = labels[:, in_a], labels[:, in_b]
+        gate_id = circuit.gate_ids[k]
+        tweaks = np.repeat(np.stack((_tweak_array(2 * gate_id),
+                                     _tweak_array(2 * gate_id + 1))),
+                           count, axis=0)
+        hash_a, hash_b = np.split(
+            hash_label_batch(np.concatenate((label_a, label_b)), tweaks), 2)
+        table_g, table_e = g_tables[:, row], g_tables[:, row + 1]
+        labels[:, out] = (hash_a ^ (label_a[:, -1:] & 1) * table_g
+                          ^ hash_b ^ (label_b[:, -1:] & 1) * (table_e ^ label_a))
+        row += 2
+
+    return (labels[:, circuit.out, -1] & 1) ^ pbits_out
@@ -1,60 +1,144 @@
-import subprocess
-from util import (
+import argparse
+from gen_membership_circuit import gen_membership_circuit
+from gen_sort_circuit import circuit_size, decode_output, encode_input, gen_sort_circuit
+from hashing import (
+    ELEMENT_BIT_LENGTH,
+    cuckoo_hash,
+    max_bin_load,
+    num_bins,
+)
+from psi import ALICE_ENDPOINT, AliceSession
+from set_util import (
     read_to_binary_representation,
     resv_length_of_bobs_set,
     get_floats,
-    BIT_LENGTH,
     INPUT_ALICE,
 )
 from verifier import ground_truth
 
 
-def eq_with_bob(i: str) -> bool:
-    proc = subprocess.Popen(
-        [
-            "python",
-            "../garbled_circuit/main.py",
-            "alice",
-            "-c",
-            f"../garbled_circuit/circuits/eq_{BIT_LENGTH}.json",
-            "-i",
-            i,
-            "-l",
-            "debug",
-        ],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
+def common_elements_with_bob(session: AliceSession) -> set[float]:
+    bin_repr_maps_to_float = read_to_binary_representation(INPUT_ALICE)
+    common_elements = intersect_nested(
+        session, list(bin_repr_maps_to_float.keys()), resv_length_of_bobs_set()
     )
 
-    out, err = proc.communicate()
+    return get_floats(common_elements, bin_repr_maps_to_float)
+
 
-    if err:
-        print(err)
+def common_elements_with_bob_membership() -> set[float]:
+    bin_repr_maps_to_float = read_to_binary_representation(INPUT_ALICE)
+    common_elements = intersect_membership(
+        list(bin_repr_maps_to_float.keys()), resv_length_of_bobs_set()
+    )
 
-    out = out.decode().strip()
+    return get_floats(common_elements, bin_repr_maps_to_float)
 
-    if out[-1] == "1":
-        return True
-    else:
-        return False
 
+def common_elements_with_bob_bins() -> set[float]:
+    bin_repr_maps_to_float = read_to_binary_representation(INPUT_ALICE)
+    common_elements = intersect_bins(
+        list(bin_repr_maps_to_float.keys()), resv_length_of_bobs_set()
+    )
+
+    return get_floats(common_elements, bin_repr_maps_to_float)
 
-def common_elements_with_bob() -> set[float]:
+
+def common_elements_with_bob_sort() -> set[float]:
     bin_repr_maps_to_float = read_to_binary_representation(INPUT_ALICE)
-    length_set_bob = resv_length_of_bobs_set()
+    common_elements = intersect_sort(
+        list(bin_repr_maps_to_float.keys()), resv_length_of_bobs_set()
+    )
+
+    return get_floats(common_elements, bin_repr_maps_to_float)
 
+
+def intersect_nested(
+    session: AliceSession, elements: list[str], length_set_bob: int
+) -> set[str]:
+    """Return Alice's elements in Bob's set, comparing each pair."""
     common_elements = set()
-    for i in bin_repr_maps_to_float.keys():
+    for i in elements:
         for _ in range(0, length_set_bob):
-            if eq_with_bob(i):
+            if session.compare(i):
                 common_elements.add(i)
                 break
 
-    return get_floats(common_elements, bin_repr_maps_to_float)
+    return common_elements
+
+
+def intersect_membership(
+    elements: list[str], length_set_bob: int, endpoint: str = ALICE_ENDPOINT
+) -> set[str]:
+    """Return Alice's elements in Bob's set, one membership circuit each."""
+    # One membership circuit per element, the last output is the membership
+    circuit = gen_membership_circuit(length_set_bob, per_element=True)
+    session = AliceSession(circuit, endpoint=endpoint)
+    results = session.evaluate_many(elements)
+    session.close()
+
+    return {i for i, outputs in zip(elements, results) if outputs[-1]}
+
+
+def intersect_bins(
+    elements: list[str], length_set_bob: int, endpoint: str = ALICE_ENDPOINT
+) -> set[str]:
+    """Return Alice's elements in Bob's set, comparing elements of bins."""
+    # Alice's bins hold one element each, Bob's bins a fixed number of slots
+    bins = num_bins(len(elements))
+    load = max_bin_load(length_set_bob, bins)
+    table, seed = cuckoo_hash(elements, bins)
+
+    circuit = gen_membership_circuit(load, per_element=True, bit_length=ELEMENT_BIT_LENGTH)
+    params = {"bins": bins, "load": load, "seed": seed}
+    session = AliceSession(circuit, endpoint=endpoint, params=params)
+    results = session.evaluate_many(table)
+    session.close()
+
+    return {
+        encoding[1:]
+        for encoding, outputs in zip(table, results)
+        if encoding[0] == "0" and outputs[-1]
+    }
+
+
+def intersect_sort(
+    elements: list[str], length_set_bob: int, endpoint: str = ALICE_ENDPOINT
+) -> set[str]:
+    """Return Alice's elements in Bob's set, merging the sorted sets."""
+    # One circuit merges both sorted sets, Alice sends its size to Bob
+    size = circuit_size(len(elements), length_set_bob)
+    session = AliceSession(
+        gen_sort_circuit(size), endpoint=endpoint, params={"size": size}
+    )
+    outputs = session.evaluate_many([encode_input(elements, size)])[0]
+    session.close()
+
+    return decode_output(outputs)
 
 
 def main():
-    common_elements = common_elements_with_bob()
+    parser = argparse.ArgumentParser(description="Run Alice's side of the PSI.")
+    parser.add_argument(
+        "--mode",
+        choices=["nested", "membership", "bins", "sort"],
+        default="nested",
+        help="compare each pair of elements, each element with Bob's set, "
+        "only elements hashed to the same bin, or adjacent elements of the "
+        "merged sets",
+    )
+    args = parser.parse_args()
+
+    if args.mode == "membership":
+        common_elements = common_elements_with_bob_membership()
+    elif args.mode == "bins":
+        common_elements = common_elements_with_bob_bins()
+    elif args.mode == "sort":
+        common_elements = common_elements_with_bob_sort()
+    else:
+        session = AliceSession()
+        common_elements = common_elements_with_bob(session)
+        session.close()
 
     print(f"Common elements with bob: {common_elements}")
     print(f"Calculation was successful: {common_elements == ground_truth()}")
@@ -0,0 +1,164 @@
+import argparse
+import json
+import random
+import socket
+import sys
+import threading
+import time
+
+import alice
+import bob
+from psi import GARBLED_CIRCUIT_DIR
+from set_util import float_to_binary
+
+# bench is a module of the garbled circuit, see psi
+if GARBLED_CIRCUIT_DIR not in sys.path:
+    sys.path.insert(0, GARBLED_CIRCUIT_DIR)
+
+import bench  # noqa: E402
+
+SEED = bench.SEED  # seed of the sets
+SIZES = (4, 8, 16, 32, 64)  # sizes of the sets of both parties
+MODES = ("nested", "membership", "bins", "sort")
+MAX_NESTED_SIZE = 16  # the nested mode takes size^2 round trips
+
+
+def random_sets(
+    size: int, seed: int = SEED
+) -> tuple[list[str], list[str], set[str]]:
+    """Return random sets of Alice and Bob sharing half of their elements.
+
+    Returns:
+        The binary representations of Alice's and Bob's elements, and of
+        their common elements.
+    """
+    rng = random.Random(seed)
+    common = size // 2
+    elements = set()
+    while len(elements) < 2 * size - common:
+        elements.add(float_to_binary(rng.uniform(-1e6, 1e6)))
+    elements = sorted(elements)
+    rng.shuffle(elements)
+    set_a = elements[:size]
+    set_b = elements[:common] + elements[size:]
+    rng.shuffle(set_b)
+    return set_a, set_b, set(elements[:common])
+
+
+def free_port() -> int:
+    """Return a free TCP port of the local host."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def run_psi(
+    mode: str, set_a: list[str], set_b: list[str]
+) -> tuple[float, set[str], set[str]]:
+    """Run a PSI between Alice and a Bob thread.
+
+    Returns:
+        The seconds the PSI took, and the intersections Alice and Bob found.
+    """
+    endpoint = f"tcp://127.0.0.1:{free_port()}"
+    results = {}
+
+    def run_bob():
+        if mode == "nested":
+            session = bob.BobSession(endpoint)
+            results["bob"] = bob.intersect_nested(session, set_b, len(set_a))
+            session.close()
+        elif mode == "membership":
+            results["bob"] = bob.intersect_membership(
+                set_b, len(set_a), endpoint
+            )
+        elif mode == "bins":
+            results["bob"] = bob.intersect_bins(set_b, endpoint)
+        else:
+            results["bob"] = bob.intersect_sort(set_b, endpoint)
+
+    thread = threading.Thread(target=run_bob, daemon=True)
+    thread.start()
+    start = time.perf_counter()
+    if mode == "nested":
+        session = alice.AliceSession(endpoint=endpoint)
+        common = alice.intersect_nested(session, set_a, len(set_b))
+        session.close()
+    elif mode == "membership":
+        common = alice.intersect_membership(set_a, len(set_b), endpoint)
+    elif mode == "bins":
+        common = alice.intersect_bins(set_a, len(set_b), endpoint)
+    else:
+        common = alice.intersect_sort(set_a, len(set_b), endpoint)
+    thread.join()
+    return time.perf_counter() - start, common, results.get("bob")
+
+
+def bench_psi(
+    modes: list[str] = MODES, sizes: list[int] = SIZES, seed: int = SEED
+) -> list[dict]:
+    """Measure the time of PSIs against the size of sets.
+
+    Returns:
+        A list of results, one for each mode and size.
+    """
+    results = []
+    for mode in modes:
+        for size in sizes:
+            if mode == "nested" and size > MAX_NESTED_SIZE:
+                continue
+            set_a, set_b, expected = random_sets(size, seed)
+            print(f"PSI {mode} of {size} elements", file=sys.stderr)
+            seconds, common_a, common_b = run_psi(mode, set_a, set_b)
+            results.append(
+                {
+                    "mode": mode,
+                    "size": size,
+                    "seconds": seconds,
+                    "elements_per_second": size / seconds,
+                    "correct": common_a == expected and common_b == expected,
+                }
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark PSIs against the size of sets."
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="results.json",
+        help="write the JSON results to this file instead of the standard "
+        "output",
+    )
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=MODES,
+        default=MODES,
+        help="the PSI modes to run",
+    )
+    parser.add_argument(
+        "--sizes", nargs="+", type=int, default=SIZES, help="the sizes of both sets"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=SEED, help=f"the seed of the sets ({SEED})"
+    )
+    args = parser.parse_args()
+
+    results = {
+        "meta": bench.metadata(args.seed),
+        "psi": bench_psi(args.modes, args.sizes, args.seed),
+    }
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
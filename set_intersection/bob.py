@@ -1,5 +1,8 @@
-import subprocess
-from util import (
+import argparse
+from gen_sort_circuit import decode_output, encode_input
+from hashing import simple_hash
+from psi import BOB_ENDPOINT, BobSession
+from set_util import (
     read_to_binary_representation,
     resv_length_of_alice_set,
     get_floats,
@@ -8,38 +11,117 @@ from util import (
 from verifier import ground_truth
 
 
-def eq_with_alice(i: str) -> bool:
-    proc = subprocess.Popen(
-        ["python", "../garbled_circuit/main.py", "bob", "-i", i, "-l", "debug"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
+def common_elements_with_alice(session: BobSession) -> set[float]:
+    bin_repr_maps_to_float = read_to_binary_representation(INPUT_BOB)
+    common_elements = intersect_nested(
+        session, list(bin_repr_maps_to_float.keys()), resv_length_of_alice_set()
     )
 
-    out = proc.stdout.readline().decode().strip()
-    proc.terminate()
+    return get_floats(common_elements, bin_repr_maps_to_float)
 
-    if out[-1] == "1":
-        return True
-    else:
-        return False
 
+def common_elements_with_alice_membership() -> set[float]:
+    bin_repr_maps_to_float = read_to_binary_representation(INPUT_BOB)
+    common_elements = intersect_membership(
+        list(bin_repr_maps_to_float.keys()), resv_length_of_alice_set()
+    )
 
-def common_elements_with_alice() -> set[float]:
+    return get_floats(common_elements, bin_repr_maps_to_float)
+
+
+def common_elements_with_alice_bins() -> set[float]:
     bin_repr_maps_to_float = read_to_binary_representation(INPUT_BOB)
-    length_set_alice = resv_length_of_alice_set()
+    common_elements = intersect_bins(list(bin_repr_maps_to_float.keys()))
 
+    return get_floats(common_elements, bin_repr_maps_to_float)
+
+
+def common_elements_with_alice_sort() -> set[float]:
+    bin_repr_maps_to_float = read_to_binary_representation(INPUT_BOB)
+    common_elements = intersect_sort(list(bin_repr_maps_to_float.keys()))
+
+    return get_floats(common_elements, bin_repr_maps_to_float)
+
+
+def intersect_nested(
+    session: BobSession, elements: list[str], length_set_alice: int
+) -> set[str]:
+    """Return Bob's elements in Alice's set, comparing each pair."""
     common_elements = set()
     for _ in range(0, length_set_alice):
-        for i in bin_repr_maps_to_float:
-            if eq_with_alice(i):
+        for i in elements:
+            if session.compare(i):
                 common_elements.add(i)
                 break
 
-    return get_floats(common_elements, bin_repr_maps_to_float)
+    return common_elements
+
+
+def intersect_membership(
+    elements: list[str], length_set_alice: int, endpoint: str = BOB_ENDPOINT
+) -> set[str]:
+    """Return Bob's elements in Alice's set, see alice.intersect_membership."""
+    # Bob's whole set is his input to each of Alice's membership circuits
+    session = BobSession(endpoint)
+    results = session.evaluate_many(["".join(elements)] * length_set_alice)
+    session.close()
+
+    common_elements = set()
+    for outputs in results:
+        common_elements.update(i for i, eq in zip(elements, outputs) if eq)
+
+    return common_elements
+
+
+def intersect_bins(elements: list[str], endpoint: str = BOB_ENDPOINT) -> set[str]:
+    """Return Bob's elements in Alice's set, see alice.intersect_bins."""
+    # Alice sends the number of bins, their load and the seed of hashes
+    session = BobSession(endpoint)
+    params = session.params
+    table = simple_hash(elements, params["bins"], params["load"], params["seed"])
+    results = session.evaluate_many(["".join(slots) for slots in table])
+    session.close()
+
+    common_elements = set()
+    for slots, outputs in zip(table, results):
+        common_elements.update(e[1:] for e, eq in zip(slots, outputs) if eq)
+
+    return common_elements
+
+
+def intersect_sort(elements: list[str], endpoint: str = BOB_ENDPOINT) -> set[str]:
+    """Return Bob's elements in Alice's set, see alice.intersect_sort."""
+    # Alice sends the number of elements of each set in the circuit
+    session = BobSession(endpoint)
+    inputs = encode_input(elements, session.params["size"])
+    outputs = session.evaluate_many([inputs])[0]
+    session.close()
+
+    return decode_output(outputs)
 
 
 def main():
-    common_elements = common_elements_with_alice()
+    parser = argparse.ArgumentParser(description="Run Bob's side of the PSI.")
+    parser.add_argument(
+        "--mode",
+        choices=["nested", "membership", "bins", "sort"],
+        default="nested",
+        help="compare each pair of elements, each element with Bob's set, "
+        "only elements hashed to the same bin, or adjacent elements of the "
+        "merged sets",
+    )
+    args = parser.parse_args()
+
+    if args.mode == "membership":
+        common_elements = common_elements_with_alice_membership()
+    elif args.mode == "bins":
+        common_elements = common_elements_with_alice_bins()
+    elif args.mode == "sort":
+        common_elements = common_elements_with_alice_sort()
+    else:
+        session = BobSession()
+        common_elements = common_elements_with_alice(session)
+        session.close()
 
     print(f"Common elements with alice: {common_elements}")
     print(f"Calculation was successful: {common_elements == ground_truth()}")
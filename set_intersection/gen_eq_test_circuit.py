@@ -1,7 +1,7 @@
-# from util import BIT_LENGTH
+# from set_util import BIT_LENGTH
 from math import log2
 import json
-from util import BIT_LENGTH
+from set_util import BIT_LENGTH
 
 
 def gen_gates_to_test_bitwise_eq(
@@ -0,0 +1,109 @@
+import argparse
+import json
+from set_util import BIT_LENGTH
+
+
+def gen_tree(
+    gate_type: str, wires: list[int], next_gate_id: int
+) -> tuple[list[dict], int, int]:
+    """Combine wires with a balanced tree of 2-input gates.
+
+    Returns the gates, the output wire of the tree and the next gate ID.
+    """
+    gates = []
+
+    while len(wires) > 1:
+        level = []
+        for i in range(0, len(wires) - 1, 2):
+            gates.append(
+                {"id": next_gate_id, "type": gate_type, "in": [wires[i], wires[i + 1]]}
+            )
+            level.append(next_gate_id)
+            next_gate_id += 1
+        if len(wires) % 2:
+            level.append(wires[-1])
+        wires = level
+
+    return gates, wires[0], next_gate_id
+
+
+def gen_eq_gates(
+    a_wires: list[int], b_wires: list[int], next_gate_id: int
+) -> tuple[list[dict], int, int]:
+    """Compare two elements bitwise with XNOR gates and an AND tree."""
+    gates = []
+    eq_bits = []
+
+    for a_wire, b_wire in zip(a_wires, b_wires):
+        gates.append({"id": next_gate_id, "type": "XNOR", "in": [a_wire, b_wire]})
+        eq_bits.append(next_gate_id)
+        next_gate_id += 1
+
+    and_gates, out_wire, next_gate_id = gen_tree("AND", eq_bits, next_gate_id)
+    return gates + and_gates, out_wire, next_gate_id
+
+
+def gen_membership_circuit(
+    set_size: int, per_element: bool = False, bit_length: int = BIT_LENGTH
+) -> dict:
+    """Generate a circuit testing whether Alice's element is in Bob's set.
+
+    Alice's element is compared with each of Bob's 'set_size' elements and
+    the equality bits are combined by an OR tree into the last output.
+
+    Args:
+        set_size: The number of Bob's elements.
+        per_element: Also output the equality bit of each of Bob's elements,
+            before the membership bit.
+        bit_length: The number of bits of an element.
+    """
+    a_wires = list(range(1, bit_length + 1))
+    b_wires = list(range(bit_length + 1, (set_size + 1) * bit_length + 1))
+    next_gate_id = (set_size + 1) * bit_length + 1
+
+    gates = []
+    eq_wires = []
+    for j in range(set_size):
+        element = b_wires[j * bit_length : (j + 1) * bit_length]
+        eq_gates, eq_wire, next_gate_id = gen_eq_gates(a_wires, element, next_gate_id)
+        gates += eq_gates
+        eq_wires.append(eq_wire)
+
+    or_gates, member_wire, _ = gen_tree("OR", eq_wires, next_gate_id)
+    gates += or_gates
+
+    out_wires = [member_wire]
+    if per_element:
+        out_wires = eq_wires + out_wires
+
+    return {
+        "id": f"{bit_length}-bit membership in {set_size} elements",
+        "alice": a_wires,
+        "bob": b_wires,
+        "out": out_wires,
+        "gates": gates,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a membership circuit.")
+    parser.add_argument("set_size", type=int, help="the number of Bob's elements")
+    parser.add_argument(
+        "--per-element",
+        action="store_true",
+        help="also output the equality bit of each of Bob's elements",
+    )
+    args = parser.parse_args()
+
+    name = f"member_{BIT_LENGTH}_{args.set_size}"
+    circuit = {
+        "name": name,
+        "circuits": [gen_membership_circuit(args.set_size, args.per_element)],
+    }
+
+    with open(f"../garbled_circuit/circuits/{name}.json", "w") as json_file:
+        json.dump(circuit, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import argparse
+import json
+import random
+from gen_membership_circuit import gen_eq_gates
+from set_util import BIT_LENGTH
+
+# Encodings in the sorting network: a tag bit, 0 for elements, followed by
+# the element; dummies have tag 1 and sort after all elements
+ELEMENT_BIT_LENGTH = BIT_LENGTH + 1
+DUMMY = "1" * ELEMENT_BIT_LENGTH
+RECORD_BIT_LENGTH = BIT_LENGTH + 1  # a match bit followed by the element
+
+
+class CircuitBuilder:
+    """Build the gates of a circuit, numbering them from 'next_gate_id'."""
+
+    def __init__(self, next_gate_id: int):
+        self.gates = []
+        self.next_gate_id = next_gate_id
+
+    def gate(self, gate_type: str, *wires: int) -> int:
+        """Add a gate and return its output wire."""
+        gate_id = self.next_gate_id
+        self.gates.append({"id": gate_id, "type": gate_type, "in": list(wires)})
+        self.next_gate_id += 1
+        return gate_id
+
+    def swap(self, s: int, x: list[int], y: list[int]) -> tuple[list[int], list[int]]:
+        """Swap two values if the bit 's' is 1, with one AND gate per bit."""
+        new_x, new_y = [], []
+        for x_i, y_i in zip(x, y):
+            d = self.gate("AND", s, self.gate("XOR", x_i, y_i))
+            new_x.append(self.gate("XOR", x_i, d))
+            new_y.append(self.gate("XOR", y_i, d))
+        return new_x, new_y
+
+    def greater(self, x: list[int], y: list[int]) -> int:
+        """Return whether x > y, bits being given MSB first.
+
+        The carry c = (x > y) on the lowest bits is updated with one AND gate
+        per bit: c' = x_i ^ ((x_i ^ c) & (y_i ^ c)).
+        """
+        carry = self.gate("AND", x[-1], self.gate("NOT", y[-1]))
+        for x_i, y_i in zip(reversed(x[:-1]), reversed(y[:-1])):
+            masked = self.gate(
+                "AND", self.gate("XOR", x_i, carry), self.gate("XOR", y_i, carry)
+            )
+            carry = self.gate("XOR", x_i, masked)
+        return carry
+
+    def compare_and_swap(self, x: list[int], y: list[int]) -> tuple[list[int], list[int]]:
+        """Return (min, max) of two values."""
+        return self.swap(self.greater(x, y), x, y)
+
+    def equal(self, x: list[int], y: list[int]) -> int:
+        """Return whether two values are equal."""
+        gates, eq_wire, self.next_gate_id = gen_eq_gates(x, y, self.next_gate_id)
+        self.gates += gates
+        return eq_wire
+
+    def benes(self, records: list[list[int]], switches) -> list[list[int]]:
+        """Permute records with a Benes network, see benes_switches.
+
+        Args:
+            records: A power of 2 number of values.
+            switches: An iterator over the switch wires, in routing order.
+        """
+        n = len(records)
+        if n == 2:
+            return list(self.swap(next(switches), *records))
+
+        upper, lower = [], []
+        for i in range(n // 2):
+            top, bottom = self.swap(next(switches), records[2 * i], records[2 * i + 1])
+            upper.append(top)
+            lower.append(bottom)
+        upper = self.benes(upper, switches)
+        lower = self.benes(lower, switches)
+
+        outputs = []
+        for i in range(n // 2):
+            outputs.extend(self.swap(next(switches), upper[i], lower[i]))
+        return outputs
+
+
+def odd_even_merge(lo: int, hi: int, r: int = 1):
+    """Yield the comparators of Batcher's odd-even merge of lo..hi.
+
+    Both halves of the (power of 2) range must be sorted, the comparator
+    (i, j) puts the minimum in i.
+    """
+    step = r * 2
+    if step < hi - lo:
+        yield from odd_even_merge(lo, hi, step)
+        yield from odd_even_merge(lo + r, hi, step)
+        yield from [(i, i + r) for i in range(lo + r, hi - r, step)]
+    else:
+        yield (lo, lo + r)
+
+
+def num_benes_switches(n: int) -> int:
+    """Return the number of switches of a Benes network of n values."""
+    return 1 if n == 2 else n + 2 * num_benes_switches(n // 2)
+
+
+def benes_switches(perm: list[int]) -> list[int]:
+    """Route a permutation through a Benes network (looping algorithm).
+
+    Args:
+        perm: A permutation of a power of 2 number of values, output j
+            receiving input perm[j].
+
+    Returns:
+        The switch bits, in the order used by CircuitBuilder.benes.
+    """
+    n = len(perm)
+    if n == 2:
+        return [int(perm[0] == 1)]
+
+    inverse = [0] * n
+    for j, i in enumerate(perm):
+        inverse[i] = j
+
+    # Assign each input and output to the upper (0) or lower (1) subnetwork
+    in_sub, out_sub = [None] * n, [None] * n
+    for start in range(n):
+        j = start
+        while out_sub[j] is None:
+            out_sub[j] = 0
+            i = perm[j]
+            in_sub[i], in_sub[i ^ 1] = 0, 1
+            j = inverse[i ^ 1]
+            out_sub[j] = 1
+            j ^= 1
+
+    sub_perms = ([0] * (n // 2), [0] * (n // 2))
+    for j in range(n):
+        sub_perms[out_sub[j]][j // 2] = perm[j] // 2
+
+    return (
+        [in_sub[2 * i] for i in range(n // 2)]
+        + benes_switches(sub_perms[0])
+        + benes_switches(sub_perms[1])
+        + [out_sub[2 * i] for i in range(n // 2)]
+    )
+
+
+def gen_sort_circuit(size: int) -> dict:
+    """Generate a sort-compare-shuffle circuit for sets of 'size' elements.
+
+    Alice's inputs are her sorted set then the switches of her shuffle, and
+    so are Bob's (see encode_input). Both sorted sets are merged by an
+    odd-even merge network, each pair of adjacent elements is compared, and
+    records of a match bit and the matching element (or zeros) are shuffled
+    by Alice's then Bob's Benes network, so that their order reveals nothing.
+
+    Args:
+        size: A power of 2 number of elements of each set, with dummies.
+    """
+    num_switches = num_benes_switches(2 * size)
+    num_inputs = size * ELEMENT_BIT_LENGTH + num_switches
+    a_wires = list(range(1, num_inputs + 1))
+    b_wires = list(range(num_inputs + 1, 2 * num_inputs + 1))
+    builder = CircuitBuilder(2 * num_inputs + 1)
+
+    def elements(wires):
+        return [
+            wires[k * ELEMENT_BIT_LENGTH : (k + 1) * ELEMENT_BIT_LENGTH]
+            for k in range(size)
+        ]
+
+    # Merge
+    values = elements(a_wires) + elements(b_wires)
+    for i, j in odd_even_merge(0, 2 * size - 1):
+        values[i], values[j] = builder.compare_and_swap(values[i], values[j])
+
+    # Compare adjacent elements, ignoring dummies
+    zero = builder.gate("XOR", a_wires[0], a_wires[0])
+    records = []
+    for x, y in zip(values, values[1:]):
+        match = builder.gate("AND", builder.equal(x, y), builder.gate("NOT", x[0]))
+        records.append([match] + [builder.gate("AND", match, x_i) for x_i in x[1:]])
+    records.append([zero] * RECORD_BIT_LENGTH)
+
+    # Shuffle
+    a_switches = iter(a_wires[size * ELEMENT_BIT_LENGTH :])
+    b_switches = iter(b_wires[size * ELEMENT_BIT_LENGTH :])
+    records = builder.benes(builder.benes(records, a_switches), b_switches)
+
+    return {
+        "id": f"{BIT_LENGTH}-bit sort-compare-shuffle of {size} elements",
+        "alice": a_wires,
+        "bob": b_wires,
+        "out": [w for record in records for w in record],
+        "gates": builder.gates,
+    }
+
+
+def circuit_size(set_size: int, other_set_size: int) -> int:
+    """Return the number of elements of each set in the circuit."""
+    size = 1
+    while size < max(set_size, other_set_size):
+        size *= 2
+    return size
+
+
+def encode_input(elements: list[str], size: int) -> str:
+    """Return the input bits of a party: its sorted set and random switches.
+
+    Args:
+        elements: The binary representations of the party's elements.
+        size: The number of elements of each set in the circuit.
+    """
+    encodings = sorted("0" + element for element in elements)
+    encodings += [DUMMY] * (size - len(encodings))
+    perm = list(range(2 * size))
+    random.SystemRandom().shuffle(perm)
+    switches = "".join(str(bit) for bit in benes_switches(perm))
+    return "".join(encodings) + switches
+
+
+def decode_output(outputs: list[int]) -> set[str]:
+    """Return the binary representations of the common elements."""
+    common_elements = set()
+    for k in range(0, len(outputs), RECORD_BIT_LENGTH):
+        record = outputs[k : k + RECORD_BIT_LENGTH]
+        if record[0]:
+            common_elements.add("".join(str(bit) for bit in record[1:]))
+    return common_elements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a sort-compare-shuffle circuit.")
+    parser.add_argument("size", type=int, help="the number of elements of each set, a power of 2")
+    args = parser.parse_args()
+
+    name = f"sort_{BIT_LENGTH}_{args.size}"
+    circuit = {"name": name, "circuits": [gen_sort_circuit(args.size)]}
+
+    with open(f"../garbled_circuit/circuits/{name}.json", "w") as json_file:
+        json.dump(circuit, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
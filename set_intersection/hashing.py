@@ -0,0 +1,103 @@
+import hashlib
+import math
+from set_util import BIT_LENGTH
+
+NUM_HASHES = 3  # number of hash functions of cuckoo hashing
+BIN_FACTOR = 1.27  # number of bins per element of Alice
+MAX_EVICTIONS = 500  # evictions before a cuckoo hashing attempt fails
+MAX_SEEDS = 100  # seeds tried before giving up on cuckoo hashing
+STATISTICAL_SECURITY = 40  # a bin overflows with probability below 2^-40
+
+# Encodings in bins: a tag bit, 0 for elements, followed by the element
+ELEMENT_BIT_LENGTH = BIT_LENGTH + 1
+ALICE_DUMMY = "1" + "0" * BIT_LENGTH
+BOB_DUMMY = "1" + "1" * BIT_LENGTH
+
+
+def num_bins(set_size: int) -> int:
+    """Return the number of bins for Alice's set of 'set_size' elements."""
+    return max(NUM_HASHES, math.ceil(BIN_FACTOR * set_size))
+
+
+def bin_of(element: str, index: int, bins: int, seed: int) -> int:
+    """Return the bin of an element for the index-th hash function."""
+    digest = hashlib.sha256(f"{seed}:{index}:{element}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") % bins
+
+
+def _binomial_tail(trials: int, p: float, k: int) -> float:
+    """Return the probability that a binomial variable is above k."""
+    if k >= trials:
+        return 0.0
+    if p >= 1.0:
+        return 1.0
+
+    tail = 0.0
+    for j in range(k + 1, trials + 1):
+        log_term = (
+            math.lgamma(trials + 1)
+            - math.lgamma(j + 1)
+            - math.lgamma(trials - j + 1)
+            + j * math.log(p)
+            + (trials - j) * math.log1p(-p)
+        )
+        term = math.exp(log_term)
+        tail += term
+        if j > trials * p and term < tail * 2**-60:
+            break
+    return tail
+
+
+def max_bin_load(set_size: int, bins: int) -> int:
+    """Return the number of slots of each of Bob's bins.
+
+    Each of Bob's 'set_size' elements lands in a bin with probability at
+    most NUM_HASHES / bins: the number of slots is the smallest load that
+    no bin exceeds, except with probability 2^-STATISTICAL_SECURITY.
+    """
+    p = min(1.0, NUM_HASHES / bins)
+    for load in range(set_size + 1):
+        if bins * _binomial_tail(set_size, p, load) < 2**-STATISTICAL_SECURITY:
+            return load
+    return set_size
+
+
+def cuckoo_hash(elements: list[str], bins: int) -> tuple[list[str], int]:
+    """Cuckoo hash Alice's elements, at most one per bin.
+
+    Returns the encoded content of each bin, ALICE_DUMMY for empty bins,
+    and the seed of the hash functions.
+    """
+    for seed in range(MAX_SEEDS):
+        table = [None] * bins
+        for element in elements:
+            index = 0
+            for _ in range(MAX_EVICTIONS):
+                b = bin_of(element, index, bins, seed)
+                table[b], element = (element, index), table[b]
+                if element is None:
+                    break
+                # Move the evicted element to the bin of its next hash
+                element, index = element[0], (element[1] + 1) % NUM_HASHES
+            else:
+                break
+        else:
+            return [ALICE_DUMMY if e is None else "0" + e[0] for e in table], seed
+
+    raise ValueError(f"Cuckoo hashing failed with {MAX_SEEDS} seeds")
+
+
+def simple_hash(elements: list[str], bins: int, load: int, seed: int) -> list[list[str]]:
+    """Hash Bob's elements into every bin of their hash functions.
+
+    Returns the encoded content of each bin, padded with BOB_DUMMY to 'load'
+    slots so that bins don't reveal their load.
+    """
+    table = [[] for _ in range(bins)]
+    for element in elements:
+        for b in {bin_of(element, index, bins, seed) for index in range(NUM_HASHES)}:
+            table[b].append("0" + element)
+
+    if any(len(slots) > load for slots in table):
+        raise ValueError("A bin overflows, retry with another seed")
+    return [slots + [BOB_DUMMY] * (load - len(slots)) for slots in table]
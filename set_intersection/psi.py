@@ -0,0 +1,249 @@
+import os
+import sys
+
+# The modules of the garbled circuit import each other by name
+GARBLED_CIRCUIT_DIR = os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                 "garbled_circuit")
+)
+sys.path.insert(0, GARBLED_CIRCUIT_DIR)
+
+import compiler  # noqa: E402
+import ot  # noqa: E402
+import util  # noqa: E402
+import yao  # noqa: E402
+from set_util import BIT_LENGTH  # noqa: E402
+
+EQ_CIRCUIT = os.path.join(GARBLED_CIRCUIT_DIR, "circuits",
+                          f"eq_{BIT_LENGTH}.json")
+ALICE_ENDPOINT = f"tcp://{util.SERVER_HOST}:{util.SERVER_PORT}"  # Bob's
+BOB_ENDPOINT = f"tcp://*:{util.LOCAL_PORT}"  # the endpoint Bob listens on
+
+
+class AliceSession:
+    """Alice's end of a set intersection session.
+
+    A single connection, the compiled circuit and the state of oblivious
+    transfers (e.g. the base OTs of OT extension) are kept for the whole
+    session. Each comparison uses a freshly garbled circuit, or one taken
+    from a pool of pre-garbled circuits.
+
+    Args:
+        circuit: Optional; the circuit comparing elements, as a JSON file or
+            a dict containing circuit spec (EQ_CIRCUIT by default).
+        endpoint: Optional; Bob's endpoint.
+        half_gates: Optional; garble with half-gates (True by default).
+        ot_extension: Optional; use OT extension (True by default).
+        batched_ot: Optional; run all OTs of a comparison at once, along
+            with the garbled tables (True by default).
+        ot_group: Optional; the group of public-key OTs (see ot.OT_GROUPS).
+        pool: Optional; a pool.GarblingPool of the circuit, whose scheme
+            overrides 'half_gates'.
+        params: Optional; public parameters of the session sent to Bob,
+            e.g. the seed of hash functions.
+    """
+
+    def __init__(
+        self,
+        circuit=EQ_CIRCUIT,
+        endpoint=ALICE_ENDPOINT,
+        half_gates=True,
+        ot_extension=True,
+        batched_ot=True,
+        ot_group="x25519",
+        pool=None,
+        params=None,
+    ):
+        if isinstance(circuit, str):
+            circuit = util.parse_json(circuit)["circuits"][0]
+        self.circuit = compiler.compile_circuit(circuit)
+        self.pool = pool
+        self.scheme = pool.get_scheme() if pool else {
+            "free_xor": half_gates,
+            "half_gates": half_gates,
+            "backend": "aes",
+        }
+        self.socket = util.GarblerSocket(endpoint)
+        self.ot = ot.ObliviousTransfer(self.socket, extension=ot_extension,
+                                       batched=batched_ot, group=ot_group)
+
+        # Bob keeps the circuit and the scheme for the whole session
+        self.socket.send_wait({"circuit": self.circuit, "scheme": self.scheme,
+                               "params": params or {}})
+
+    def compare(self, bits: str) -> bool:
+        """Evaluate the circuit with Bob on Alice's input bits.
+
+        Args:
+            bits: Alice's input bits, e.g. "0110".
+
+        Returns:
+            The (first) output bit of the circuit.
+        """
+        instance = self._garble()
+        a_inputs, b_keys = self._encode(instance, bits)
+        upload = {
+            "garbled_tables": instance["garbled_tables"],
+            "pbits_out": instance["pbits_out"],
+        }
+
+        result = self.ot.get_result(a_inputs, b_keys, upload,
+                                    ["garbled_tables"])
+        return result[self.circuit.original(self.circuit.out)[0]] == 1
+
+    def evaluate_many(self, inputs: list[str]) -> list[list[int]]:
+        """Evaluate one circuit per input of Alice with a single OT batch.
+
+        All garbled circuits and Alice's inputs are sent at once, and the
+        OTs of Bob's inputs to all circuits form one batch, hence the whole
+        call takes a constant number of round trips. Requires batched OT.
+
+        Args:
+            inputs: Alice's input bits of each circuit.
+
+        Returns:
+            The output bits of each circuit, in the order of its outputs.
+        """
+        if not self.ot.batched:
+            raise ValueError("Evaluating many circuits requires batched OT")
+        instances = [self._garble() for _ in inputs]
+        a_inputs = []
+        b_keys = {}  # map from (circuit, Bob's wire) to a pair (key, encr_bit)
+        for k, (instance, bits) in enumerate(zip(instances, inputs)):
+            a_inputs_k, b_keys_k = self._encode(instance, bits)
+            a_inputs.append(a_inputs_k)
+            b_keys.update({(k, w): pair for w, pair in b_keys_k.items()})
+        upload = {
+            "garbled_tables": b"".join(i["garbled_tables"] for i in instances),
+            "pbits_out": [i["pbits_out"] for i in instances],
+        }
+
+        return self.ot.get_result(a_inputs, b_keys, upload,
+                                  ["garbled_tables"])
+
+    def _garble(self):
+        """Return a garbled instance of the circuit, from the pool if any."""
+        circuit = self.circuit
+        instance = self.pool.take(0) if self.pool else None
+        if instance is None:
+            garbled_circuit = yao.GarbledCircuit(
+                circuit, free_xor=self.scheme["free_xor"],
+                half_gates=self.scheme["half_gates"])
+            instance = {
+                "garbled_tables": garbled_circuit.get_garbled_tables(),
+                "keys": garbled_circuit.get_keys(),
+                "pbits": garbled_circuit.get_pbits(),
+            }
+        pbits = instance["pbits"]
+        instance["pbits_out"] = {w: pbits[w]
+                                 for w in circuit.original(circuit.out)}
+        return instance
+
+    def _encode(self, instance, bits):
+        """Return Alice's inputs and the keys of Bob's wires of an instance."""
+        circuit = self.circuit
+        keys, pbits = instance["keys"], instance["pbits"]
+        a_inputs = {  # map from Alice's wires to (key, encr_bit) inputs
+            w: (keys[w][int(b)], pbits[w] ^ int(b))
+            for w, b in zip(circuit.original(circuit.alice), bits)
+        }
+        b_keys = {  # map from Bob's wires to a pair (key, encr_bit)
+            w: ((keys[w][0], pbits[w]), (keys[w][1], pbits[w] ^ 1))
+            for w in circuit.original(circuit.bob)
+        }
+        return a_inputs, b_keys
+
+    def close(self):
+        self.socket.socket.close()
+
+
+class BobSession:
+    """Bob's end of a set intersection session, see AliceSession.
+
+    Waits for Alice to open the session, then 'params' holds the public
+    parameters Alice sent.
+
+    Args:
+        endpoint: Optional; the endpoint to listen on.
+        ot_extension: Optional; use OT extension (True by default).
+        batched_ot: Optional; run all OTs of a comparison at once (True by
+            default).
+        ot_group: Optional; the group of the base OTs of OT extension.
+    """
+
+    def __init__(
+        self,
+        endpoint=BOB_ENDPOINT,
+        ot_extension=True,
+        batched_ot=True,
+        ot_group="x25519",
+    ):
+        self.socket = util.EvaluatorSocket(endpoint)
+        self.ot = ot.ObliviousTransfer(self.socket, extension=ot_extension,
+                                       batched=batched_ot, group=ot_group)
+
+        session = self.socket.receive()
+        self.circuit, self.scheme = session["circuit"], session["scheme"]
+        self.params = session["params"]
+        self.socket.send(True)
+
+    def compare(self, bits: str) -> bool:
+        """Evaluate the circuit with Alice on Bob's input bits.
+
+        Args:
+            bits: Bob's input bits, e.g. "0110".
+
+        Returns:
+            The (first) output bit of the circuit.
+        """
+        circuit = self.circuit
+        upload = self.socket.receive()
+        if not self.ot.batched:  # batched OT replies to the upload
+            self.socket.send(True)
+
+        b_inputs = {  # map from Bob's wires to (clear) input bits
+            w: int(b) for w, b in zip(circuit.original(circuit.bob), bits)
+        }
+        result = self.ot.send_result(circuit, upload["garbled_tables"],
+                                     upload["pbits_out"], b_inputs,
+                                     upload=upload, **self.scheme)
+        return result[circuit.original(circuit.out)[0]] == 1
+
+    def evaluate_many(self, inputs: list[str]) -> list[list[int]]:
+        """Evaluate one circuit per input of Bob with a single OT batch.
+
+        See AliceSession.evaluate_many.
+
+        Args:
+            inputs: Bob's input bits of each circuit.
+
+        Returns:
+            The output bits of each circuit, in the order of its outputs.
+        """
+        circuit = self.circuit
+        b_wires = circuit.original(circuit.bob)
+        outputs = circuit.original(circuit.out)
+        upload = self.socket.receive()
+
+        b_inputs = {  # map from (circuit, Bob's wire) to (clear) input bit
+            (k, w): int(b)
+            for k, bits in enumerate(inputs)
+            for w, b in zip(b_wires, bits)
+        }
+        labels = self.ot.receive_inputs(upload, b_inputs)
+
+        tables = upload["garbled_tables"]
+        size = len(tables) // len(inputs)  # size of the tables of a circuit
+        results = []
+        for k in range(len(inputs)):
+            result = yao.evaluate(
+                circuit, tables[k * size : (k + 1) * size],
+                upload["pbits_out"][k], upload["a_inputs"][k],
+                {w: labels[(k, w)] for w in b_wires}, **self.scheme)
+            results.append([result[w] for w in outputs])
+
+        self.socket.send(results)
+        return results
+
+    def close(self):
+        self.socket.socket.close()
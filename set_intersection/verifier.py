@@ -1,4 +1,4 @@
-from util import INPUT_ALICE, INPUT_BOB, read_to_set
+from set_util import INPUT_ALICE, INPUT_BOB, read_to_set
 
 
 def ground_truth():